@@ -0,0 +1,304 @@
+"""Runtime claims of the reference, checked in bulk.
+
+Doctests prove that snippets compile and deploy. The assertions below check
+what rows claim snippets do at runtime. All assertions of a language are
+compiled into functions of one harness contract, which is deployed once
+and then called with `eth_call`, in JSON-RPC batches where the provider
+supports them. Failures are reported per assertion with their row.
+
+>>> check_assertions(web3, "vyper")
+>>> check_assertions(web3, "solidity")
+>>> unknown_rows()
+[]
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+from eth_abi import decode_single
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3, HTTPProvider
+
+from .conftest import (
+    compile_single_contract,
+    compile_specific_vyper_contract,
+    phase,
+)
+
+# Calls sent in one JSON-RPC request
+BATCH_SIZE = 200
+
+
+class Reverts:
+    """Expected result of a call that has to revert."""
+
+    def __repr__(self):
+        return "revert"
+
+
+REVERTS = Reverts()
+
+
+class Assertion(NamedTuple):
+    """A call to the body as a function that has to return `expected`."""
+
+    row: str  # Name of the code cell function of the row making the claim
+    language: str
+    body: str  # Function body, ending in a return statement
+    expected: Any
+    returns: str = "uint256"
+    globals: str = ""  # State declarations the body uses
+
+
+ASSERTIONS = [
+    Assertion(
+        "swap_s",
+        "solidity",
+        "uint a = 1;\nuint b = 2;\n(a, b) = (b, a);\nreturn a * 10 + b;",
+        21,
+    ),
+    Assertion("min_max_v", "vyper", "return min(1, 2)", 1),
+    Assertion("min_max_v", "vyper", "return max(1, 2)", 2),
+    Assertion("integer_division_s", "solidity", "uint x = 7;\nreturn x / 2;", 3),
+    Assertion(
+        "integer_division_s",
+        "solidity",
+        "int x = -7;\nreturn x / 2;",
+        -3,
+        returns="int256",
+    ),
+    Assertion("integer_division_v", "vyper", "x: uint256 = 7\nreturn x / 2", 3),
+    Assertion(
+        "integer_division_v",
+        "vyper",
+        "x: int128 = -7\nreturn x / 2",
+        -3,
+        returns="int128",
+    ),
+    Assertion(
+        "out_of_bounds_s",
+        "solidity",
+        "uint[] memory a = new uint[](3);\nuint i = 3;\nreturn a[i];",
+        REVERTS,
+    ),
+    Assertion(
+        "out_of_bounds_v",
+        "vyper",
+        "a: uint256[3] = [1, 2, 3]\ni: uint256 = 3\nreturn a[i]",
+        REVERTS,
+    ),
+    Assertion(
+        "missing_key_s",
+        "solidity",
+        "return m[42];",
+        0,
+        globals="mapping(uint => uint) m;",
+    ),
+    Assertion(
+        "missing_key_v",
+        "vyper",
+        "return self.m[42]",
+        0,
+        globals="m: HashMap[uint256, uint256]",
+    ),
+]
+
+
+def _declarations(assertions: List[Assertion]) -> List[str]:
+    """State declarations of the assertions, each once."""
+    return list(dict.fromkeys(a.globals for a in assertions if a.globals))
+
+
+def harness_v(assertions: List[Assertion]) -> str:
+    """Vyper contract with a check_<n> function per assertion."""
+    parts = _declarations(assertions)
+    for number, assertion in enumerate(assertions):
+        body = "\n    ".join(assertion.body.split("\n"))
+        parts.append(
+            f"@external\ndef check_{number}() -> {assertion.returns}:\n    {body}"
+        )
+    return "\n\n".join(parts) + "\n"
+
+
+def harness_s(assertions: List[Assertion]) -> str:
+    """Solidity contract with a check_<n> function per assertion."""
+    parts = _declarations(assertions)
+    for number, assertion in enumerate(assertions):
+        body = "\n        ".join(assertion.body.split("\n"))
+        parts.append(
+            f"function check_{number}() public returns ({assertion.returns}) {{\n"
+            f"        {body}\n    }}"
+        )
+    members = "\n\n    ".join(parts)
+    return f"contract Harness {{\n    {members}\n}}\n"
+
+
+# Harness source and the compile function of each language
+HARNESSES: Dict[str, Tuple[Callable[[List[Assertion]], str], Callable[..., Any]]] = {
+    "vyper": (harness_v, compile_specific_vyper_contract),
+    "solidity": (harness_s, compile_single_contract),
+}
+
+
+def deploy_harness(web3: Web3, language: str, assertions: List[Assertion]) -> str:
+    """Compile and deploy the harness of the assertions, return its address.
+
+    If the harness doesn't compile, the assertions that don't compile on
+    their own are named in the error."""
+    harness, compile_contract = HARNESSES[language]
+    source = harness(assertions)
+    try:
+        with phase("compile", language=language, source=source):
+            compiled = compile_contract(source)
+    except Exception as error:  # pylint: disable=broad-except
+        broken = []
+        for assertion in assertions:
+            try:
+                compile_contract(harness([assertion]))
+            except Exception:  # pylint: disable=broad-except
+                broken.append(f"{assertion.row}: {assertion.body!r}")
+        raise AssertionError(
+            "Assertions don't compile:\n" + "\n".join(broken or [str(error)])
+        ) from error
+    with phase("deploy", web3=web3, compiled=compiled):
+        contract = web3.eth.contract(abi=compiled["abi"], bytecode=compiled["bin"])
+        tx_hash = contract.constructor().transact()
+        receipt = web3.eth.waitForTransactionReceipt(tx_hash)
+        # Creation receipts always carry the address
+        return str(receipt["contractAddress"])
+
+
+def _call_data(number: int) -> str:
+    return "0x" + function_signature_to_4byte_selector(f"check_{number}()").hex()
+
+
+def call_batch(web3: Web3, address: str, numbers: List[int]) -> List[Optional[bytes]]:
+    """Call check functions, None for the calls that reverted.
+
+    >>> vyper = [a for a in ASSERTIONS if a.row in ("min_max_v", "out_of_bounds_v")]
+    >>> address = deploy_harness(web3, "vyper", vyper)
+    >>> server = _json_rpc_server(web3)
+    >>> http = Web3(HTTPProvider(f"http://localhost:{server.server_port}"))
+    >>> outputs = call_batch(http, address, [0, 1, 2])
+    >>> [output and decode_single("uint256", output) for output in outputs]
+    [1, 2, None]
+    >>> server.requests
+    1
+    >>> server.shutdown()
+    """
+    calls = [{"to": address, "data": _call_data(number)} for number in numbers]
+    if isinstance(web3.provider, HTTPProvider):
+        # One HTTP round trip for the whole batch
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "id": index,
+                "method": "eth_call",
+                "params": [call, "latest"],
+            }
+            for index, call in enumerate(calls)
+        ]
+        response = requests.post(
+            web3.provider.endpoint_uri,
+            data=json.dumps(payload),
+            headers={"Content-Type": "application/json"},
+        ).json()
+        # Reverted calls come back as errors, responses in any order
+        results_by_id = {
+            item["id"]: bytes.fromhex(item["result"][2:]) or None
+            for item in response
+            if "result" in item
+        }
+        return [results_by_id.get(index) for index in range(len(calls))]
+    results = []
+    for call in calls:
+        try:
+            # eth-tester returns no data for reverted calls
+            results.append(bytes(web3.eth.call(call)) or None)
+        except Exception:  # pylint: disable=broad-except
+            results.append(None)
+    return results
+
+
+def _json_rpc_server(web3: Web3) -> ThreadingHTTPServer:
+    """A local JSON-RPC endpoint in front of a web3, to test batches.
+
+    Batch responses come back reversed, as servers may reorder them."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):  # pylint: disable=invalid-name
+            batch = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            server.requests += 1
+            responses = []
+            for request in reversed(batch):
+                response = {"jsonrpc": "2.0", "id": request["id"]}
+                try:
+                    result = web3.manager.request_blocking(
+                        request["method"], request["params"]
+                    )
+                    response["result"] = Web3.toHex(result)
+                except Exception as error:  # pylint: disable=broad-except
+                    response["error"] = {"code": -32000, "message": str(error)}
+                responses.append(response)
+            body = json.dumps(responses).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = ThreadingHTTPServer(("localhost", 0), Handler)
+    server.requests = 0  # type: ignore
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_assertions(
+    web3: Web3, language: str, assertions: Optional[List[Assertion]] = None
+) -> List[Tuple[Assertion, Any]]:
+    """Check assertions of a language, return (assertion, actual) failures."""
+    if assertions is None:
+        assertions = ASSERTIONS
+    assertions = [a for a in assertions if a.language == language]
+    if not assertions:
+        return []
+    address = deploy_harness(web3, language, assertions)
+    failures = []
+    for start in range(0, len(assertions), BATCH_SIZE):
+        batch = assertions[start : start + BATCH_SIZE]
+        numbers = list(range(start, start + len(batch)))
+        for assertion, output in zip(batch, call_batch(web3, address, numbers)):
+            actual = (
+                REVERTS if output is None else decode_single(assertion.returns, output)
+            )
+            if actual is not assertion.expected and actual != assertion.expected:
+                failures.append((assertion, actual))
+    return failures
+
+
+def check_assertions(web3: Web3, language: str):
+    """Fail with every assertion of a language that doesn't hold."""
+    failures = run_assertions(web3, language)
+    if failures:
+        raise AssertionError(
+            "\n".join(
+                f"{assertion.row}: {assertion.body!r} "
+                f"expected {assertion.expected!r}, got {actual!r}"
+                for assertion, actual in failures
+            )
+        )
+
+
+def unknown_rows() -> List[str]:
+    """Rows named by assertions that have no code cell function."""
+    from . import main  # pylint: disable=import-outside-toplevel
+
+    return sorted(
+        {a.row for a in ASSERTIONS if not callable(getattr(main, a.row, None))}
+    )
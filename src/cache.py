@@ -0,0 +1,293 @@
+"""On-disk cache of compiled artifacts shared between processes."""
+
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def write_atomic(path: str, data: bytes):
+    """Replace a file so that readers never see a partial write."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temporary:
+        temporary.write(data)
+        temporary.flush()
+        os.fsync(temporary.fileno())
+    # Temporary files are only readable by their owner
+    os.chmod(temporary.name, mode)
+    os.replace(temporary.name, path)
+
+
+class ArtifactCache:
+    """Compiler output stored as JSON files named by a hash of the inputs.
+
+    Writes are atomic, so any number of processes can share a directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """Hash the inputs that determine an artifact."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Cached artifacts, or None."""
+        try:
+            with open(self._path(key)) as artifact_file:
+                return json.load(artifact_file)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, artifacts: dict):
+        """Store artifacts."""
+        write_atomic(self._path(key), json.dumps(artifacts).encode())
+
+    def get_or_compile(self, key: str, compile_artifacts: Callable[[], dict]) -> dict:
+        """Cached artifacts, compiled and stored first if they are missing."""
+        artifacts = self.get(key)
+        if artifacts is None:
+            artifacts = compile_artifacts()
+            self.put(key, artifacts)
+        return artifacts
+
+    def close(self):
+        """Release what the cache holds open, nothing for JSON files."""
+
+
+# Fields holding hex bytecode, stored as raw bytes outside of the JSON
+BYTECODE_FIELDS = {"bin", "bin-runtime"}
+
+# Index entries: SHA-256 of the key, offset and length of its record
+INDEX_ENTRY = struct.Struct("<32sQQ")
+
+# Lock slots of keys in the lock file, slot 0 guards appends
+LOCK_SLOTS = 2**20
+
+
+class ArtifactStore(ArtifactCache):
+    """Append-only artifact store memory mapped by every process using it.
+
+    Records are appended to `artifacts.data`, and `artifacts.index` maps
+    key hashes to them. An index entry is only written after its record,
+    so readers never see a partial record. While a process compiles
+    artifacts for a key, others asking for it wait, so every key is
+    compiled once whatever the number of processes.
+
+    Bytecode is kept as raw bytes, half the size of its hex. `bytecode()`
+    reads it as a view of the shared mapping, but `get()`, and so the
+    compile helpers and the deploys of the doctests, decode artifacts into
+    new dicts of hex strings.
+
+    >>> import tempfile
+    >>> store = ArtifactStore(tempfile.mkdtemp())
+    >>> store.put("k", {"bin": "6080", "abi": []})
+    >>> store.get("k")
+    {'bin': '6080', 'abi': []}
+    >>> bytes(store.bytecode("k", "bin"))
+    b'`\\x80'
+    >>> ArtifactStore(store.directory).get_or_compile("k", dict)["bin"]
+    '6080'
+    >>> store.close()
+
+    Processes asking for the same keys at once compile each of them once:
+
+    >>> import multiprocessing, time
+    >>> def compile_once(key):
+    ...     with open(os.path.join(store.directory, "compiles"), "a") as log:
+    ...         log.write(key)
+    ...     time.sleep(0.05)
+    ...     return {"bin": "60" + key, "abi": []}
+    >>> def worker():
+    ...     shared = ArtifactStore(store.directory)
+    ...     for key in "abcde":
+    ...         shared.get_or_compile(key, lambda: compile_once(key))
+    ...     shared.close()
+    >>> processes = [multiprocessing.Process(target=worker) for _ in range(8)]
+    >>> for process in processes:
+    ...     process.start()
+    >>> for process in processes:
+    ...     process.join()
+    >>> sorted(open(os.path.join(store.directory, "compiles")).read())
+    ['a', 'b', 'c', 'd', 'e']
+
+    A closed store still reads, but doesn't compile or store anything:
+
+    >>> store.get("k")["bin"]
+    '6080'
+    >>> store.put("f", {"bin": "60", "abi": []})
+    Traceback (most recent call last):
+    ValueError: Artifact store ... is closed
+    """
+
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        self._data_path = os.path.join(directory, "artifacts.data")
+        self._index_path = os.path.join(directory, "artifacts.index")
+        # Record locks are dropped when any descriptor of the file is closed
+        self._lock_fd: Optional[int] = os.open(
+            os.path.join(directory, "artifacts.lock"), os.O_RDWR | os.O_CREAT, 0o644
+        )
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self._index_read = 0
+        self._map: Optional[mmap.mmap] = None
+
+    @staticmethod
+    def _hash(key: str) -> bytes:
+        return hashlib.sha256(key.encode()).digest()
+
+    @contextmanager
+    def _locked(self, slot: int):
+        lock_fd = self._lock_fd
+        if lock_fd is None:
+            raise ValueError(f"Artifact store {self.directory} is closed")
+        fcntl.lockf(lock_fd, fcntl.LOCK_EX, 1, slot)
+        try:
+            yield
+        finally:
+            fcntl.lockf(lock_fd, fcntl.LOCK_UN, 1, slot)
+
+    def _refresh(self):
+        """Read index entries appended since the last refresh."""
+        try:
+            with open(self._index_path, "rb") as index_file:
+                index_file.seek(self._index_read)
+                entries = index_file.read()
+        except FileNotFoundError:
+            return
+        # A partially appended entry is read again on the next refresh
+        complete = len(entries) - len(entries) % INDEX_ENTRY.size
+        for digest, offset, length in INDEX_ENTRY.iter_unpack(entries[:complete]):
+            self._index[digest] = (offset, length)
+        self._index_read += complete
+
+    def _record(self, key: str) -> Optional[memoryview]:
+        """The record of a key in the mapping, None if it isn't stored."""
+        digest = self._hash(key)
+        if digest not in self._index:
+            self._refresh()
+            if digest not in self._index:
+                return None
+        offset, length = self._index[digest]
+        if self._map is None or len(self._map) < offset + length:
+            # Views of the previous mapping keep it alive, it is not closed
+            with open(self._data_path, "rb") as data_file:
+                self._map = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._map)[offset : offset + length]
+
+    @staticmethod
+    def _split(record: memoryview) -> Tuple[Any, memoryview]:
+        """The JSON header of a record and the bytecode following it."""
+        (header_length,) = struct.unpack_from("<I", record)
+        header = json.loads(bytes(record[4 : 4 + header_length]))
+        return header, record[4 + header_length :]
+
+    def get(self, key: str) -> Optional[dict]:
+        """Stored artifacts, or None."""
+        record = self._record(key)
+        if record is None:
+            return None
+        header, blobs = self._split(record)
+        return self._decode(header, blobs)
+
+    @classmethod
+    def _decode(cls, value: Any, blobs: memoryview) -> Any:
+        """Artifacts with the bytecode of their blobs as hex strings."""
+        if isinstance(value, dict):
+            if "$blob" in value:
+                start, length = value["$blob"]
+                return blobs[start : start + length].hex()
+            return {name: cls._decode(item, blobs) for name, item in value.items()}
+        if isinstance(value, list):
+            return [cls._decode(item, blobs) for item in value]
+        return value
+
+    def bytecode(self, key: str, *path: str) -> Optional[memoryview]:
+        """Bytecode at a path of fields of stored artifacts, as a view of the
+        mapping that has to be released before the store is closed."""
+        record = self._record(key)
+        if record is None:
+            return None
+        value, blobs = self._split(record)
+        for name in path:
+            value = value[name]
+        start, length = value["$blob"]
+        return blobs[start : start + length]
+
+    def put(self, key: str, artifacts: dict):
+        """Append artifacts, unless the key is already stored."""
+        blobs = []
+        position = 0
+
+        def encode(value: Any, name: str = "") -> Any:
+            nonlocal position
+            if isinstance(value, dict):
+                return {field: encode(item, field) for field, item in value.items()}
+            if isinstance(value, list):
+                return [encode(item) for item in value]
+            if name in BYTECODE_FIELDS and isinstance(value, str):
+                try:
+                    blob = bytes.fromhex(value)
+                except ValueError:
+                    return value  # Unlinked bytecode with library placeholders
+                blobs.append(blob)
+                position += len(blob)
+                # Positions are relative to the end of the header
+                return {"$blob": [position - len(blob), len(blob)]}
+            return value
+
+        header = json.dumps(encode(artifacts)).encode()
+        record = struct.pack("<I", len(header)) + header + b"".join(blobs)
+        with self._locked(0):
+            self._refresh()
+            digest = self._hash(key)
+            if digest in self._index:
+                return
+            with open(self._data_path, "ab") as data_file:
+                offset = data_file.tell()
+                data_file.write(record)
+            with open(self._index_path, "ab") as index_file:
+                # Drop what an interrupted append left after the last entry
+                index_file.truncate(self._index_read)
+                index_file.write(INDEX_ENTRY.pack(digest, offset, len(record)))
+            self._index[digest] = (offset, len(record))
+            self._index_read += INDEX_ENTRY.size
+
+    def get_or_compile(self, key: str, compile_artifacts: Callable[[], dict]) -> dict:
+        """Stored artifacts, compiled by only one of the processes asking."""
+        artifacts = self.get(key)
+        if artifacts is not None:
+            return artifacts
+        slot = 1 + int.from_bytes(self._hash(key)[:4], "big") % (LOCK_SLOTS - 1)
+        with self._locked(slot):
+            artifacts = self.get(key)
+            if artifacts is None:
+                artifacts = compile_artifacts()
+                self.put(key, artifacts)
+        return artifacts
+
+    def close(self):
+        """Close the lock file and the mapping."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
@@ -0,0 +1,141 @@
+"""Record compiler requests and their responses, and replay them.
+
+    pytest --doctest-modules src --cassette=compilers.json --cassette-mode=record
+    pytest --doctest-modules src --cassette=compilers.json --cassette-mode=replay
+
+In record mode every compile and version probe of the conftest helpers
+goes to the compilers and is written to the cassette with its output or
+error. In replay mode responses come from the cassette only, so neither
+solc nor the vyper package has to be installed, and a request that wasn't
+recorded is an error. The chain fixtures and storage layouts are compiled
+through the cassette as well.
+"""
+
+import hashlib
+import json
+from typing import Any, Callable, Dict, Optional
+
+from .cache import write_atomic
+
+# Version of the cassette format
+FORMAT = 1
+
+MODES = ["record", "replay"]
+
+
+class MissingRecording(Exception):
+    """A compiler request that isn't in the cassette being replayed."""
+
+
+class RecordedError(Exception):
+    """A compiler error as recorded in the cassette."""
+
+
+def request_key(request: Any) -> str:
+    """Key of a request made of JSON values.
+
+    >>> request_key(["vyper", "0.2.4", {"main": "x: uint256"}])[:12]
+    'f1eb3b74a871'
+    """
+    encoded = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class Cassette:
+    """Compiler interactions of a session, in a JSON file."""
+
+    def __init__(self, path: str, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode has to be one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.interactions: Dict[str, dict] = {}
+        self.replayed = 0
+        if mode == "replay":
+            with open(path) as cassette_file:
+                recorded = json.load(cassette_file)
+            if recorded.get("format") != FORMAT:
+                raise ValueError(
+                    f"{path} has cassette format {recorded.get('format')}, "
+                    f"expected {FORMAT}, record it again"
+                )
+            self.interactions = recorded["interactions"]
+
+    def call(self, request: Any, compile_request: Callable[[], Any]) -> Any:
+        """Response to a request, from the compiler or the cassette.
+
+        A replayed cassette never runs the compiler, not even for requests
+        it has no recording of:
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "compilers.json")
+        >>> recording = Cassette(path, "record")
+        >>> recording.call(["version", "solc"], lambda: "0.5.14")
+        '0.5.14'
+        >>> recording.save()
+        >>> def compile_request():
+        ...     raise AssertionError("the compiler ran")
+        >>> replay = Cassette(path, "replay")
+        >>> replay.call(["version", "solc"], compile_request)
+        '0.5.14'
+        >>> replay.call(["version", "vyper"], compile_request)
+        Traceback (most recent call last):
+        src.cassette.MissingRecording: Not in ..., record it again: ["version", "vyper"]
+        """
+        key = request_key(request)
+        if self.mode == "replay":
+            interaction = self.interactions.get(key)
+            if interaction is None:
+                raise MissingRecording(
+                    f"Not in {self.path}, record it again: {json.dumps(request)[:200]}"
+                )
+            self.replayed += 1
+            if interaction["error"] is not None:
+                raise RecordedError(interaction["error"])
+            return interaction["response"]
+        try:
+            response = compile_request()
+        except OSError:
+            # A missing compiler is not an answer worth replaying
+            raise
+        except Exception as error:
+            self.interactions[key] = {
+                "request": request,
+                "response": None,
+                "error": f"{type(error).__name__}: {error}",
+            }
+            raise
+        self.interactions[key] = {
+            "request": request,
+            "response": response,
+            "error": None,
+        }
+        return response
+
+    def save(self):
+        """Write the recorded interactions, in record mode."""
+        if self.mode == "record":
+            cassette = {"format": FORMAT, "interactions": self.interactions}
+            write_atomic(
+                self.path, json.dumps(cassette, indent=1, sort_keys=True).encode()
+            )
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        self.save()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        terminalreporter.section("cassette")
+        if self.mode == "record":
+            count = f"{len(self.interactions)} compiler requests recorded to"
+        else:
+            count = f"{self.replayed} compiler requests replayed from"
+        terminalreporter.write_line(f"{count} {self.path}")
+
+
+def recorded(
+    cassette: Optional[Cassette], request: Any, compile_request: Callable[[], Any]
+) -> Any:
+    """Make a compiler request through the cassette if there is one."""
+    if cassette is None:
+        return compile_request()
+    return cassette.call(request, compile_request)
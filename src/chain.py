@@ -0,0 +1,271 @@
+"""Prebuilt chain image with funded accounts and fixture contracts.
+
+Snippets calling other contracts need counterparties on chain. Instead of
+deploying them for every test chain, they are deployed once into an image
+of the chain database, stored under `.cache/chain/`. Loading the image
+takes milliseconds. The image is named by a hash of its definition, the
+fixture sources, the account count and the versions of the tools that
+built it, the vyper package compiling the fixtures included, so it is
+rebuilt automatically when any of them changes. Loading a current image
+compiles nothing. Fixtures compile through the session's cassette, so a
+replayed session builds the image without a compiler.
+
+Fixture contracts are available to doctests as `fixtures[name]`:
+
+>>> feed = fixtures["data_feed"]
+>>> feed.functions.getData(fixtures["target"].address).call()
+0
+
+Chains come in two backend profiles. "default" is eth-tester's default
+backend. "lean", used by the doctests, pins the fork, raises the block
+gas limit and neither signs transactions nor recovers their senders.
+Deploys have the same results in both:
+
+>>> lean, default = load_image("lean"), load_image("default")
+>>> lean["addresses"] == default["addresses"], lean["gas"] == default["gas"]
+(True, True)
+"""
+
+import glob
+import os
+import pickle
+from typing import Dict, cast
+
+import eth
+import eth_tester
+from eth.consensus import NoProofConsensus
+from eth.db.atomic import AtomicDB
+from eth.db.backends.memory import MemoryDB
+from eth.rlp.headers import BlockHeader
+from eth.vm.forks.muir_glacier import MuirGlacierVM
+from eth.vm.forks.muir_glacier.blocks import MuirGlacierBlock
+from eth.vm.forks.muir_glacier.transactions import MuirGlacierTransaction
+from eth_tester import EthereumTester, PyEVMBackend
+from eth_tester.exceptions import ValidationError
+from eth_tester.validation.default import DefaultValidator
+from eth_typing import Address
+from hexbytes import HexBytes
+from rlp.sedes import CountableList
+from web3 import Web3, EthereumTesterProvider
+from web3.contract import Contract
+from web3.types import TxReceipt
+
+from .cache import ArtifactCache, write_atomic
+
+IMAGE_DIR = ".cache/chain"
+
+# Funded accounts, same as a default eth-tester chain
+ACCOUNTS = 10
+
+PROFILES = ["lean", "default"]
+
+# Block gas limit of the lean profile, eth-tester's default is 3141592
+LEAN_GAS_LIMIT = 100_000_000
+
+# Fixture contracts in deployment order, as Vyper so that they build with
+# the installed vyper package whether or not solc is available
+FIXTURES = {
+    # Answers DataFeed.getData(token) calls of the consumer in exceptions_s
+    "data_feed": """
+values: public(HashMap[address, uint256])
+
+@external
+def setData(token: address, data: uint256):
+    self.values[token] = data
+
+@view
+@external
+def getData(token: address) -> uint256:
+    return self.values[token]
+""",
+    # Accepts any call or transfer, the counterparty of create2_s,
+    # create_forwarder_v and the selfdestruct refunds of selfdestruct_s/_v
+    "target": """
+last_sender: public(address)
+last_value: public(uint256)
+calls: public(uint256)
+
+@payable
+@external
+def __default__():
+    self.last_sender = msg.sender
+    self.last_value = msg.value
+    self.calls += 1
+
+@payable
+@external
+def ping() -> uint256:
+    self.last_sender = msg.sender
+    self.last_value = msg.value
+    self.calls += 1
+    return self.calls
+""",
+}
+
+
+class UncheckedTransaction(MuirGlacierTransaction):
+    """Transaction carrying its sender in r instead of a signature."""
+
+    def check_signature_validity(self):
+        pass
+
+    def get_sender(self) -> Address:
+        return Address(self.r.to_bytes(20, "big"))
+
+
+class UncheckedBlock(MuirGlacierBlock):
+    transaction_class = UncheckedTransaction
+    fields = [
+        ("header", BlockHeader),
+        ("transactions", CountableList(UncheckedTransaction)),
+        ("uncles", CountableList(BlockHeader)),
+    ]
+
+
+# The lean profile's only fork, pinned rather than eth-tester's default
+LeanVM = MuirGlacierVM.configure(
+    __name__="LeanVM", block_class=UncheckedBlock, consensus_class=NoProofConsensus
+)
+
+
+class LeanBackend(PyEVMBackend):
+    """Backend sending transactions of unlocked accounts unsigned."""
+
+    def _get_normalized_and_signed_evm_transaction(
+        self, transaction, block_number="latest"
+    ):
+        if transaction["from"] not in self.get_accounts():
+            raise ValidationError(f"{transaction['from']} is not an unlocked account")
+        normalized = self._normalize_transaction(transaction, block_number)
+        sender = int.from_bytes(transaction["from"], "big")
+        return UncheckedTransaction(v=27, r=sender, s=1, **normalized)
+
+
+class InboundValidator(DefaultValidator):
+    """Validates requests, but trusts what the backend returns."""
+
+
+# Every validate_outbound_* method of the default validator becomes a no-op
+for _name in dir(DefaultValidator):
+    if _name.startswith("validate_outbound_"):
+        setattr(InboundValidator, _name, lambda self, value: None)
+
+
+def new_tester(profile: str) -> EthereumTester:
+    """An eth-tester chain with the backend of a profile."""
+    genesis_state = PyEVMBackend._generate_genesis_state(num_accounts=ACCOUNTS)
+    if profile == "default":
+        return EthereumTester(PyEVMBackend(genesis_state=genesis_state))
+    backend = LeanBackend(
+        genesis_parameters=PyEVMBackend._generate_genesis_params(
+            {"gas_limit": LEAN_GAS_LIMIT}
+        ),
+        genesis_state=genesis_state,
+        vm_configuration=((0, LeanVM),),
+    )
+    return EthereumTester(backend, validator=InboundValidator())
+
+
+def image_key(profile: str) -> str:
+    """Hash everything that determines the contents of the image."""
+    # Through the session's cassette, if there is one
+    # pylint: disable=import-outside-toplevel
+    from .conftest import package_vyper_version
+
+    return ArtifactCache.key(
+        profile,
+        repr(sorted(FIXTURES.items())),
+        str(ACCOUNTS),
+        str(package_vyper_version()),
+        eth.__version__,
+        eth_tester.__version__,
+    )
+
+
+# Compiled fixtures by source, once per process
+_COMPILED: Dict[str, dict] = {}
+
+
+def _compile(source: str) -> dict:
+    if source not in _COMPILED:
+        # Through the session's cassette, if there is one
+        # pylint: disable=import-outside-toplevel
+        from .conftest import compile_fixture
+
+        _COMPILED[source] = compile_fixture(source)
+    return _COMPILED[source]
+
+
+def build_image(profile: str) -> dict:
+    """Deploy the fixture contracts on a new chain and capture its state."""
+    tester = new_tester(profile)
+    web3 = Web3(EthereumTesterProvider(tester))
+    web3.eth.defaultAccount = web3.eth.accounts[0]  # type: ignore
+    addresses = {}
+    abis = {}
+    gas = {}
+    for name, source in FIXTURES.items():
+        compiled = _compile(source)
+        contract = web3.eth.contract(abi=compiled["abi"], bytecode=compiled["bytecode"])
+        receipt = web3.eth.waitForTransactionReceipt(contract.constructor().transact())
+        addresses[name] = receipt["contractAddress"]
+        abis[name] = compiled["abi"]
+        gas[name] = receipt["gasUsed"]
+    return {
+        "key": image_key(profile),
+        "profile": profile,
+        "state": dict(tester.backend.chain.chaindb.db.wrapped_db.kv_store),
+        "addresses": addresses,
+        "abis": abis,
+        "gas": gas,
+    }
+
+
+def load_image(profile: str = "lean", directory: str = IMAGE_DIR) -> dict:
+    """Read the current image, building it first if it is missing or stale."""
+    key = image_key(profile)
+    path = os.path.join(directory, f"{profile}-{key}.pickle")
+    try:
+        with open(path, "rb") as image_file:
+            return pickle.load(image_file)
+    except FileNotFoundError:
+        pass
+    image = build_image(profile)
+    os.makedirs(directory, exist_ok=True)
+    write_atomic(path, pickle.dumps(image, protocol=pickle.HIGHEST_PROTOCOL))
+    # Images of older definitions are never loaded again
+    for stale in glob.glob(os.path.join(directory, f"{profile}-*.pickle")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass  # Removed by another process
+    return image
+
+
+def load_web3(image: dict) -> Web3:
+    """A fresh chain starting from the state of the image.
+
+    The image is not modified, every call returns an independent chain."""
+    tester = new_tester(image["profile"])
+    # Reopen the chain on a copy of the image database, at its head block
+    database = AtomicDB(MemoryDB(dict(image["state"])))
+    tester.backend.chain = type(tester.backend.chain)(database)
+    web3 = Web3(EthereumTesterProvider(tester))
+    web3.eth.defaultAccount = web3.eth.accounts[0]  # type: ignore
+    return web3
+
+
+def deploy_receipt(web3: Web3) -> TxReceipt:
+    """Receipt of the latest transaction, the deploy of a "deploy" phase
+    that just ended. Test chains mine a block per transaction."""
+    block = web3.eth.getBlock("latest")
+    return web3.eth.getTransactionReceipt(cast(HexBytes, block["transactions"][-1]))
+
+
+def fixture_contracts(web3: Web3, image: dict) -> Dict[str, Contract]:
+    """The fixture contracts of the image, by name."""
+    return {
+        name: web3.eth.contract(address=address, abi=image["abis"][name])
+        for name, address in image["addresses"].items()
+    }
@@ -0,0 +1,226 @@
+"""Local registry of compiler executables by version.
+
+    python -m src.compilers add /usr/bin/solc-0.5.14 --sha256 DIGEST
+    python -m src.compilers fetch solc 0.5.14 --sha256 DIGEST
+    python -m src.compilers list
+
+Executables are copied to `.cache/compilers/<kind>/<version>/<kind>` and
+their SHA-256 is recorded in the registry's `manifest.json`. A registered
+executable is checked against its hash before its first use in a process,
+and versions of executables are probed once per process, so the conftest
+helpers can be given a compiler version instead of depending on which
+`solc` comes first on the PATH.
+
+Only standalone executables can be registered: static solc builds and
+PyInstaller builds of vyper. A script such as the `vyper` pip installs runs
+whatever vyper package its interpreter finds, so its copy would not pin a
+version.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from .cache import write_atomic
+
+REGISTRY_DIR = os.environ.get("REFERENCE_COMPILERS", ".cache/compilers")
+
+KINDS = ["solc", "vyper"]
+
+SOLC_RELEASE = (
+    "https://github.com/ethereum/solidity/releases/download/"
+    "v{version}/solc-static-linux"
+)
+
+EXECUTABLE = re.compile(r"^(solc|vyper)(?:-v?(\d+\.\d+\.\d+))?$")
+VERSION = re.compile(r"\d+\.\d+\.\d+")
+
+
+def version_key(version: str) -> List[int]:
+    """Sort key comparing versions numerically.
+
+    >>> sorted(["0.10.0", "0.5.14", "0.7.0"], key=version_key)
+    ['0.5.14', '0.7.0', '0.10.0']
+    """
+    return [int(part) for part in version.split(".")]
+
+
+# Probed versions by path, modification time and size of the executable
+_PROBES: Dict[Tuple[str, int, int], Optional[str]] = {}
+
+
+def probe_version(executable: str) -> Optional[str]:
+    """Ask a compiler executable for its version, once per process."""
+    path = shutil.which(executable)
+    if path is None:
+        return None
+    status = os.stat(path)
+    key = (os.path.realpath(path), status.st_mtime_ns, status.st_size)
+    if key not in _PROBES:
+        try:
+            output = subprocess.run(
+                [path, "--version"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                timeout=30,
+            ).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            output = ""
+        match = VERSION.search(output)
+        _PROBES[key] = match.group() if match else None
+    return _PROBES[key]
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as content:
+        for chunk in iter(lambda: content.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Registry:
+    """Compiler executables in a directory, by kind and version."""
+
+    def __init__(self, directory: str = REGISTRY_DIR):
+        self.directory = directory
+        self._manifest_path = os.path.join(directory, "manifest.json")
+        try:
+            with open(self._manifest_path) as manifest_file:
+                self.manifest: Dict[str, Dict[str, str]] = json.load(manifest_file)
+        except FileNotFoundError:
+            self.manifest = {kind: {} for kind in KINDS}
+        # Modification time and size of executables whose hash was checked
+        self._verified: Dict[str, Tuple[int, int]] = {}
+
+    def versions(self, kind: str) -> List[str]:
+        """Registered versions of a compiler, oldest first."""
+        return sorted(self.manifest.get(kind, {}), key=version_key)
+
+    def path(self, kind: str, version: str) -> str:
+        """Verified executable of a compiler version."""
+        digest = self.manifest.get(kind, {}).get(version)
+        if digest is None:
+            raise KeyError(
+                f"{kind} {version} is not in the registry at {self.directory}, "
+                f"add it with python -m src.compilers add"
+            )
+        path = os.path.abspath(os.path.join(self.directory, kind, version, kind))
+        status = os.stat(path)
+        stamp = (status.st_mtime_ns, status.st_size)
+        if self._verified.get(path) != stamp:
+            if file_digest(path) != digest:
+                raise ValueError(f"{path} doesn't match its recorded SHA-256")
+            self._verified[path] = stamp
+        return path
+
+    def add(
+        self,
+        source: str,
+        digest: str,
+        kind: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> str:
+        """Copy an executable into the registry, return its version.
+
+        The file has to match the digest, its kind and version are taken
+        from the file name or by running it. Scripts are refused:
+
+        >>> directory = tempfile.mkdtemp()
+        >>> stub = os.path.join(directory, "vyper-0.2.4")
+        >>> with open(stub, "w") as stub_file:
+        ...     _ = stub_file.write("#!/usr/bin/python3\\nimport vyper\\n")
+        >>> Registry(directory).add(stub, file_digest(stub))
+        Traceback (most recent call last):
+        ValueError: .../vyper-0.2.4 is a script, not a standalone executable
+        """
+        match = EXECUTABLE.match(os.path.basename(source))
+        kind = kind or (match and match.group(1))
+        if kind not in KINDS:
+            raise ValueError(f"Can't tell whether {source} is solc or vyper")
+        with open(source, "rb") as executable:
+            if executable.read(2) == b"#!":
+                raise ValueError(f"{source} is a script, not a standalone executable")
+        version = (
+            version
+            or (match and match.group(2))
+            or probe_version(os.path.abspath(source))
+        )
+        if version is None:
+            raise ValueError(f"Can't tell the version of {source}")
+        actual = file_digest(source)
+        if actual != digest.lower():
+            raise ValueError(f"{source} has SHA-256 {actual}, expected {digest}")
+        directory = os.path.join(self.directory, kind, version)
+        os.makedirs(directory, exist_ok=True)
+        with open(source, "rb") as executable:
+            write_atomic(os.path.join(directory, kind), executable.read())
+        os.chmod(
+            os.path.join(directory, kind), stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP
+        )
+        self.manifest.setdefault(kind, {})[version] = actual
+        write_atomic(self._manifest_path, json.dumps(self.manifest, indent=2).encode())
+        return version
+
+    def fetch(self, version: str, digest: str) -> str:
+        """Download a static solc release and add it if it matches the digest."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "solc")
+            urllib.request.urlretrieve(SOLC_RELEASE.format(version=version), path)
+            return self.add(path, digest, "solc", version)
+
+
+_REGISTRY: Optional[Registry] = None
+
+
+def registry() -> Registry:
+    """The registry of this process, loaded on first use."""
+    global _REGISTRY  # pylint: disable=global-statement
+    if _REGISTRY is None:
+        _REGISTRY = Registry()
+    return _REGISTRY
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="copy a compiler executable in")
+    add.add_argument("path")
+    add.add_argument("--kind", choices=KINDS, help="default from the file name")
+    add.add_argument("--version", help="default from running it")
+    add.add_argument("--sha256", required=True, help="digest the file has to match")
+    fetch = commands.add_parser("fetch", help="download a static solc release")
+    fetch.add_argument("kind", choices=["solc"])
+    fetch.add_argument("version")
+    fetch.add_argument("--sha256", required=True, help="digest of the release")
+    commands.add_parser("list", help="show registered compilers")
+    args = parser.parse_args()
+
+    compilers = registry()
+    try:
+        if args.command == "add":
+            version = compilers.add(args.path, args.sha256, args.kind, args.version)
+            print(f"Added {version}")
+        elif args.command == "fetch":
+            print(f"Added solc {compilers.fetch(args.version, args.sha256)}")
+        else:
+            for kind in KINDS:
+                for version in compilers.versions(kind):
+                    print(f"{kind} {version} {compilers.path(kind, version)}")
+    except (KeyError, ValueError) as error:
+        sys.exit(str(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""Adaptive concurrency for compile and deploy work.
+
+Compiles are short and CPU bound, deploys hold a py-evm chain in memory,
+so they get separate limits on how many run at once across all worker
+processes. The limits start from the available cores and free memory and
+are adjusted while running: they are capped by the free memory divided by
+the observed RSS of a process running such a job, and hill climb towards
+the highest measured throughput. The number of worker processes is set
+once at the start, from the cores and free memory.
+
+Compiler subprocesses run under rlimits, so a pathological snippet fails
+its own compile instead of taking the machine's memory.
+"""
+
+import argparse
+import multiprocessing
+import multiprocessing.util
+import os
+import resource
+import shlex
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, NamedTuple, Optional
+
+from .memprof import current_rss
+
+# Fraction of the available memory the limits may plan to use
+MEMORY_BUDGET = 0.8
+
+# RSS assumed for a job until one has been measured
+ESTIMATED_RSS = {"compile": 256 * 2**20, "deploy": 192 * 2**20}
+
+# Seconds between two adjustments of the limits
+ADJUST_INTERVAL = 2.0
+
+# Relative throughput change that counts as a change, not noise
+TOLERANCE = 0.05
+
+
+def cpu_count() -> int:
+    """Cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory() -> int:
+    """Memory available to new processes in bytes."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def pool_size(cpus: int, memory: int, job_rss: float) -> int:
+    """Number of jobs that fit on the cores and in the memory.
+
+    >>> pool_size(16, 8 * 2**30, 512 * 2**20)
+    12
+    >>> pool_size(4, 8 * 2**30, 512 * 2**20)
+    4
+    >>> pool_size(4, 2**20, 512 * 2**20)
+    1
+    """
+    by_memory = int(memory * MEMORY_BUDGET // max(job_rss, 1))
+    return max(1, min(cpus, by_memory))
+
+
+class ResourceLimits(NamedTuple):
+    """Limits for compiler subprocesses, None for no limit."""
+
+    memory: Optional[int] = None  # Bytes of address space
+    cpu_seconds: Optional[int] = None
+
+    def apply(self):
+        """Limit the current process, for use as a preexec_fn."""
+        if self.memory:
+            resource.setrlimit(resource.RLIMIT_AS, (self.memory, self.memory))
+        if self.cpu_seconds:
+            limit = (self.cpu_seconds, self.cpu_seconds)
+            resource.setrlimit(resource.RLIMIT_CPU, limit)
+
+    def wrap(self, executable: str) -> str:
+        """Path of a script running the executable under the limits.
+
+        For callers like py-solc that start the executable themselves."""
+        key = (executable, self.memory, self.cpu_seconds)
+        if key not in _WRAPPERS:
+            commands = []
+            if self.memory:
+                commands.append(f"ulimit -v {self.memory // 1024}")
+            if self.cpu_seconds:
+                commands.append(f"ulimit -t {self.cpu_seconds}")
+            commands.append(f'exec {shlex.quote(executable)} "$@"')
+            descriptor, path = tempfile.mkstemp(
+                prefix="limited-", suffix=".sh", dir=_wrapper_directory()
+            )
+            with os.fdopen(descriptor, "w") as script:
+                script.write("#!/bin/sh\n" + "\n".join(commands) + "\n")
+            os.chmod(path, stat.S_IRWXU)
+            _WRAPPERS[key] = path
+        return _WRAPPERS[key]
+
+
+def add_limit_arguments(parser: argparse.ArgumentParser):
+    """Command line options limiting the compiler processes."""
+    parser.add_argument(
+        "--compiler-memory",
+        type=int,
+        default=2048,
+        metavar="MB",
+        help="address space limit of compiler processes",
+    )
+    parser.add_argument(
+        "--compiler-time",
+        type=int,
+        default=120,
+        metavar="SECONDS",
+        help="CPU time limit of compiler processes",
+    )
+
+
+def limits_from_arguments(args: argparse.Namespace) -> ResourceLimits:
+    """Limits of the options added by add_limit_arguments."""
+    return ResourceLimits(args.compiler_memory * 2**20, args.compiler_time)
+
+
+_WRAPPERS: Dict[tuple, str] = {}
+
+_WRAPPER_DIRECTORY: Optional[str] = None
+
+
+def _wrapper_directory() -> str:
+    """Directory of the wrapper scripts, removed when this process exits.
+
+    Forked workers share the directory of the process that created it."""
+    global _WRAPPER_DIRECTORY  # pylint: disable=global-statement
+    if _WRAPPER_DIRECTORY is None:
+        _WRAPPER_DIRECTORY = tempfile.mkdtemp(prefix="limited-")
+        # Unlike atexit handlers, finalizers also run in worker processes
+        multiprocessing.util.Finalize(
+            None, shutil.rmtree, (_WRAPPER_DIRECTORY, True), exitpriority=0
+        )
+    return _WRAPPER_DIRECTORY
+
+
+class Limiter:
+    """Limit on the jobs of one kind running at once in all processes.
+
+    Has to be created before the worker processes, which inherit it."""
+
+    def __init__(self, limit: int, maximum: int):
+        self.maximum = maximum
+        self._condition = multiprocessing.Condition()
+        self._limit = multiprocessing.RawValue("i", limit)
+        self._active = multiprocessing.RawValue("i", 0)
+        self._completed = multiprocessing.RawValue("i", 0)
+        # Moving average of the RSS of processes finishing a job
+        self._rss = multiprocessing.RawValue("d", 0.0)
+
+    @property
+    def limit(self) -> int:
+        return self._limit.value
+
+    @property
+    def active(self) -> int:
+        return self._active.value
+
+    @property
+    def completed(self) -> int:
+        return self._completed.value
+
+    @property
+    def rss(self) -> float:
+        return self._rss.value
+
+    def set_limit(self, limit: int):
+        """Change the limit, waking up waiting jobs if it grew."""
+        with self._condition:
+            self._limit.value = max(1, min(self.maximum, limit))
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Run a job once the limit allows it."""
+        with self._condition:
+            while self._active.value >= self._limit.value:
+                self._condition.wait()
+            self._active.value += 1
+        try:
+            yield
+        finally:
+            rss = current_rss()
+            with self._condition:
+                self._active.value -= 1
+                self._completed.value += 1
+                average = self._rss.value
+                self._rss.value = 0.8 * average + 0.2 * rss if average else rss
+                self._condition.notify_all()
+
+
+def limit_phases(limiters: Dict[str, Limiter]) -> Callable:
+    """Phase hook running the phases that have a limiter in a slot."""
+
+    @contextmanager
+    def hook(name: str, **_details):
+        if name in limiters:
+            with limiters[name].slot():
+                yield
+        else:
+            yield
+
+    return hook
+
+
+class Controller:
+    """Sizes the worker pool and the compile and deploy limits.
+
+    The pool is sized once, from the cores and the memory a worker is
+    expected to take, as processes can't be added to a running pool. The
+    limits of the phases are adjusted while running. With a fixed number
+    of workers the limits are not adjusted."""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.adaptive = workers is None
+        self.cpus = cpu_count()
+        memory = available_memory()
+        self.workers = workers or pool_size(
+            self.cpus, memory, max(ESTIMATED_RSS.values())
+        )
+        self.limiters = {
+            kind: Limiter(
+                pool_size(self.workers, memory, rss) if self.adaptive else self.workers,
+                self.workers,
+            )
+            for kind, rss in ESTIMATED_RSS.items()
+        }
+        # Per kind: completed count, throughput and direction of the last step
+        self._last: Dict[str, tuple] = {kind: (0, 0.0, 1) for kind in self.limiters}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def memory_cap(self, kind: str) -> int:
+        """Most jobs of a kind the free memory allows."""
+        limiter = self.limiters[kind]
+        rss = limiter.rss or ESTIMATED_RSS[kind]
+        # Running jobs already take their memory
+        fits = pool_size(self.workers, available_memory(), rss)
+        return min(self.workers, limiter.active + fits)
+
+    def adjust(self, elapsed: float):
+        """Move every limit one step towards a higher throughput."""
+        for kind, limiter in self.limiters.items():
+            completed, throughput, direction = self._last[kind]
+            new_throughput = (limiter.completed - completed) / elapsed
+            if limiter.completed == completed:
+                continue
+            if new_throughput < throughput * (1 - TOLERANCE):
+                direction = -direction
+            limit = min(limiter.limit + direction, self.memory_cap(kind))
+            limiter.set_limit(limit)
+            self._last[kind] = (limiter.completed, new_throughput, direction)
+
+    def _run(self):
+        started = time.perf_counter()
+        while not self._stop.wait(ADJUST_INTERVAL):
+            now = time.perf_counter()
+            self.adjust(now - started)
+            started = now
+
+    def start(self):
+        """Start adjusting in the background."""
+        if self.adaptive:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop adjusting."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def summary(self) -> str:
+        """Final limits and observed RSS per kind."""
+        return ", ".join(
+            f"{kind} {limiter.limit}/{self.workers} "
+            f"({limiter.rss / 2**20:.0f} MiB per job)"
+            for kind, limiter in self.limiters.items()
+        )
@@ -1,63 +1,239 @@
 """Shared fixtures for doctests."""
+
 import pytest
-from typing import List
+from typing import Callable, ContextManager, Dict, List, Optional
 from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+import copy
+import json
 import logging
-
-from web3 import Web3, EthereumTesterProvider
-import vyper
-from solc import compile_files, compile_source
+import os
+import subprocess
+import tempfile
+
+from web3 import Web3
+from web3.contract import Contract
+
+from . import chain
+from .cache import ArtifactCache
+from .cassette import MODES as CASSETTE_MODES, Cassette, recorded
+from .compilers import VERSION, probe_version, registry
+from .concurrency import ResourceLimits
+from .dependencies import SourceIndex
+from .memprof import MemoryProfiler
+from .metrics import MetricsRecorder
+from .profiling import PhaseProfiler, ProfilePlugin
+from .storage import StorageReport
+
+# Context manager factories wrapped around every verification phase,
+# called with the phase name and keyword details about the snippet
+PHASE_HOOKS: List[Callable[..., ContextManager]] = []
+
+
+@contextmanager
+def phase(name: str, **details):
+    """Run a verification phase ("compile", "deploy") under all phase hooks."""
+    with ExitStack() as stack:
+        for hook in PHASE_HOOKS:
+            stack.enter_context(hook(name, **details))
+        yield
+
+
+# Compilers used by the compile helpers, see use_compilers
+_COMPILERS: dict = {
+    "solc": None,
+    "vyper": None,
+    "cache": None,
+    "limits": None,
+    "cassette": None,
+    "optimizer": None,
+}
+
+
+@contextmanager
+def use_compilers(
+    solc: Optional[str] = None,
+    vyper: Optional[str] = None,
+    cache: Optional[ArtifactCache] = None,
+    limits: Optional[ResourceLimits] = None,
+    cassette: Optional[Cassette] = None,
+    optimizer: Optional[dict] = None,
+):
+    """Compile with specific solc and vyper executables in this block.
+
+    By default the solc on the PATH and the installed vyper package are
+    used. Artifacts are shared through the cache if one is given, compiler
+    executables run under the resource limits if given, and compiler
+    requests are recorded or replayed by the cassette if given. Optimizer
+    settings are solc keyword arguments like `optimize_runs`."""
+    previous = dict(_COMPILERS)
+    _COMPILERS.update(
+        solc=solc,
+        vyper=vyper,
+        cache=cache,
+        limits=limits,
+        cassette=cassette,
+        optimizer=optimizer,
+    )
+    try:
+        yield
+    finally:
+        _COMPILERS.update(previous)
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("reference")
+    group.addoption(
+        "--memprof",
+        metavar="PATH",
+        help="record memory use per doctest and per phase as JSON to PATH",
+    )
+    group.addoption(
+        "--profile",
+        metavar="DIR",
+        help="write pstats dumps and collapsed stacks per phase to DIR",
+    )
+    group.addoption(
+        "--profile-top",
+        metavar="N",
+        type=int,
+        help="only profile the N slowest doctests of the previous --profile run",
+    )
+    group.addoption(
+        "--chain-profile",
+        choices=chain.PROFILES,
+        default="lean",
+        help="eth-tester backend profile of the doctest chain, see src/chain.py",
+    )
+    group.addoption(
+        "--storage",
+        metavar="PATH",
+        help="record the storage layout and costs of deployed snippets to PATH",
+    )
+    group.addoption(
+        "--cassette",
+        metavar="PATH",
+        help="record compiler requests to or replay them from PATH, see "
+        "src/cassette.py",
+    )
+    group.addoption(
+        "--cassette-mode",
+        choices=CASSETTE_MODES,
+        default="replay",
+        help="whether --cassette is recorded or replayed",
+    )
+    group.addoption(
+        "--metrics",
+        metavar="DIR",
+        default=".cache/metrics",
+        help="column store the metrics of every doctest are appended to, "
+        "empty to not record them",
+    )
 
 
-@pytest.fixture(autouse=True)
-def web3(doctest_namespace):
-    doctest_namespace["web3"] = Web3(EthereumTesterProvider())
+def pytest_configure(config):
+    memprof_path = config.getoption("memprof")
+    if memprof_path:
+        profiler = MemoryProfiler(memprof_path)
+        config.pluginmanager.register(profiler, "memprof")
+        PHASE_HOOKS.append(profiler.track)
+    profile_dir = config.getoption("profile")
+    if profile_dir:
+        phase_profiler = PhaseProfiler(profile_dir)
+        plugin = ProfilePlugin(phase_profiler, config.getoption("profile_top"))
+        config.pluginmanager.register(plugin, "profile")
+        PHASE_HOOKS.append(phase_profiler.track)
+    cassette_path = config.getoption("cassette")
+    if cassette_path:
+        cassette = Cassette(cassette_path, config.getoption("cassette_mode"))
+        config.pluginmanager.register(cassette, "cassette")
+        _COMPILERS["cassette"] = cassette
+    storage_path = config.getoption("storage")
+    if storage_path:
+        storage_report = StorageReport(storage_path, _COMPILERS["cassette"])
+        config.pluginmanager.register(storage_report, "storage")
+        PHASE_HOOKS.append(storage_report.track)
+    metrics_dir = config.getoption("metrics")
+    if metrics_dir:
+        recorder = MetricsRecorder(metrics_dir, compiler_version)
+        config.pluginmanager.register(recorder, "metrics")
+        PHASE_HOOKS.append(recorder.track)
+
+
+@pytest.fixture(scope="session")
+def chain_image(request):
+    """Chain with the fixture contracts deployed, see src/chain.py."""
+    image = chain.load_image(request.config.getoption("chain_profile"))
+    web3 = chain.load_web3(image)
+    return web3, chain.fixture_contracts(web3, image)
 
 
-def check_compiles_s(web3: Web3, contract_code: str):
+@pytest.fixture(autouse=True)
+def web3(doctest_namespace, chain_image):
+    web3, fixtures = chain_image
+    # Every doctest starts from the image state
+    tester = web3.provider.ethereum_tester
+    snapshot = tester.take_snapshot()
+    doctest_namespace["web3"] = web3
+    doctest_namespace["fixtures"] = fixtures
+    yield web3
+    tester.revert_to_snapshot(snapshot)
+
+
+def check_compiles_s(web3: Web3, contract_code: str, version: Optional[str] = None):
     """Check if a Solidity file compiles without running a contract."""
-    _ = compile_contracts_s(contract_code)
+    with phase("compile", language="solidity", source=contract_code, version=version):
+        _ = compile_contracts_s(contract_code, version=version)
 
 
-def check_compiles_v(web3: Web3, contract_code: str):
+def check_compiles_v(web3: Web3, contract_code: str, version: Optional[str] = None):
     """Check if a Vyper file compiles without running a contract."""
-    _ = compile_contracts_v(contract_code)
+    with phase("compile", language="vyper", source=contract_code, version=version):
+        _ = compile_contracts_v(contract_code, version=version)
 
 
-def check_contract_v(web3: Web3, contract_code: str):
+def check_contract_v(web3: Web3, contract_code: str, version: Optional[str] = None):
     """Verify if a given contract compiles in vyper"""
     # Compile the code
-    compiled = compile_specific_vyper_contract(contract_code)
+    with phase("compile", language="vyper", source=contract_code, version=version):
+        compiled = compile_specific_vyper_contract(contract_code, version)
 
     # Deploy
-    _test_compiled_snippet(web3, compiled)
+    with phase("deploy", web3=web3, compiled=compiled):
+        _test_compiled_snippet(web3, compiled)
 
     # At this point if there hasn't been an exception, the run is a success
 
 
-def check_contract_s(web3: Web3, contract_code: str):
+def check_contract_s(web3: Web3, contract_code: str, version: Optional[str] = None):
     """Verify if a given contract compiles in solidity"""
     # Compile the code
-    compiled = compile_single_contract(contract_code)
+    with phase("compile", language="solidity", source=contract_code, version=version):
+        compiled = compile_single_contract(contract_code, version=version)
 
     # Deploy
-    _test_compiled_snippet(web3, compiled)
+    with phase("deploy", web3=web3, compiled=compiled):
+        _test_compiled_snippet(web3, compiled)
 
     # At this point if there hasn't been an exception, the run is a success
 
 
-def check_named_contract_s(web3: Web3, contract_code: str, name: str):
+def check_named_contract_s(
+    web3: Web3, contract_code: str, name: str, version: Optional[str] = None
+):
     """Verify if the given named contract compiles in solidity"""
     # Compile the code
-    compiled = compile_named_contract(contract_code, name)
+    with phase("compile", language="solidity", source=contract_code, version=version):
+        compiled = compile_named_contract(contract_code, name, version=version)
 
     # Deploy
-    _test_compiled_snippet(web3, compiled)
+    with phase("deploy", web3=web3, compiled=compiled):
+        _test_compiled_snippet(web3, compiled)
 
     # At this point if there hasn't been an exception, the run is a success
 
 
-def check_local_s(web3: Web3, snippet: str):
+def check_local_s(web3: Web3, snippet: str, version: Optional[str] = None):
     """Verify if piece of code compiles if placed in a
     constructor function of an empty contract of solidity code"""
 
@@ -71,10 +247,10 @@ def check_local_s(web3: Web3, snippet: str):
 }}
 """
 
-    check_contract_s(web3, code)
+    check_contract_s(web3, code, version)
 
 
-def check_local_v(web3: Web3, snippet: str):
+def check_local_v(web3: Web3, snippet: str, version: Optional[str] = None):
     """Verify if piece of code compiles if placed in a
     constructor function of an empty contract of vyper code"""
 
@@ -87,16 +263,10 @@ def __init__():
     {indented_snippet}
 """
 
-    # Compile the code
-    compiled = compile_specific_vyper_contract(code)
+    check_contract_v(web3, code, version)
 
-    # Deploy
-    _test_compiled_snippet(web3, compiled)
 
-    # At this point if there hasn't been an exception, the run is a success
-
-
-def check_global_s(web3: Web3, snippet: str):
+def check_global_s(web3: Web3, snippet: str, version: Optional[str] = None):
     """Verify if piece of code compiles if placed in an
     empty solidity contract body"""
 
@@ -108,11 +278,14 @@ def check_global_s(web3: Web3, snippet: str):
 }}
 """
 
-    check_contract_s(web3, code)
+    check_contract_s(web3, code, version)
 
 
 def check_global_constructor_s(
-    web3: Web3, global_snippet: str, constructor_snippet: str
+    web3: Web3,
+    global_snippet: str,
+    constructor_snippet: str,
+    version: Optional[str] = None,
 ):
     """Verify if piece of code compiles if placed in an
     empty solidity contract body"""
@@ -126,10 +299,10 @@ def check_global_constructor_s(
 }}
 """
 
-    check_contract_s(web3, code)
+    check_contract_s(web3, code, version)
 
 
-def check_global_v(web3: Web3, snippet: str):
+def check_global_v(web3: Web3, snippet: str, version: Optional[str] = None):
     """Verify if piece of code compiles if placed in an
     empty vyper contract body"""
 
@@ -142,16 +315,12 @@ def __init__():
     pass
 """
 
-    # Compile the code
-    compiled = compile_specific_vyper_contract(code)
+    check_contract_v(web3, code, version)
 
-    # Deploy
-    _test_compiled_snippet(web3, compiled)
 
-    # At this point if there hasn't been an exception, the run is a success
-
-
-def check_s(web3: Web3, global_snippet: str, local_snippet: str):
+def check_s(
+    web3: Web3, global_snippet: str, local_snippet: str, version: Optional[str] = None
+):
     """Verify if piece of code compiles if placed in
     an empty contract of solidity code"""
 
@@ -166,10 +335,12 @@ def check_s(web3: Web3, global_snippet: str, local_snippet: str):
 }}
 """
 
-    check_contract_s(web3, code)
+    check_contract_s(web3, code, version)
 
 
-def check_v(web3: Web3, global_snippet: str, local_snippet: str):
+def check_v(
+    web3: Web3, global_snippet: str, local_snippet: str, version: Optional[str] = None
+):
     """Verify if piece of code compiles if placed in
     an empty contract of vyper code"""
 
@@ -184,38 +355,103 @@ def __init__():
     {indented_snippet}
 """
 
-    # Compile the code
-    compiled = compile_specific_vyper_contract(code)
+    check_contract_v(web3, code, version)
 
-    # Deploy
-    _test_compiled_snippet(web3, compiled)
 
-    # At this point if there hasn't been an exception, the run is a success
+def deploy_v(web3: Web3, contract_code: str, *args) -> Contract:
+    """Deploy a Vyper contract with constructor arguments, to use it after."""
+    with phase("compile", language="vyper", source=contract_code):
+        compiled = compile_specific_vyper_contract(contract_code)
+    with phase("deploy", web3=web3, compiled=compiled):
+        return _test_compiled_snippet(web3, compiled, *args)
+
 
+def deploy_named_s(web3: Web3, contract_code: str, name: str, *args) -> Contract:
+    """Deploy the named Solidity contract with constructor arguments."""
+    with phase("compile", language="solidity", source=contract_code):
+        compiled = compile_named_contract(contract_code, name)
+    with phase("deploy", web3=web3, compiled=compiled):
+        return _test_compiled_snippet(web3, compiled, *args)
 
-def _test_compiled_snippet(web3, compiled):
+
+def _test_compiled_snippet(web3, compiled, *args) -> Contract:
     bytecode = compiled["bin"]
     abi = compiled["abi"]
     contract = web3.eth.contract(abi=abi, bytecode=bytecode)
-    tx_hash = contract.constructor().transact()
+    tx_hash = contract.constructor(*args).transact()
     tx_receipt = web3.eth.waitForTransactionReceipt(tx_hash)
+    return web3.eth.contract(address=tx_receipt.contractAddress, abi=abi)
+
+
+def _compile_solidity_source(source: str, **compiler_kwargs):
+    """Compile Solidity source code with the selected solc."""
+    compiler_kwargs = {**(_COMPILERS["optimizer"] or {}), **compiler_kwargs}
+    if compiler_kwargs.get("version") is None:
+        # No version is the selected solc, keyed as before versions existed
+        compiler_kwargs.pop("version", None)
+    request = [
+        "solidity",
+        str(_COMPILERS["solc"]),
+        repr(sorted(compiler_kwargs.items())),
+        source,
+    ]
+    return recorded(
+        _COMPILERS["cassette"],
+        request,
+        lambda: _compile_solidity_source_cached(source, **compiler_kwargs),
+    )
+
+
+def _compile_solidity_source_cached(source: str, **compiler_kwargs):
+    from solc import compile_source  # pylint: disable=import-outside-toplevel
+
+    cache = _COMPILERS["cache"]
+    if cache is None:
+        _select_solc(compiler_kwargs)
+        return compile_source(source, **compiler_kwargs)
+    key = cache.key(
+        "solidity",
+        str(_COMPILERS["solc"]),
+        repr(sorted(compiler_kwargs.items())),
+        source,
+    )
+
+    def compile_all():
+        _select_solc(compiler_kwargs)
+        return compile_source(source, **compiler_kwargs)
+
+    return cache.get_or_compile(key, compile_all)
+
+
+def _select_solc(compiler_kwargs: dict):
+    """Point py-solc at the selected solc, wrapped in the resource limits.
+
+    A `version` keyword selects that version from the compiler registry."""
+    version = compiler_kwargs.pop("version", None)
+    solc_binary = compiler_kwargs.get("solc_binary", _COMPILERS["solc"])
+    if version is not None:
+        solc_binary = registry().path("solc", version)
+    if _COMPILERS["limits"] is not None:
+        solc_binary = _COMPILERS["limits"].wrap(solc_binary or "solc")
+    if solc_binary is not None:
+        compiler_kwargs["solc_binary"] = solc_binary
 
 
 def compile_contracts_s(source: str, **compiler_kwargs):
     """Compile Solidity source code."""
-    return compile_source(source, **compiler_kwargs)
+    return _compile_solidity_source(source, **compiler_kwargs)
 
 
 def compile_contracts_v(source: str, **compiler_kwargs):
     """Compile Vyper source code."""
-    return compile_specific_vyper_contract(source)
+    return compile_specific_vyper_contract(source, compiler_kwargs.get("version"))
 
 
 def compile_single_contract(source: str, **compiler_kwargs):
     """Compile Solidity source code containing a single contract."""
     # pylint: disable=fixme
     # TODO: Add vyper support
-    compiled_all = compile_source(source, **compiler_kwargs)
+    compiled_all = _compile_solidity_source(source, **compiler_kwargs)
     if len(list(compiled_all.keys())) > 1:
         raise Exception("Can only handle single contracts.")
     compiled = compiled_all[next(iter(compiled_all))]
@@ -226,7 +462,7 @@ def compile_named_contract(source: str, name: str, **compiler_kwargs):
     """Compile named contract in Solidity source code."""
     # pylint: disable=fixme
     # TODO: Add vyper support
-    compiled_all = compile_source(source, **compiler_kwargs)
+    compiled_all = _compile_solidity_source(source, **compiler_kwargs)
     for key in compiled_all:
         if name in key:
             return compiled_all[key]
@@ -235,7 +471,7 @@ def compile_named_contract(source: str, name: str, **compiler_kwargs):
 
 def compile_specific_contract(source: str, contract_name: str, **compiler_kwargs):
     """Compile Solidity source code with a specific contract."""
-    compiled_all = compile_source(source, **compiler_kwargs)
+    compiled_all = _compile_solidity_source(source, **compiler_kwargs)
     mod_contract_name = f"<stdin>:{contract_name}"
     if mod_contract_name not in compiled_all:
         raise Exception(f"Contract {contract_name} not in source")
@@ -243,43 +479,169 @@ def compile_specific_contract(source: str, contract_name: str, **compiler_kwargs
     return compiled
 
 
+# Source files and their imports, for compile_single_contract_from_files
+_SOURCES = SourceIndex()
+
+# Artifacts of compile_single_contract_from_files by inputs, when no cache
+# is in use
+_FILE_ARTIFACTS: Dict[str, dict] = {}
+
+
 def compile_single_contract_from_files(
     paths: List[str], contract: str, **compiler_kwargs
 ):
-    """Compile a contract from Solidity or Vyper source files."""
-    # Solidity compilation
-    if str(paths[0]).endswith(".sol"):
-        compiled_all = compile_files(paths, **compiler_kwargs)
-        if contract is None:
-            if len(list(compiled_all.keys())) > 1:
-                raise Exception(
-                    "Multiple contracts available, "
-                    + "please select a single contract."
-                )
-            return compiled_all[next(iter(compiled_all))]
-        for key in compiled_all:
-            if key.endswith(f":{contract}"):
-                return compiled_all[key]
-        raise Exception(
-            f"No contract with name {contract} found in {compiled_all.keys()}"
-        )
+    r"""Compile a contract from Solidity or Vyper source files.
+
+    All files are compiled, but the artifacts are reused until one of the
+    files the contract transitively imports changes.
+
+    >>> path = os.path.join(tempfile.mkdtemp(), "one.vy")
+    >>> def write(value):
+    ...     with open(path, "w") as source_file:
+    ...         _ = source_file.write(f"@external\ndef f() -> uint256:\n    return {value}\n")
+    >>> write(1)
+    >>> before = len(_FILE_ARTIFACTS)
+    >>> first = compile_single_contract_from_files([path], None)
+    >>> second = compile_single_contract_from_files([path], None)
+    >>> len(_FILE_ARTIFACTS) - before, second == first, second is first
+    (1, True, False)
+
+    Callers get copies, changing one leaves the reused artifacts alone:
+
+    >>> first["abi"].clear()
+    >>> compile_single_contract_from_files([path], None) == second
+    True
+
+    A changed source is compiled again:
+
+    >>> write(2)
+    >>> third = compile_single_contract_from_files([path], None)
+    >>> len(_FILE_ARTIFACTS) - before, third["bin"] != second["bin"]
+    (2, True)
+    """
+    solidity = str(paths[0]).endswith(".sol")
+    inputs = None
+    if solidity and contract is not None:
+        # Files outside of the declaring file's imports can't change it
+        declaring = _SOURCES.declaring(paths, contract)
+        if declaring is not None:
+            inputs = _SOURCES.closure([declaring])
+    if inputs is None:
+        inputs = _SOURCES.closure(paths)
+    if solidity:
+        compiler = _COMPILERS["solc"]
+        compiler_kwargs = {**(_COMPILERS["optimizer"] or {}), **compiler_kwargs}
+    else:
+        compiler = compiler_kwargs.get("version") or _vyper_request_version()
+    request = [
+        "files",
+        str(compiler),
+        repr(sorted(compiler_kwargs.items())),
+        str(contract),
+        *sorted(os.path.relpath(path) for path in paths),
+        *[f"{os.path.relpath(path)}:{digest}" for path, digest in inputs],
+    ]
+    compiled = recorded(
+        _COMPILERS["cassette"],
+        request,
+        lambda: _compile_files_cached(
+            paths, contract, solidity, ArtifactCache.key(*request), **compiler_kwargs
+        ),
+    )
+    # Callers get their own copy of the artifacts kept for reuse
+    return copy.deepcopy(compiled)
+
 
-    # Vyper compilation
+def _compile_files_cached(
+    paths: List[str], contract: str, solidity: bool, key: str, **compiler_kwargs
+):
+    cache = _COMPILERS["cache"]
+
+    def compile_files():
+        if solidity:
+            return _compile_solidity_files(paths, contract, **compiler_kwargs)
+        return _compile_vyper_files(paths, compiler_kwargs.get("version"))
+
+    if cache is not None:
+        # The cache is the one copy, shared by the processes using it
+        return cache.get_or_compile(key, compile_files)
+    if key not in _FILE_ARTIFACTS:
+        _FILE_ARTIFACTS[key] = compile_files()
+    return _FILE_ARTIFACTS[key]
+
+
+def _compile_solidity_files(paths: List[str], contract: str, **compiler_kwargs):
+    from solc import compile_files  # pylint: disable=import-outside-toplevel
+
+    _select_solc(compiler_kwargs)
+    compiled_all = compile_files(paths, **compiler_kwargs)
+    if contract is None:
+        if len(list(compiled_all.keys())) > 1:
+            raise Exception(
+                "Multiple contracts available, please select a single contract."
+            )
+        return compiled_all[next(iter(compiled_all))]
+    for key in compiled_all:
+        if key.endswith(f":{contract}"):
+            return compiled_all[key]
+    raise Exception(f"No contract with name {contract} found in {compiled_all.keys()}")
+
+
+def _compile_vyper_files(paths: List[str], version: Optional[str] = None):
     codes: OrderedDict = OrderedDict()
     for filename in paths:
         with open(filename, "r") as code_file:
             codes[filename] = code_file.read()
-    return _compile_vyper_sources(codes, paths[0])
+    return _compile_vyper_sources(codes, paths[0], version)
+
 
+def _select_vyper(version: Optional[str] = None) -> Optional[str]:
+    """The selected vyper executable, None for the installed package.
 
-def _compile_vyper_sources(codes, name: str):
+    A version selects the package if it is that version, otherwise that
+    version from the compiler registry."""
+    if version is None:
+        return _COMPILERS["vyper"]
+    if _probe_compiler_version("vyper", None) == version:
+        return None
+    return registry().path("vyper", version)
+
+
+def _vyper_request_version() -> Optional[str]:
+    """The selected vyper executable, or the version of the package, which
+    a replayed session knows from the cassette without importing it."""
+    return _COMPILERS["vyper"] or package_vyper_version()
+
+
+def _compile_vyper_sources(codes, name: str, version: Optional[str] = None):
     """Compile a list of Vyper contracts using the first one."""
-    output = vyper.compiler.compile_codes(
-        codes,
-        output_formats=["bytecode", "bytecode_runtime", "abi"],
-        exc_handler=vyper_exc_handler,
+    compiler = version or _vyper_request_version()
+    request = ["vyper", str(compiler), name, dict(codes)]
+    return recorded(
+        _COMPILERS["cassette"],
+        request,
+        lambda: _compile_vyper_sources_cached(codes, name, _select_vyper(version)),
     )
-    contract = output[name]
+
+
+def _compile_vyper_sources_cached(codes, name: str, executable: Optional[str]):
+    cache = _COMPILERS["cache"]
+    if cache is not None:
+        key = cache.key("vyper", str(executable), name, *codes.values())
+        return cache.get_or_compile(
+            key, lambda: _compile_vyper_sources_uncached(codes, name, executable)
+        )
+    return _compile_vyper_sources_uncached(codes, name, executable)
+
+
+def _compile_vyper_sources_uncached(codes, name: str, executable: Optional[str]):
+    if executable is not None:
+        contract = _compile_vyper_executable(executable, codes, name)
+    else:
+        # pylint: disable=import-outside-toplevel
+        from .vyper_session import session as vyper_session
+
+        contract = vyper_session().compile(codes, name)
 
     # Adapt Vyper output to solc conventional output
     result = {
@@ -290,11 +652,86 @@ def _compile_vyper_sources(codes, name: str):
     return result
 
 
-def compile_specific_vyper_contract(source: str):
-    """Compile Vyper contract from source str."""
+def _compile_vyper_executable(executable: str, codes, name: str):
+    """Compile a Vyper contract with a vyper executable instead of the package."""
+    with tempfile.TemporaryDirectory() as directory:
+        for filename, code in codes.items():
+            path = os.path.join(directory, os.path.basename(filename))
+            if not path.endswith(".vy"):
+                path += ".vy"
+            with open(path, "w") as code_file:
+                code_file.write(code)
+            if filename == name:
+                main_path = path
+        process = subprocess.run(
+            [executable, "-f", "bytecode,bytecode_runtime,abi", main_path],
+            cwd=directory,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            preexec_fn=_COMPILERS["limits"] and _COMPILERS["limits"].apply,
+        )
+    if process.returncode != 0:
+        logging.error("Error compiling: %s", name)
+        raise Exception(process.stderr)
+    bytecode, bytecode_runtime, abi = process.stdout.strip().split("\n", 2)
+    return {
+        "bytecode": bytecode,
+        "bytecode_runtime": bytecode_runtime,
+        "abi": json.loads(abi),
+    }
+
+
+def compile_specific_vyper_contract(source: str, version: Optional[str] = None):
+    """Compile Vyper contract from source str, with a specific vyper version
+    from the compiler registry if one is given."""
     codes = OrderedDict()
     codes["main"] = source
-    return _compile_vyper_sources(codes, "main")
+    return _compile_vyper_sources(codes, "main", version)
+
+
+def compiler_version(kind: str) -> Optional[str]:
+    """Version of the solc or vyper the compile helpers use."""
+    executable = _COMPILERS[kind]
+    return recorded(
+        _COMPILERS["cassette"],
+        ["version", kind, str(executable)],
+        lambda: _probe_compiler_version(kind, executable),
+    )
+
+
+def package_vyper_version() -> Optional[str]:
+    """Version of the installed vyper package, which compiles the chain
+    fixtures whatever vyper the compile helpers use."""
+    return recorded(
+        _COMPILERS["cassette"],
+        ["version", "vyper", str(None)],
+        lambda: _probe_compiler_version("vyper", None),
+    )
+
+
+def compile_fixture(source: str) -> dict:
+    """Bytecode and ABI of a chain fixture, compiled by the vyper package."""
+    return recorded(
+        _COMPILERS["cassette"],
+        ["fixture", package_vyper_version(), source],
+        lambda: _compile_fixture(source),
+    )
+
+
+def _compile_fixture(source: str) -> dict:
+    import vyper  # pylint: disable=import-outside-toplevel
+
+    return vyper.compile_code(source, ["bytecode", "abi"])
+
+
+def _probe_compiler_version(kind: str, executable: Optional[str]) -> Optional[str]:
+    if kind == "vyper" and executable is None:
+        import vyper  # pylint: disable=import-outside-toplevel
+
+        package_version = VERSION.search(vyper.__version__)
+        return package_version and package_version.group()
+    return probe_version(executable or kind)
 
 
 def get_abi(compiled):
@@ -311,9 +748,3 @@ def get_bytecode(compiled):
     if match:
         return raw_bytecode[: match.start()]
     return raw_bytecode
-
-
-def vyper_exc_handler(contract_name, exception):
-    """Handle vyper compiler exception."""
-    logging.error("Error compiling: %s", contract_name)
-    raise exception
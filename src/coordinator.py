@@ -0,0 +1,402 @@
+"""Distribute the doctests over workers pulling jobs from a coordinator.
+
+Workers ask for the next doctest whenever they are idle, so fast hosts run
+more of them and nobody waits on a statically assigned shard. Jobs are
+handed out slowest first, using the durations of the previous run.
+
+    REFERENCE_AUTHKEY=secret python -m src.coordinator serve --bind 0.0.0.0:7000
+    REFERENCE_AUTHKEY=secret python -m src.coordinator work --connect host:7000
+
+Coordinator and workers authenticate each other with the shared secret in
+REFERENCE_AUTHKEY and exchange JSON messages only. Serving on anything but
+a loopback address requires the secret to be set, a loopback coordinator
+makes up a random one for the workers it starts itself.
+
+Every worker uses its own compilers and chain. The jobs of a worker that
+disconnects go back into the queue, a job that disconnects workers
+MAX_ATTEMPTS times fails. Results are merged into one report in pytest's
+format, `serve --local N` starts N workers on this machine. When all of
+them have exited and no other worker is connected, the jobs left fail
+rather than waiting for workers that won't come.
+"""
+
+import argparse
+import importlib
+import ipaddress
+import json
+import os
+import queue
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import chain, verify
+from .cache import write_atomic
+
+DURATIONS = ".cache/durations.json"
+
+# Environment variable holding the secret shared by coordinator and workers
+AUTHKEY_VARIABLE = "REFERENCE_AUTHKEY"
+
+# Workers a job may disconnect before it counts as failed
+MAX_ATTEMPTS = 3
+
+# Largest message accepted, reports of failing doctests included
+MAX_MESSAGE = 16 * 2**20
+
+
+def is_loopback(host: str) -> bool:
+    """Whether a host only accepts connections from this machine.
+
+    >>> is_loopback("127.0.0.1"), is_loopback("localhost"), is_loopback("0.0.0.0")
+    (True, True, False)
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def authkey(host: Optional[str] = None) -> bytes:
+    """The shared secret, made up for a coordinator serving on loopback."""
+    secret = os.environ.get(AUTHKEY_VARIABLE)
+    if secret:
+        return secret.encode()
+    if host is not None and is_loopback(host):
+        # Local workers inherit it through the environment
+        os.environ[AUTHKEY_VARIABLE] = secrets.token_hex(32)
+        return os.environ[AUTHKEY_VARIABLE].encode()
+    raise SystemExit(
+        f"Set {AUTHKEY_VARIABLE} to a secret shared by the coordinator and workers"
+    )
+
+
+def send(connection: Connection, message: Any):
+    connection.send_bytes(json.dumps(message).encode())
+
+
+def receive(connection: Connection) -> Any:
+    """A JSON message, never unpickled like Connection.recv would."""
+    return json.loads(connection.recv_bytes(MAX_MESSAGE))
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """Split host:port.
+
+    >>> parse_address("127.0.0.1:7000")
+    ('127.0.0.1', 7000)
+    """
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def schedule(names: List[str], durations: Dict[str, float]) -> List[str]:
+    """Order jobs slowest first, unknown ones before known ones.
+
+    Solidity is slower to compile than Vyper, so it goes first when there
+    are no durations yet.
+
+    >>> schedule(["a_v", "b_s", "c_v"], {"a_v": 0.1, "c_v": 0.5})
+    ['b_s', 'c_v', 'a_v']
+    """
+
+    def key(name):
+        if name in durations:
+            return (1, -durations[name])
+        return (0, not name.endswith("_s"))
+
+    return sorted(names, key=key)
+
+
+class Coordinator:
+    """Queue of doctest jobs served to workers over a socket."""
+
+    def __init__(self, modules: List[str], address: Tuple[str, int]):
+        self.modules = modules
+        self.listener = Listener(address, authkey=authkey(address[0]))
+        self.jobs: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self.results: Dict[str, dict] = {}
+        # Workers that disconnected while running a job, by job
+        self.attempts: Dict[str, int] = {}
+        self.total = 0
+        # Workers connected right now
+        self.connected = 0
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def address(self) -> str:
+        host, port = self.listener.address
+        return f"{host}:{port}"
+
+    def enqueue(self, durations: Dict[str, float]):
+        """Queue the doctests of all modules."""
+        jobs = {}
+        for module in self.modules:
+            for test in verify.find_doctests(importlib.import_module(module)).values():
+                jobs[test.name] = (module, test.name)
+        for name in schedule(list(jobs), durations):
+            self.jobs.put(jobs[name])
+        self.total = len(jobs)
+
+    def _record(self, job: Tuple[str, str], result: dict):
+        with self._lock:
+            if job[1] in self.results:
+                return
+            self.results[job[1]] = {"module": job[0], **result}
+            done = len(self.results) == self.total
+        print("." if result["passed"] else "F", end="", flush=True)
+        if done:
+            self.finished.set()
+
+    def _serve(self, connection: Connection):
+        job = None
+        worker = "unknown"
+        with self._lock:
+            self.connected += 1
+        try:
+            worker = str(receive(connection))
+            while not self.finished.is_set():
+                try:
+                    job = self.jobs.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                send(connection, ["job", *job])
+                passed, report, duration = receive(connection)
+                self._record(
+                    job,
+                    {
+                        "passed": bool(passed),
+                        "report": str(report),
+                        "duration": float(duration),
+                        "worker": worker,
+                    },
+                )
+                job = None
+            send(connection, ["done"])
+        except (EOFError, OSError, ValueError):
+            # The worker is gone, someone else gets its job unless it keeps
+            # taking workers down with it
+            if job is not None:
+                with self._lock:
+                    attempts = self.attempts.get(job[1], 0) + 1
+                    self.attempts[job[1]] = attempts
+                if attempts < MAX_ATTEMPTS:
+                    self.jobs.put(job)
+                else:
+                    report = (
+                        f"{attempts} workers disconnected running it, last {worker}\n"
+                    )
+                    self._record(
+                        job,
+                        {
+                            "passed": False,
+                            "report": report,
+                            "duration": 0.0,
+                            "worker": worker,
+                        },
+                    )
+        finally:
+            with self._lock:
+                self.connected -= 1
+            connection.close()
+
+    def _fail_outstanding(self, report: str):
+        """Fail the jobs nobody is left to run."""
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            self._record(
+                job,
+                {"passed": False, "report": report, "duration": 0.0, "worker": "none"},
+            )
+
+    def serve(self, workers: Optional[List[subprocess.Popen]] = None):
+        """Accept workers until all jobs have results.
+
+        With the local worker processes given, jobs fail once those have all
+        exited and no other worker is connected.
+
+        >>> import contextlib, io
+        >>> coordinator = Coordinator(["src.incremental"], ("127.0.0.1", 0))
+        >>> coordinator.enqueue({})
+        >>> with contextlib.redirect_stdout(io.StringIO()) as progress:
+        ...     coordinator.serve(start_workers(coordinator.address, 2))
+        >>> progress.getvalue()
+        '....'
+        >>> all(result["passed"] for result in coordinator.results.values())
+        True
+        >>> sorted(coordinator.results)[-2:]
+        ['src.incremental.chunks', 'src.incremental.write_incremental']
+        >>> {r["worker"] for r in coordinator.results.values()} <= {"local-0", "local-1"}
+        True
+
+        Workers that die before running anything fail the jobs:
+
+        >>> coordinator = Coordinator(["src.incremental"], ("127.0.0.1", 0))
+        >>> coordinator.enqueue({})
+        >>> with contextlib.redirect_stdout(io.StringIO()) as progress:
+        ...     coordinator.serve([subprocess.Popen([sys.executable, "-c", "1"])])
+        >>> progress.getvalue()
+        'FFFF'
+        >>> print(coordinator.results["src.incremental.chunks"]["report"])
+        No workers left, local workers exited with [0]
+        <BLANKLINE>
+        """
+        if self.total == 0:
+            self.finished.set()
+
+        def accept():
+            while not self.finished.is_set():
+                try:
+                    connection = self.listener.accept()
+                except (AuthenticationError, EOFError, ConnectionError):
+                    # A peer without the secret, or one that hung up
+                    continue
+                except OSError:
+                    return  # The listener was closed
+                threading.Thread(
+                    target=self._serve, args=(connection,), daemon=True
+                ).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        while not self.finished.wait(timeout=0.5):
+            if not workers or any(process.poll() is None for process in workers):
+                continue
+            with self._lock:
+                connected = self.connected
+            if not connected:
+                codes = [process.returncode for process in workers]
+                self._fail_outstanding(
+                    f"No workers left, local workers exited with {codes}\n"
+                )
+        self.listener.close()
+
+
+def start_workers(address: str, count: int) -> List[subprocess.Popen]:
+    """Worker processes on this machine, connecting to a coordinator."""
+    return [
+        subprocess.Popen(
+            [sys.executable, "-m", "src.coordinator", "work"]
+            + ["--connect", address, "--name", f"local-{number}"]
+        )
+        for number in range(count)
+    ]
+
+
+def work(address: Tuple[str, int], name: str):
+    """Run jobs from a coordinator until it has none left."""
+    connection = Client(address, authkey=authkey())
+    send(connection, name)
+    image = chain.load_image()
+    web3 = chain.load_web3(image)
+    fixtures = chain.fixture_contracts(web3, image)
+    tests: Dict[str, Dict] = {}
+    while True:
+        message = receive(connection)
+        if message[0] == "done":
+            break
+        _, module, test_name = message
+        if module not in tests:
+            found = verify.find_doctests(importlib.import_module(module))
+            tests[module] = {test.name: test for test in found.values()}
+        started = time.perf_counter()
+        ((_, passed, report),) = verify.run_doctests(
+            [tests[module][test_name]], web3, fixtures
+        )
+        send(connection, [passed, report, time.perf_counter() - started])
+    connection.close()
+
+
+def format_report(results: Dict[str, dict], elapsed: float) -> str:
+    """Merged results in the format of pytest's terminal report."""
+    lines = []
+    for name, result in sorted(results.items()):
+        path = result["module"].replace(".", "/") + ".py"
+        outcome = "PASSED" if result["passed"] else "FAILED"
+        lines.append(
+            f"{path}::{name} {outcome} "
+            f"[{result['worker']} {result['duration']:.2f}s]"
+        )
+    failed = {name: r for name, r in results.items() if not r["passed"]}
+    if failed:
+        lines.append(" FAILURES ".center(80, "="))
+        for name, result in sorted(failed.items()):
+            lines.append(f" [doctest] {name} ".center(80, "_"))
+            lines.append(result["report"].rstrip())
+    workers = len({result["worker"] for result in results.values()})
+    summary = f" {len(results) - len(failed)} passed"
+    if failed:
+        summary += f", {len(failed)} failed"
+    summary += f" in {elapsed:.2f}s on {workers} workers "
+    lines.append(summary.center(80, "="))
+    return "\n".join(lines)
+
+
+def read_durations(path: str) -> Dict[str, float]:
+    try:
+        with open(path) as durations_file:
+            return json.load(durations_file)
+    except FileNotFoundError:
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="hand out jobs and merge results")
+    serve.add_argument("--bind", default="127.0.0.1:0", help="host:port to listen on")
+    serve.add_argument(
+        "--module", action="append", help="module with doctests, default src.main"
+    )
+    serve.add_argument("--local", type=int, default=0, help="workers to start here")
+    serve.add_argument("--json", metavar="PATH", help="also write results as JSON")
+    serve.add_argument(
+        "--durations", default=DURATIONS, help="job durations, read and updated"
+    )
+    worker = commands.add_parser("work", help="run jobs from a coordinator")
+    worker.add_argument("--connect", required=True, help="coordinator host:port")
+    worker.add_argument(
+        "--name", default=f"{socket.gethostname()}-{os.getpid()}", help="worker name"
+    )
+    args = parser.parse_args()
+
+    if args.command == "work":
+        work(parse_address(args.connect), args.name)
+        return
+
+    started = time.perf_counter()
+    coordinator = Coordinator(args.module or ["src.main"], parse_address(args.bind))
+    durations = read_durations(args.durations)
+    coordinator.enqueue(durations)
+    print(f"Serving {coordinator.total} doctests on {coordinator.address}")
+    workers = start_workers(coordinator.address, args.local if coordinator.total else 0)
+    coordinator.serve(workers)
+    for process in workers:
+        process.wait()
+    print()
+    print(format_report(coordinator.results, time.perf_counter() - started))
+
+    durations.update(
+        {name: result["duration"] for name, result in coordinator.results.items()}
+    )
+    os.makedirs(os.path.dirname(args.durations) or ".", exist_ok=True)
+    write_atomic(args.durations, json.dumps(durations, indent=2).encode())
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(coordinator.results, json_file, indent=2)
+    sys.exit(any(not result["passed"] for result in coordinator.results.values()))
+
+
+if __name__ == "__main__":
+    main()
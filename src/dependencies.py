@@ -0,0 +1,138 @@
+"""Import graph of Solidity and Vyper source files.
+
+Used to recompile a set of contract files only when a file it transitively
+imports changed. Files are only read again when their mtime or size
+changed, and a changed file only counts as changed if its hash did.
+"""
+
+import hashlib
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# import "a.sol"; import {A} from "./a.sol"; import * as A from "a.sol";
+SOLIDITY_IMPORT = re.compile(
+    r"""^\s*import\s+(?:[^"';]*?\bfrom\s+)?["']([^"']+)["']""", re.M
+)
+
+# Contracts, libraries and interfaces a Solidity file declares
+SOLIDITY_DECLARATION = re.compile(
+    r"^\s*(?:abstract\s+)?(?:contract|library|interface)\s+(\w+)", re.M
+)
+
+# import a.b as B; from . import b; from .a import b
+VYPER_IMPORT = re.compile(
+    r"^(?:from\s+(\.*)([\w.]*)\s+)?import\s+([\w.]+)(?:\s+as\s+\w+)?\s*$", re.M
+)
+
+
+def solidity_imports(code: str) -> List[str]:
+    """Paths imported by Solidity code.
+
+    >>> solidity_imports('import "./A.sol";\\nimport {B} from "lib/B.sol";')
+    ['./A.sol', 'lib/B.sol']
+    """
+    return SOLIDITY_IMPORT.findall(code)
+
+
+def vyper_imports(code: str) -> List[str]:
+    """Paths imported by Vyper code, without the file extension.
+
+    Built-in interfaces are left out, like the vyper command line does.
+
+    >>> vyper_imports("import interfaces.Token as Token\\nfrom . import Feed")
+    ['interfaces/Token', './Feed']
+    >>> vyper_imports("from vyper.interfaces import ERC20")
+    []
+    """
+    paths = []
+    for dots, module, name in VYPER_IMPORT.findall(code):
+        if not dots and module == "vyper.interfaces":
+            continue
+        if dots or module:
+            prefix = "../" * (len(dots) - 1) if len(dots) > 1 else "./" * len(dots)
+            module_path = module.replace(".", "/")
+            paths.append(f"{prefix}{module_path}/{name}" if module else prefix + name)
+        else:
+            paths.append(name.replace(".", "/"))
+    return paths
+
+
+def resolve(importer: str, imported: str, extensions: Tuple[str, ...]) -> Optional[str]:
+    """Find an imported file next to the importing one or in the working
+    directory, None if it doesn't exist (the compiler will complain)."""
+    directories = [os.path.dirname(importer)]
+    if not imported.startswith("."):
+        directories.append(os.getcwd())
+    for directory in directories:
+        base = os.path.normpath(os.path.join(directory, imported))
+        for candidate in [base] + [base + extension for extension in extensions]:
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate)
+    return None
+
+
+class SourceFile(NamedTuple):
+    """What is known about a source file as of a modification time."""
+
+    mtime_ns: int
+    size: int
+    digest: str
+    imports: List[str]
+    declarations: List[str]
+
+
+class SourceIndex:
+    """Hashes, imports and declarations of source files, kept up to date."""
+
+    def __init__(self):
+        self._files: Dict[str, SourceFile] = {}
+
+    def get(self, path: str) -> SourceFile:
+        """Information about a file, reading it only if it was modified."""
+        path = os.path.abspath(path)
+        status = os.stat(path)
+        known = self._files.get(path)
+        if known and known[:2] == (status.st_mtime_ns, status.st_size):
+            return known
+        with open(path, "rb") as source_file:
+            content = source_file.read()
+        code = content.decode()
+        if path.endswith(".sol"):
+            imports = solidity_imports(code)
+            declarations = SOLIDITY_DECLARATION.findall(code)
+            extensions: Tuple[str, ...] = ()
+        else:
+            imports = vyper_imports(code) if path.endswith(".vy") else []
+            declarations = []
+            extensions = (".vy", ".json")
+        resolved = [resolve(path, imported, extensions) for imported in imports]
+        self._files[path] = SourceFile(
+            status.st_mtime_ns,
+            status.st_size,
+            hashlib.sha256(content).hexdigest(),
+            [dependency for dependency in resolved if dependency],
+            declarations,
+        )
+        return self._files[path]
+
+    def closure(self, paths: List[str]) -> List[Tuple[str, str]]:
+        """The files and everything they transitively import, as sorted
+        (path, digest) pairs."""
+        seen: Dict[str, str] = {}
+        pending = [os.path.abspath(path) for path in paths]
+        while pending:
+            path = pending.pop()
+            if path in seen:
+                continue
+            source = self.get(path)
+            seen[path] = source.digest
+            pending.extend(source.imports)
+        return sorted(seen.items())
+
+    def declaring(self, paths: List[str], name: str) -> Optional[str]:
+        """The file among the paths and their imports declaring a contract."""
+        for path, _ in self.closure(paths):
+            if name in self.get(path).declarations:
+                return path
+        return None
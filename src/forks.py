@@ -0,0 +1,292 @@
+"""Deploy the doctests' contracts under several hard forks.
+
+Run with `python -m src.forks --output forks.json`. The doctests run once
+on the usual chain, which compiles every snippet (through the artifact
+cache of src/matrix.py) and captures the transactions each of them sends,
+creation transactions with their constructor arguments included. Every
+fork gets a tester chain, in parallel processes, on which the fixture
+deployments of the chain image are sent first. Each doctest's transactions
+are then sent again up to its last deploy, recording whether all of its
+deploys succeeded and the gas they used. Nothing is compiled per fork.
+
+A deploy succeeding on a fork only means the creation code ran there
+without reverting: the bytecode is compiled for the compilers' default EVM
+target, and the deployed code is not called. The table is the deploy gas
+of each fork, not a check that the snippets work on it. A doctest whose
+deploys depend on state a fork can't reproduce, a call before them or a
+fixture failing there, is skipped on that fork rather than failed.
+
+The resulting table can be rendered into the page with
+`python -m src.main --forks forks.json`.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, cast
+
+from eth.vm.forks import (
+    ByzantiumVM,
+    ConstantinopleVM,
+    FrontierVM,
+    HomesteadVM,
+    IstanbulVM,
+    MuirGlacierVM,
+    PetersburgVM,
+    SpuriousDragonVM,
+    TangerineWhistleVM,
+)
+from eth_tester import EthereumTester, PyEVMBackend
+from eth_typing import HexStr
+from web3 import Web3, EthereumTesterProvider
+from web3.types import TxParams, TxReceipt
+
+from . import chain, verify
+from .cache import ArtifactStore
+from .conftest import use_compilers
+from .matrix import CACHE_DIR
+
+# Forks py-evm implements, oldest first
+FORKS = {
+    "frontier": FrontierVM,
+    "homestead": HomesteadVM,
+    "tangerine_whistle": TangerineWhistleVM,
+    "spurious_dragon": SpuriousDragonVM,
+    "byzantium": ByzantiumVM,
+    "constantinople": ConstantinopleVM,
+    "petersburg": PetersburgVM,
+    "istanbul": IstanbulVM,
+    "muir_glacier": MuirGlacierVM,
+}
+
+DEFAULT_FORKS = ["byzantium", "constantinople", "petersburg", "istanbul"]
+
+
+def sent_transactions(web3: Web3, first: int, last: int) -> List[dict]:
+    """Transactions of the blocks first to last, as they were sent."""
+    sent = []
+    for number in range(first, last + 1):
+        block = web3.eth.getBlock(number, full_transactions=True)
+        for transaction in cast(List[dict], block["transactions"]):
+            sent.append(
+                {
+                    "from": transaction["from"],
+                    # Empty for creation transactions
+                    "to": transaction["to"] or None,
+                    "data": transaction.get("data", transaction.get("input")),
+                    "value": transaction["value"],
+                }
+            )
+    return sent
+
+
+def collect_transactions(cache_dir: str = CACHE_DIR) -> dict:
+    """Run the doctests once, return the transactions building the chain
+    image and the ones each doctest deploying contracts sends."""
+    tests = verify.find_doctests(importlib.import_module("src.main"))
+    image = chain.load_image()
+    web3 = chain.load_web3(image)
+    fixtures = chain.fixture_contracts(web3, image)
+    tester: EthereumTester = web3.provider.ethereum_tester  # type: ignore
+    head = web3.eth.blockNumber
+    doctests = {}
+    store = ArtifactStore(cache_dir)
+    try:
+        with use_compilers(cache=store):
+            for test in tests.values():
+                snapshot = tester.take_snapshot()
+                try:
+                    verify.run_doctest(test, web3, fixtures)
+                    sent = sent_transactions(web3, head + 1, web3.eth.blockNumber)
+                finally:
+                    tester.revert_to_snapshot(snapshot)
+                if any(transaction["to"] is None for transaction in sent):
+                    doctests[test.name.rsplit(".", 1)[-1]] = sent
+    finally:
+        store.close()
+    return {
+        "setup": sent_transactions(web3, 1, head),
+        "fixtures": list(image["addresses"].values()),
+        "doctests": doctests,
+    }
+
+
+def fork_web3(fork: str) -> Web3:
+    """A fresh chain running a single fork from genesis.
+
+    >>> fork_web3("byzantium").eth.getBlock("latest").number
+    0
+    """
+    backend = PyEVMBackend(
+        genesis_parameters=PyEVMBackend._generate_genesis_params(
+            {"gas_limit": chain.LEAN_GAS_LIMIT}
+        ),
+        genesis_state=PyEVMBackend._generate_genesis_state(num_accounts=chain.ACCOUNTS),
+        vm_configuration=((0, FORKS[fork]),),
+    )
+    web3 = Web3(EthereumTesterProvider(EthereumTester(backend)))
+    web3.eth.defaultAccount = web3.eth.accounts[0]  # type: ignore
+    return web3
+
+
+def send(web3: Web3, transaction: dict) -> TxReceipt:
+    """Send a captured transaction again, from the same account."""
+    params: TxParams = {
+        "from": transaction["from"],
+        "data": HexStr(transaction["data"]),
+        "value": transaction["value"],
+    }
+    if transaction["to"] is not None:
+        params["to"] = transaction["to"]
+    return web3.eth.waitForTransactionReceipt(web3.eth.sendTransaction(params))
+
+
+def _depends_on(transactions: List[dict], addresses: List[str]) -> bool:
+    """Whether transactions call or pass any of the addresses."""
+    for transaction in transactions:
+        for address in addresses:
+            if transaction["to"] == address:
+                return True
+            if address[2:].lower() in (transaction["data"] or "").lower():
+                return True
+    return False
+
+
+def deploy_on_fork(fork: str, transactions: dict) -> Dict[str, dict]:
+    """Send every doctest's transactions on a chain of a fork, in a worker.
+
+    Every doctest starts from the fixtures of the chain image, its results
+    are whether all of its deploys succeeded, their total gas and the first
+    error, or why it was skipped."""
+    web3 = fork_web3(fork)
+    tester: EthereumTester = web3.provider.ethereum_tester  # type: ignore
+    missing = []
+    try:
+        for transaction in transactions["setup"]:
+            if not send(web3, transaction)["status"]:
+                raise RuntimeError("reverted")
+    except Exception as error:  # pylint: disable=broad-except
+        missing = [f"the fixtures failed to deploy: {str(error)[:100]}"]
+    results = {}
+    for name, sent in transactions["doctests"].items():
+        if missing and _depends_on(sent, transactions["fixtures"]):
+            results[name] = {"deployed": False, "gas": None, "skipped": missing[0]}
+            continue
+        last = max(i for i, transaction in enumerate(sent) if transaction["to"] is None)
+        result: dict = {"deployed": True, "gas": 0}
+        snapshot = tester.take_snapshot()
+        try:
+            for transaction in sent[: last + 1]:
+                if transaction["to"] is None:
+                    receipt = send(web3, transaction)
+                    result["gas"] += receipt["gasUsed"]
+                    if not receipt["status"]:
+                        raise RuntimeError("constructor reverted")
+                    continue
+                try:
+                    called = bool(send(web3, transaction)["status"])
+                except Exception:  # pylint: disable=broad-except
+                    called = False
+                if not called:
+                    skipped = "a call its deploys depend on failed"
+                    result = {"deployed": False, "gas": None, "skipped": skipped}
+                    break
+        except Exception as error:  # pylint: disable=broad-except
+            result = {"deployed": False, "gas": None, "error": str(error)[:200]}
+        finally:
+            tester.revert_to_snapshot(snapshot)
+        results[name] = result
+    return results
+
+
+def run_forks(
+    forks: List[str], jobs: Optional[int] = None, cache_dir: str = CACHE_DIR
+) -> dict:
+    """Deploy all doctests' contracts on all forks and return the table."""
+    if not forks:
+        raise ValueError("No forks to deploy on")
+    transactions = collect_transactions(cache_dir)
+    count = len(transactions["doctests"])
+    print(f"{count} doctests deploy contracts, compiled once")
+    columns: Dict[str, Dict[str, dict]] = {}
+    with ProcessPoolExecutor(
+        max_workers=jobs or min(len(forks), os.cpu_count() or 1)
+    ) as executor:
+        futures = {
+            executor.submit(deploy_on_fork, fork, transactions): fork for fork in forks
+        }
+        for future in as_completed(futures):
+            fork = futures[future]
+            columns[fork] = future.result()
+            results = columns[fork].values()
+            skipped = sum("skipped" in result for result in results)
+            failed = sum(not result["deployed"] for result in results) - skipped
+            print(
+                f"{fork}: {count - failed - skipped} deployed, {failed} failed, "
+                f"{skipped} skipped"
+            )
+    return {
+        "forks": forks,
+        # Columns are forks in the order they were given
+        "rows": {
+            name: {fork: columns[fork][name] for fork in forks}
+            for name in sorted(transactions["doctests"])
+        },
+    }
+
+
+def notes(table: dict) -> Dict[str, List[str]]:
+    """Deploy gas notes per fork for the code cells of every row, ✗ where a
+    deploy failed. Only the creation code ran, see the module docstring.
+
+    >>> notes({"rows": {"if_v": {
+    ...     "frontier": {"deployed": False, "gas": None, "skipped": "..."},
+    ...     "byzantium": {"deployed": False, "gas": None},
+    ...     "istanbul": {"deployed": True, "gas": 53012},
+    ... }}})
+    {'if_v': ['deploy gas frontier skipped · byzantium ✗ · istanbul 53,012']}
+    """
+    result = {}
+    for name, columns in table["rows"].items():
+        parts = []
+        for fork, deploy in columns.items():
+            if deploy["deployed"]:
+                parts.append(f"{fork} {deploy['gas']:,}")
+            else:
+                parts.append(f"{fork} {'skipped' if 'skipped' in deploy else '✗'}")
+        result[name] = ["deploy gas " + " · ".join(parts)]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--forks",
+        nargs="*",
+        default=DEFAULT_FORKS,
+        help=f"forks out of {', '.join(FORKS)}, default {' '.join(DEFAULT_FORKS)}",
+    )
+    parser.add_argument(
+        "--jobs", type=int, help="worker processes, default one per fork"
+    )
+    parser.add_argument("--output", default="forks.json", help="table JSON file")
+    args = parser.parse_args()
+
+    if not args.forks:
+        sys.exit(f"No forks given, py-evm has {', '.join(FORKS)}")
+    unknown = set(args.forks) - set(FORKS)
+    if unknown:
+        sys.exit(
+            f"Unknown forks {', '.join(sorted(unknown))}, py-evm has {', '.join(FORKS)}"
+        )
+    table = run_forks(args.forks, args.jobs)
+    with open(args.output, "w") as output_file:
+        json.dump(table, output_file, indent=2)
+    print(f"{len(table['rows'])} rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Split the rendered reference into per-section fragments.
+
+`python -m src.main --fragments DIR` writes
+
+- `DIR/sections/NN-name.html`, the table rows of every section,
+- `DIR/manifest.json`, listing the sections with their files and anchors,
+- `DIR/index.html`, a shell page containing the first section, which
+  loads the other sections as they get close to the viewport or when a
+  link points into them.
+"""
+
+import json
+import os
+import re
+from html import unescape
+from typing import List, Tuple
+
+from .html import rows
+
+# Name of the rows before the first table_section header
+FIRST_SECTION = "Overview"
+
+LOADER = """
+(function () {
+  var manifest = fetch("manifest.json").then(function (r) { return r.json(); });
+  function load(body) {
+    if (!body.dataset.src) { return Promise.resolve(); }
+    var src = body.dataset.src;
+    delete body.dataset.src;
+    return fetch(src).then(function (r) { return r.text(); }).then(function (rows) {
+      body.innerHTML = rows;
+    });
+  }
+  var observer = new IntersectionObserver(function (entries) {
+    entries.forEach(function (entry) {
+      if (entry.isIntersecting) { observer.unobserve(entry.target); load(entry.target); }
+    });
+  }, { rootMargin: "1000px" });
+  document.querySelectorAll("tbody[data-src]").forEach(function (body) {
+    observer.observe(body);
+  });
+  function reveal() {
+    var anchor = decodeURIComponent(location.hash.slice(1));
+    if (!anchor || document.getElementById(anchor)) { return; }
+    manifest.then(function (data) {
+      data.sections.forEach(function (section, number) {
+        if (section.anchors.indexOf(anchor) >= 0) {
+          load(document.getElementById("section-" + number)).then(function () {
+            document.getElementById(anchor).scrollIntoView();
+          });
+        }
+      });
+    });
+  }
+  window.addEventListener("hashchange", reveal);
+  reveal();
+})();
+"""
+
+
+def split_sections(page: str) -> List[Tuple[str, List[str]]]:
+    """Group the table rows of a rendered page by section.
+
+    The first row, holding the column headers, is left out."""
+    sections: List[Tuple[str, List[str]]] = [(FIRST_SECTION, [])]
+    for row in rows(page)[1:]:
+        header = re.search(r'<th colspan="3">(.*?)</th>', row, flags=re.S)
+        if header:
+            sections.append((unescape(header.group(1).strip()), []))
+        sections[-1][1].append(row)
+    return sections
+
+
+def _file_name(number: int, name: str) -> str:
+    slug = re.sub("[^a-z0-9]+", "-", name.lower()).strip("-")
+    return f"sections/{number:02}-{slug}.html"
+
+
+def write_fragments(page: str, directory: str):
+    r"""Write section fragments, their manifest and the shell page.
+
+    >>> import tempfile
+    >>> page = "\n".join([
+    ...     "<body><table>",
+    ...     "<tr><th>Solidity</th><th>Vyper</th></tr>",
+    ...     "<tr><td>intro</td></tr>",
+    ...     '<tr><th colspan="3">Data Types</th></tr>',
+    ...     '<tr><th id="int">int</th></tr>',
+    ...     "</table></body>",
+    ... ])
+    >>> directory = tempfile.mkdtemp()
+    >>> write_fragments(page, directory)
+    >>> sorted(os.listdir(directory)), sorted(os.listdir(f"{directory}/sections"))
+    (['index.html', 'manifest.json', 'sections'], ['00-overview.html', '01-data-types.html'])
+    >>> print(open(f"{directory}/sections/01-data-types.html").read(), end="")
+    <tr><th colspan="3">Data Types</th></tr>
+    <tr><th id="int">int</th></tr>
+    >>> with open(f"{directory}/manifest.json") as manifest_file:
+    ...     [(section["name"], section["file"], section["rows"], section["anchors"])
+    ...      for section in json.load(manifest_file)["sections"]]
+    [('Overview', 'sections/00-overview.html', 1, []), ('Data Types', 'sections/01-data-types.html', 2, ['int'])]
+
+    The shell page has the column headers and the first section inline,
+    the other sections are placeholders the loader fills in:
+
+    >>> shell = open(f"{directory}/index.html").read()
+    >>> print(shell[:shell.index("<script>")])
+    <body><table>
+    <tr><th>Solidity</th><th>Vyper</th></tr>
+    <tbody id="section-0">
+    <tr><td>intro</td></tr>
+    </tbody>
+    <tbody id="section-1" data-src="sections/01-data-types.html"></tbody>
+    </table>
+    """
+    os.makedirs(os.path.join(directory, "sections"), exist_ok=True)
+    sections = split_sections(page)
+    manifest = []
+    bodies = []
+    for number, (name, section_rows) in enumerate(sections):
+        file_name = _file_name(number, name)
+        fragment = "\n".join(section_rows) + "\n"
+        with open(os.path.join(directory, file_name), "w") as fragment_file:
+            fragment_file.write(fragment)
+        manifest.append(
+            {
+                "name": name,
+                "file": file_name,
+                "rows": len(section_rows),
+                "bytes": len(fragment.encode()),
+                "anchors": re.findall(r'<th id="([^"]+)"', fragment),
+            }
+        )
+        if number == 0:
+            bodies.append(f'<tbody id="section-0">\n{fragment}</tbody>')
+        else:
+            bodies.append(
+                f'<tbody id="section-{number}" data-src="{file_name}"></tbody>'
+            )
+    with open(os.path.join(directory, "manifest.json"), "w") as manifest_file:
+        json.dump({"sections": manifest}, manifest_file, indent=2)
+
+    # Keep everything around the table, the column headers and the first
+    # section, the other sections are loaded by the script
+    start = page.index("<table>") + len("<table>")
+    end = page.index("</table>")
+    header = rows(page)[0]
+    shell = (
+        page[:start]
+        + "\n"
+        + header
+        + "\n"
+        + "\n".join(bodies)
+        + "\n"
+        + page[end:].replace("</body>", f"<script>{LOADER}</script>\n</body>")
+    )
+    with open(os.path.join(directory, "index.html"), "w") as shell_file:
+        shell_file.write(shell)
@@ -0,0 +1,141 @@
+"""Build-time syntax highlighting for Solidity and Vyper code cells.
+
+Tokens are wrapped in `<span>` elements with short class names, styled by
+`STYLE`, so the published page needs no highlighting script.
+"""
+
+import hashlib
+import re
+from html import escape
+from typing import Dict, Pattern
+
+STYLE = """
+pre .c { color: #a0a1a7; font-style: italic; }
+pre .s { color: #50a14f; }
+pre .m { color: #986801; }
+pre .k { color: #a626a4; }
+pre .t { color: #0184bc; }
+pre .b { color: #c18401; }
+pre .d { color: #4078f2; }
+p.note { font-size: 0.8em; color: #696c77; }
+"""
+
+SOLIDITY_KEYWORDS = set(
+    """
+    abstract anonymous as assembly break calldata catch constant constructor
+    continue contract delete do else emit enum event external fallback false
+    for from function if immutable import indexed interface internal is let
+    library mapping memory modifier new override payable pragma private
+    public pure receive return returns revert storage struct true try type
+    unchecked using view virtual while
+""".split()
+)
+
+SOLIDITY_BUILTINS = set(
+    """
+    abi addmod assert block blockhash days ecrecover ether gasleft gwei
+    hours keccak256 minutes msg mulmod now require ripemd160 seconds
+    selfdestruct sha256 super this tx weeks wei years
+""".split()
+)
+
+SOLIDITY_TYPES = re.compile(
+    r"(u?int\d*|bytes\d*|u?fixed[\dx]*|address|bool|byte|string)"
+)
+
+VYPER_KEYWORDS = set(
+    """
+    and as assert break constant continue def elif else event False for from
+    implements import in indexed interface immutable log None not or pass
+    public raise return struct True
+""".split()
+)
+
+VYPER_BUILTINS = set(
+    """
+    as_wei_value block concat convert create_forwarder_to ecrecover empty
+    EMPTY_BYTES32 extract32 keccak256 len max MAX_DECIMAL MAX_INT128
+    MAX_UINT256 method_id min MIN_DECIMAL MIN_INT128 msg range raw_call self
+    selfdestruct send sha256 slice tx ZERO_ADDRESS ZERO_WEI
+""".split()
+)
+
+VYPER_TYPES = re.compile(
+    r"(u?int\d+|bytes\d+|Bytes|String|HashMap|DynArray|address|bool|decimal)"
+)
+
+SOLIDITY_TOKENS = re.compile(
+    r"""(?P<c>//[^\n]*|/\*.*?\*/)
+      |(?P<s>(?:hex|unicode)?(?:"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'))
+      |(?P<m>\b(?:0x[0-9a-fA-F]+|\d+(?:\.\d+)*(?:e\d+)?)\b)
+      |(?P<name>[A-Za-z_$][\w$]*)""",
+    re.S | re.X,
+)
+
+VYPER_TOKENS = re.compile(
+    r"""(?P<c>\#[^\n]*)
+      |(?P<s>[bB]?(?:\"\"\".*?\"\"\"|'''.*?'''|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'))
+      |(?P<d>@\w+)
+      |(?P<m>\b(?:0x[0-9a-fA-F]+|0b[01]+|\d+(?:\.\d+)*(?:e\d+)?)\b)
+      |(?P<name>[A-Za-z_]\w*)""",
+    re.S | re.X,
+)
+
+_LANGUAGES = {
+    "solidity": (
+        SOLIDITY_TOKENS,
+        SOLIDITY_KEYWORDS,
+        SOLIDITY_BUILTINS,
+        SOLIDITY_TYPES,
+    ),
+    "vyper": (VYPER_TOKENS, VYPER_KEYWORDS, VYPER_BUILTINS, VYPER_TYPES),
+}
+
+# Highlighted cells keyed by the hash of their language and content
+_CACHE: Dict[str, str] = {}
+
+
+def _span(css_class: str, token: str) -> str:
+    return f'<span class="{css_class}">{escape(token, quote=False)}</span>'
+
+
+def _classify(name: str, keywords, builtins, types: Pattern) -> str:
+    if name in keywords:
+        return "k"
+    if types.fullmatch(name):
+        return "t"
+    if name in builtins:
+        return "b"
+    return ""
+
+
+def _tokenize(source: str, language: str) -> str:
+    tokens, keywords, builtins, types = _LANGUAGES[language]
+    markup = []
+    position = 0
+    for match in tokens.finditer(source):
+        markup.append(escape(source[position : match.start()], quote=False))
+        token = match.group()
+        css_class = match.lastgroup
+        if css_class == "name":
+            css_class = _classify(token, keywords, builtins, types)
+        markup.append(
+            _span(css_class, token) if css_class else escape(token, quote=False)
+        )
+        position = match.end()
+    markup.append(escape(source[position:], quote=False))
+    return "".join(markup)
+
+
+def highlight(source: str, language: str) -> str:
+    """Highlight Solidity or Vyper source into escaped HTML markup.
+
+    >>> highlight("uint x = 0x52; // hex", "solidity")
+    '<span class="t">uint</span> x = <span class="m">0x52</span>; <span class="c">// hex</span>'
+    >>> highlight("@external\\ndef f(a: uint256) -> bool:", "vyper")
+    '<span class="d">@external</span>\\n<span class="k">def</span> f(a: <span class="t">uint256</span>) -&gt; <span class="t">bool</span>:'
+    """
+    key = hashlib.sha1(f"{language}\0{source}".encode()).hexdigest()
+    if key not in _CACHE:
+        _CACHE[key] = _tokenize(source, language)
+    return _CACHE[key]
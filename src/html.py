@@ -1,28 +1,116 @@
 """Tools for building the reference page."""
 
+import re
 from functools import wraps
+from typing import Dict, List, Optional, Set
 
+from yattag import Doc, indent
 
-def code(get_code):
-    """Add a code cell to a table, used as a decorator."""
+from .highlight import highlight
+from .search import SearchIndex
+
+# Languages of the code cells by function name suffix
+LANGUAGES = {"_s": "solidity", "_v": "vyper"}
+
+# Column headers, every other <th> labels a feature row
+COLUMNS = {"Feature", "Solidity", "Vyper"}
+
+
+class ReferenceDoc(Doc):
+    """Document keeping track of the section and row being rendered.
+
+    Feature rows get an anchor and everything rendered into them is added
+    to a search index in the same pass."""
+
+    def __init__(self, search_url: Optional[str] = None):
+        super().__init__()
+        self.search_url = search_url
+        self.index = SearchIndex()
+        self.row: Optional[str] = None
+        # Notes shown under code cells, keyed by the function name
+        self.notes: Dict[str, List[str]] = {}
+        self._anchors: Set[str] = set()
+
+    def _anchor(self, label: str) -> str:
+        base = re.sub("[^a-z0-9]+", "-", label.lower()).strip("-")
+        anchor = base
+        count = 1
+        while anchor in self._anchors:
+            count += 1
+            anchor = f"{base}-{count}"
+        self._anchors.add(anchor)
+        return anchor
+
+    def line(self, tag_name, text_content, *args, **kwargs):
+        if tag_name == "th" and text_content not in COLUMNS:
+            self.row = self._anchor(text_content)
+            kwargs.setdefault("id", self.row)
+            self.index.add_row(self.row, text_content)
+        super().line(tag_name, text_content, *args, **kwargs)
+
+    def section(self, name: str):
+        """Start a new section of the table."""
+        self.row = None
+        self.index.add_section(name)
+
+    def record(self, content: str):
+        """Make the content of a cell searchable."""
+        self.index.add_content(content)
+
+    def add_notes(self, notes: Dict[str, List[str]]):
+        """Add notes to show under the code cells of the named functions."""
+        for name, lines in notes.items():
+            self.notes.setdefault(name, []).extend(lines)
+
+
+def code(get_code, language=None):
+    """Add a code cell to a table, used as a decorator.
+
+    The code is highlighted as `language`, which defaults to the one the
+    suffix of the function name stands for."""
+    if language is None:
+        language = LANGUAGES.get(get_code.__name__[-2:])
 
     @wraps(get_code)
     def render(doc, tag, text):
+        content = get_code()
+        if isinstance(doc, ReferenceDoc):
+            doc.record(content)
         with tag("td"):
             with tag("pre"):
-                text(get_code())
+                if language is None:
+                    text(content)
+                else:
+                    doc.asis(highlight(content, language))
+            if isinstance(doc, ReferenceDoc):
+                for note in doc.notes.get(get_code.__name__, []):
+                    with tag("p", klass="note"):
+                        text(note)
 
     return render
 
 
+def code_s(get_code):
+    """Add a Solidity code cell to a table."""
+    return code(get_code, "solidity")
+
+
+def code_v(get_code):
+    """Add a Vyper code cell to a table."""
+    return code(get_code, "vyper")
+
+
 def comment(get_comment):
     """Add a comment cell to a table, used as a decorator."""
 
     @wraps(get_comment)
     def render(doc, tag, text):
+        content = get_comment()
+        if isinstance(doc, ReferenceDoc):
+            doc.record(content)
         with tag("td"):
             with tag("p"):
-                text(get_comment())
+                text(content)
 
     return render
 
@@ -38,6 +126,8 @@ def table_section(name):
     """New table header row."""
 
     def render(doc, tag, text, line):
+        if isinstance(doc, ReferenceDoc):
+            doc.section(name)
         with tag("tr"):
             with tag("th", colspan="3"):
                 text(name)
@@ -47,3 +137,25 @@ def table_section(name):
             line("th", "Vyper")
 
     return render
+
+
+def rows(page: str) -> List[str]:
+    """Split a rendered page into its table rows."""
+    return re.findall(r"^ *<tr>.*?</tr>$", page, flags=re.M | re.S)
+
+
+def prettify(page: str) -> str:
+    """Indent the HTML, leaving the contents of <pre> cells untouched."""
+    blocks: List[str] = []
+
+    def stash(match):
+        blocks.append(match.group(1))
+        return f"<pre>{len(blocks) - 1}</pre>"
+
+    stashed = re.sub("<pre>(.*?)</pre>", stash, page, flags=re.S)
+    indented = indent(stashed)
+    return re.sub(
+        "<pre>([0-9]+)</pre>",
+        lambda match: f"<pre>{blocks[int(match.group(1))]}</pre>",
+        indented,
+    )
@@ -0,0 +1,104 @@
+"""Rewrite only the changed rows of a rendered output file.
+
+A sidecar `<output>.index.json` keeps the byte offset, length and hash of
+every row of the last written output, and of the markup between rows.
+Chunks that changed but kept their length are patched in place, from the
+first chunk that changed length on the file is rewritten and truncated.
+If the file was changed by anything else since, it is written in full.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import List, Tuple
+
+from .cache import write_atomic
+
+ROW = re.compile(rb"^ *<tr>.*?</tr>$", re.M | re.S)
+
+# Offset, length and hash of a chunk of the output
+Chunk = Tuple[int, int, str]
+
+
+def chunks(data: bytes) -> List[Chunk]:
+    """Split output into rows and the markup between them.
+
+    >>> [length for _, length, _ in chunks(b"<table>\\n<tr>a</tr>\\n</table>")]
+    [8, 10, 9]
+    """
+    bounds = [0]
+    for match in ROW.finditer(data):
+        bounds.extend(match.span())
+    bounds.append(len(data))
+    return [
+        (start, end - start, hashlib.sha1(data[start:end]).hexdigest()[:16])
+        for start, end in zip(bounds, bounds[1:])
+    ]
+
+
+def _index_path(path: str) -> str:
+    return path + ".index.json"
+
+
+def _read_index(path: str) -> List[Chunk]:
+    """Chunks of the last write, empty if the file changed since."""
+    try:
+        with open(_index_path(path)) as index_file:
+            index = json.load(index_file)
+        status = os.stat(path)
+    except (OSError, ValueError):
+        return []
+    if [status.st_size, status.st_mtime_ns] != [index["size"], index["mtime_ns"]]:
+        return []
+    return [tuple(chunk) for chunk in index["chunks"]]  # type: ignore
+
+
+def write_incremental(data: bytes, path: str) -> int:
+    """Bring the file at path to data, return the number of bytes written.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "index.html")
+    >>> page = b"<table>\\n<tr>one</tr>\\n<tr>two</tr>\\n</table>\\n"
+    >>> write_incremental(page, path)
+    43
+    >>> write_incremental(page.replace(b"one", b"1!!"), path)
+    12
+    >>> write_incremental(page.replace(b"one", b"1"), path)
+    33
+    >>> open(path, "rb").read() == page.replace(b"one", b"1")
+    True
+    """
+    old = _read_index(path)
+    new = chunks(data)
+    if not old:
+        with open(path, "wb") as output:
+            output.write(data)
+        written = len(data)
+    else:
+        written = 0
+        with open(path, "r+b") as output:
+            rewrite_from = None
+            for index, chunk in enumerate(new):
+                previous = old[index] if index < len(old) else None
+                if previous == chunk:
+                    continue
+                if previous is not None and previous[:2] == chunk[:2]:
+                    # Same place and length, only the content changed
+                    output.seek(chunk[0])
+                    output.write(data[chunk[0] : chunk[0] + chunk[1]])
+                    written += chunk[1]
+                    continue
+                rewrite_from = chunk[0]
+                break
+            if rewrite_from is None and len(old) > len(new):
+                rewrite_from = len(data)
+            if rewrite_from is not None:
+                output.seek(rewrite_from)
+                output.write(data[rewrite_from:])
+                output.truncate()
+                written += len(data) - rewrite_from
+    status = os.stat(path)
+    sidecar = {"size": status.st_size, "mtime_ns": status.st_mtime_ns, "chunks": new}
+    write_atomic(_index_path(path), json.dumps(sidecar).encode())
+    return written
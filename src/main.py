@@ -1,9 +1,30 @@
 """Create the reference."""
 
-from yattag import Doc, indent
-import sh
-
-from .html import code, comment, empty, table_section
+import argparse
+import json
+import os
+from typing import Optional
+
+
+from .fragments import write_fragments
+from .highlight import STYLE
+from .incremental import write_incremental
+from .html import (
+    code,
+    code_s,
+    code_v,
+    comment,
+    empty,
+    prettify,
+    table_section,
+    ReferenceDoc,
+)
+from .forks import notes as fork_notes
+from .matrix import notes as compat_notes
+from .profiling import PhaseProfiler
+from .search import SCRIPT as SEARCH_SCRIPT
+from .storage import notes as storage_notes
+from .sweep import notes as sweep_notes
 from .conftest import (
     check_local_v,
     check_local_s,
@@ -16,15 +37,17 @@ from .conftest import (
     check_global_constructor_s,
     check_compiles_s,
     check_compiles_v,
+    compiler_version,
+    deploy_named_s,
+    deploy_v,
 )
-import solc
 
 
 @code
 def version_s():
     """
-    >>> str(sh.solc("--version"))[50:64]
-    'Version: 0.7.0'
+    >>> compiler_version("solc")
+    '0.7.0'
     """
     return """$ solc --version
 Version: 0.7.0"""
@@ -33,7 +56,7 @@ Version: 0.7.0"""
 @code
 def version_v():
     """
-    >>> str(sh.vyper("--version"))[:5]
+    >>> compiler_version("vyper")
     '0.2.4'
     """
     return """$ vyper --version
@@ -223,6 +246,16 @@ def min_max_v():
     return "max(x, y)"
 
 
+@code
+def integer_division_s():
+    return "/"
+
+
+@code
+def integer_division_v():
+    return "/"
+
+
 @code
 def binary_hex_literals_s():
     r"""
@@ -421,6 +454,7 @@ def string_concatenation_v():
 def array_literal_s():
     r"""
     >>> check_local_s(web3, "uint8[3] memory a = [1, 2, 3]; a[0] = 2; require(a.length == 3);")
+    >>> check_global_s(web3, "uint8[3] a;")
     """
     return "[1, 2, 3]"
 
@@ -429,6 +463,7 @@ def array_literal_s():
 def array_literal_v():
     r"""
     >>> check_local_v(web3, "a: uint256[3] = [1, 2, 3]\na[0] = 2")
+    >>> check_global_v(web3, "a: uint256[3]")
     """
     return "[1, 2, 3]"
 
@@ -437,6 +472,7 @@ def array_literal_v():
 def struct_s():
     r"""
     >>> check_s(web3, "struct Pair { uint x; uint y; }", "Pair memory pair = Pair(2, 3); require(pair.y > pair.x);")
+    >>> check_global_s(web3, "struct Pair { uint x; uint y; }\nPair pair;")
     """
     return """struct Pair {
     uint x;
@@ -451,6 +487,7 @@ require(pair.y > pair.x);  // Accessing elements"""
 def struct_v():
     r"""
     >>> check_v(web3, "struct Pair:\n  x: uint256\n  y: uint256", "pair: Pair = Pair({x: 2, y: 3})\nassert pair.y > pair.x")
+    >>> check_global_v(web3, "struct Pair:\n  x: uint256\n  y: uint256\npair: Pair")
     """
     return """struct Pair:
     x: uint256
@@ -468,6 +505,32 @@ def mapping_delete_v():
     return "m[2] = empty(uint256)"
 
 
+@comment
+def out_of_bounds_s():
+    return "Failing assertion"
+
+
+@comment
+def out_of_bounds_v():
+    return "Failing assertion"
+
+
+@comment
+def missing_key_s():
+    return (
+        "A mapping has no concept of set keys, a mapping always refers to a "
+        "hashed value that is the same for a given mapping and key"
+    )
+
+
+@comment
+def missing_key_v():
+    return (
+        "A mapping has no concept of set keys, a mapping always refers to a "
+        "hashed value that is the same for a given mapping and key"
+    )
+
+
 @code
 def immutable_s():
     r"""
@@ -579,14 +642,93 @@ def do_while_s():
 } while (a > 0);"""
 
 
+@code
+def create2_s():
+    r"""
+    >>> factory = deploy_named_s(web3, '''
+    ...     contract Caller {
+    ...         address target;
+    ...         constructor(address t) public { target = t; }
+    ...     }
+    ...     contract Factory {
+    ...         function create(bytes32 salt, address target) public returns (address) {
+    ...             Caller c = new Caller{salt: salt}(target);
+    ...             return address(c);
+    ...         }
+    ...     }\n''', "Factory")
+    >>> create = factory.functions.create(b"\x01" * 32, fixtures["target"].address)
+    >>> created = create.call()
+    >>> _ = create.transact()
+    >>> web3.eth.getCode(created) != b""
+    True
+    """
+    return "Contract c = new Contract{salt: salt}(args);"
+
+
+@code
+def create_forwarder_v():
+    r"""
+    >>> factory = deploy_v(web3, '''
+    ... @external
+    ... def new_forwarder(other_contract: address) -> address:
+    ...     return create_forwarder_to(other_contract)
+    ... ''')
+    >>> target = fixtures["target"]
+    >>> created = factory.functions.new_forwarder(target.address).call()
+    >>> _ = factory.functions.new_forwarder(target.address).transact()
+    >>> forwarder = web3.eth.contract(address=created, abi=target.abi)
+    >>> _ = forwarder.functions.ping().transact()
+    >>> forwarder.functions.calls().call(), target.functions.calls().call()
+    (1, 0)
+    """
+    return "contract: address = create_forwarder_to(other_contract, value)"
+
+
+@code
+def selfdestruct_s():
+    r"""
+    >>> doomed = deploy_named_s(web3, '''
+    ...     contract Doomed {
+    ...         function destroy(address payable refundAddr) public payable {
+    ...             selfdestruct(refundAddr);
+    ...         }
+    ...     }\n''', "Doomed")
+    >>> target = fixtures["target"].address
+    >>> _ = doomed.functions.destroy(target).transact({"value": 10})
+    >>> web3.eth.getBalance(target), web3.eth.getCode(doomed.address)
+    (10, HexBytes('0x'))
+    """
+    return "selfdestruct(refundAddr)"
+
+
+@code
+def selfdestruct_v():
+    r"""
+    >>> doomed = deploy_v(web3, '''
+    ... @payable
+    ... @external
+    ... def destroy(refund_addr: address):
+    ...     selfdestruct(refund_addr)
+    ... ''')
+    >>> target = fixtures["target"].address
+    >>> _ = doomed.functions.destroy(target).transact({"value": 10})
+    >>> web3.eth.getBalance(target), web3.eth.getCode(doomed.address)
+    (10, HexBytes('0x'))
+    """
+    return "selfdestruct(refund_addr)"
+
+
 @code
 def exceptions_s():
     r"""
-    >>> check_named_contract_s(web3, '''
+    >>> feed = fixtures["data_feed"]
+    >>> _ = feed.functions.setData(feed.address, 42).transact()
+    >>> consumer = deploy_named_s(web3, '''
     ...     interface DataFeed { function getData(address token) external returns (uint value); }
     ...     contract FeedConsumer {
     ...         DataFeed feed;
     ...         uint errorCount;
+    ...         constructor(DataFeed f) public { feed = f; }
     ...         function rate(address token) public returns (uint value, bool success) {
     ...             require(errorCount < 10);
     ...             try feed.getData(token) returns (uint v) {
@@ -599,7 +741,9 @@ def exceptions_s():
     ...                 return (0, false);
     ...             }
     ...         }
-    ...     }\n''', "FeedConsumer")
+    ...     }\n''', "FeedConsumer", feed.address)
+    >>> consumer.functions.rate(feed.address).call()
+    [42, True]
     """
     return """
 interface DataFeed { function getData(address token) external returns (uint value); }
@@ -630,15 +774,32 @@ contract FeedConsumer {
 }"""
 
 
-def render() -> str:
-    """Render the final page."""
-    doc, tag, text, line = Doc().ttl()
+def render(reference: Optional[ReferenceDoc] = None) -> str:
+    """Render the final page.
+
+    Pass a ReferenceDoc to get at the search index built along the way."""
+    if reference is None:
+        reference = ReferenceDoc()
+    doc, tag, text, line = reference.ttl()
     trip = [doc, tag, text]
     quad = [doc, tag, text, line]
 
     # Final reference doc
     with tag("html"):
+        with tag("head"):
+            with tag("style"):
+                doc.asis(STYLE)
         with tag("body"):
+            if reference.search_url:
+                doc.stag(
+                    "input",
+                    ("data-index", reference.search_url),
+                    type="search",
+                    id="search",
+                    placeholder="Search features",
+                )
+                with tag("ul", id="search-results"):
+                    pass
             with tag("table"):
                 with tag("tr"):
                     line("th", "Feature")
@@ -654,20 +815,20 @@ def render() -> str:
                     syntax_v(*trip)
                 with tag("tr"):
                     line("th", "Block delimiters")
-                    code(lambda: "{ }")(*trip)
-                    code(lambda: ":  # Vyper uses Python's off-side rule")(*trip)
+                    code_s(lambda: "{ }")(*trip)
+                    code_v(lambda: ":  # Vyper uses Python's off-side rule")(*trip)
                 with tag("tr"):
                     line("th", "Statement separator")
-                    code(lambda: ";")(*trip)
-                    code(lambda: "'\\n' and :")(*trip)
+                    code_s(lambda: ";")(*trip)
+                    code_v(lambda: "'\\n' and :")(*trip)
                 with tag("tr"):
                     line("th", "End of line comment")
-                    code(lambda: "// comment")(*trip)
-                    code(lambda: "# comment")(*trip)
+                    code_s(lambda: "// comment")(*trip)
+                    code_v(lambda: "# comment")(*trip)
                 with tag("tr"):
                     line("th", "Multiple line comment")
-                    code(lambda: "/* multiple line\ncomment */")(*trip)
-                    code(lambda: "# Multiple line\n# comment")(*trip)
+                    code_s(lambda: "/* multiple line\ncomment */")(*trip)
+                    code_v(lambda: "# Multiple line\n# comment")(*trip)
                 with tag("tr"):
                     line("th", "Constant")
                     constant_s(*trip)
@@ -687,7 +848,7 @@ def render() -> str:
                 with tag("tr"):
                     line("th", "Compound assignment")
                     compound_assignment_s(*trip)
-                    code(lambda: "-=, *=, /=, %=, |=, &=, ^=")(*trip)
+                    code_v(lambda: "-=, *=, /=, %=, |=, &=, ^=")(*trip)
                 with tag("tr"):
                     line("th", "Increment and decrement")
                     increment_decrement_s(*trip)
@@ -716,28 +877,26 @@ def render() -> str:
                 table_section("Contract lifecycle")(*quad)
                 with tag("tr"):
                     line("th", "Contract creation")
-                    code(lambda: "Contract c = new Contract(args);")(*trip)
+                    code_s(lambda: "Contract c = new Contract(args);")(*trip)
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Contract creation with funding")
-                    code(lambda: "Contract c = new Contract{value: amount}(args);")(
+                    code_s(lambda: "Contract c = new Contract{value: amount}(args);")(
                         *trip
                     )
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Salted contract creation (CREATE2)")
-                    code(lambda: "Contract c = new Contract{salt: salt}(args);")(*trip)
+                    create2_s(*trip)
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Create forwarder contract")
                     empty(*trip)
-                    code(
-                        lambda: "contract: address = create_forwarder_to(other_contract, value)"
-                    )(*trip)
+                    create_forwarder_v(*trip)
                 with tag("tr"):
                     line("th", "Selfdestruct (Avoid)")
-                    code(lambda: "selfdestruct(refundAddr)")(*trip)
-                    code(lambda: "selfdestruct(refund_addr)")(*trip)
+                    selfdestruct_s(*trip)
+                    selfdestruct_v(*trip)
 
                 table_section("Interfaces")(*quad)
                 with tag("tr"):
@@ -756,32 +915,32 @@ def render() -> str:
                     true_false_v(*trip)
                 with tag("tr"):
                     line("th", "Falsehoods")
-                    code(lambda: "false")(*trip)
-                    code(lambda: "False")(*trip)
+                    code_s(lambda: "false")(*trip)
+                    code_v(lambda: "False")(*trip)
                 with tag("tr"):
                     line("th", "Logical operators")
-                    code(lambda: "&& || !")(*trip)
-                    code(lambda: "and or not")(*trip)
+                    code_s(lambda: "&& || !")(*trip)
+                    code_v(lambda: "and or not")(*trip)
                 with tag("tr"):
                     line("th", "Relational operators")
-                    code(lambda: "== != < > <= =>")(*trip)
-                    code(lambda: "== != < > <= =>")(*trip)
+                    code_s(lambda: "== != < > <= =>")(*trip)
+                    code_v(lambda: "== != < > <= =>")(*trip)
                 with tag("tr"):
                     line("th", "Min and max")
                     empty(*trip)
                     min_max_v(*trip)
                 with tag("tr"):
                     line("th", "Arithmetic operators")
-                    code(lambda: "+ - * / % ** unary-")(*trip)
-                    code(lambda: "+ - * / % ** unary-")(*trip)
+                    code_s(lambda: "+ - * / % ** unary-")(*trip)
+                    code_v(lambda: "+ - * / % ** unary-")(*trip)
                 with tag("tr"):
                     line("th", "Integer division")
-                    code(lambda: "/")(*trip)
-                    code(lambda: "/")(*trip)
+                    integer_division_s(*trip)
+                    integer_division_v(*trip)
                 with tag("tr"):
                     line("th", "Bit operators")
-                    code(lambda: "<< >> & | ^ ~")(*trip)
-                    code(lambda: "<< >> & | ^ ~")(*trip)
+                    code_s(lambda: "<< >> & | ^ ~")(*trip)
+                    code_v(lambda: "<< >> & | ^ ~")(*trip)
                 with tag("tr"):
                     line("th", "Binary & hex literals")
                     binary_hex_literals_s(*trip)
@@ -833,31 +992,31 @@ def render() -> str:
                     array_literal_v(*trip)
                 with tag("tr"):
                     line("th", "Length")
-                    code(lambda: "a.length")(*trip)
-                    code(lambda: "len(a)")(*trip)
+                    code_s(lambda: "a.length")(*trip)
+                    code_v(lambda: "len(a)")(*trip)
                 with tag("tr"):
                     line("th", "Empty test")
-                    code(lambda: "a.length == 0")(*trip)
+                    code_s(lambda: "a.length == 0")(*trip)
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Lookup")
-                    code(lambda: "a[0]")(*trip)
-                    code(lambda: "a[0]")(*trip)
+                    code_s(lambda: "a[0]")(*trip)
+                    code_v(lambda: "a[0]")(*trip)
                 with tag("tr"):
                     line("th", "Update")
-                    code(lambda: "a[0] = 1;")(*trip)
-                    code(lambda: "a[0] = 1")(*trip)
+                    code_s(lambda: "a[0] = 1;")(*trip)
+                    code_v(lambda: "a[0] = 1")(*trip)
                 with tag("tr"):
                     line("th", "Out of bounds access")
-                    comment(lambda: "Failing assertion")(*trip)
-                    comment(lambda: "Failing assertion")(*trip)
+                    out_of_bounds_s(*trip)
+                    out_of_bounds_v(*trip)
                 with tag("tr"):
                     line("th", "Add new element")
-                    code(lambda: "a.push(3);  # Dynamic arrays")(*trip)
+                    code_s(lambda: "a.push(3);  # Dynamic arrays")(*trip)
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Remove element")
-                    code(lambda: "a.pop();  # Dynamic arrays")(*trip)
+                    code_s(lambda: "a.pop();  # Dynamic arrays")(*trip)
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Struct")
@@ -869,23 +1028,19 @@ def render() -> str:
                     comment(lambda: "Impossible to know")(*trip)
                 with tag("tr"):
                     line("th", "Lookup")
-                    code(lambda: "m[2]")(*trip)
-                    code(lambda: "m[2]")(*trip)
+                    code_s(lambda: "m[2]")(*trip)
+                    code_v(lambda: "m[2]")(*trip)
                 with tag("tr"):
                     line("th", "Update")
-                    code(lambda: "m[2] = 1;")(*trip)
-                    code(lambda: "m[2] = 1")(*trip)
+                    code_s(lambda: "m[2] = 1;")(*trip)
+                    code_v(lambda: "m[2] = 1")(*trip)
                 with tag("tr"):
                     line("th", "Missing key behaviour")
-                    comment(
-                        lambda: "A mapping has no concept of set keys, a mapping always refers to a hashed value that is the same for a given mapping and key"
-                    )(*trip)
-                    comment(
-                        lambda: "A mapping has no concept of set keys, a mapping always refers to a hashed value that is the same for a given mapping and key"
-                    )(*trip)
+                    missing_key_s(*trip)
+                    missing_key_v(*trip)
                 with tag("tr"):
                     line("th", "Delete key")
-                    code(lambda: "m[2] = 0;")(*trip)
+                    code_s(lambda: "m[2] = 0;")(*trip)
                     mapping_delete_v(*trip)
                 with tag("tr"):
                     line("th", "Immutable variables")
@@ -902,12 +1057,12 @@ def render() -> str:
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Invoke function")
-                    code(lambda: "add2(x, y)")(*trip)
-                    code(lambda: "add2(x, y)")(*trip)
+                    code_s(lambda: "add2(x, y)")(*trip)
+                    code_v(lambda: "add2(x, y)")(*trip)
                 with tag("tr"):
                     line("th", "External function calls")
-                    code(lambda: "c.f{gas: 1000, value: 4 ether}()")(*trip)
-                    code(
+                    code_s(lambda: "c.f{gas: 1000, value: 4 ether}()")(*trip)
+                    code_v(
                         lambda: "c.f()\nraw_call(address, data, outsize, gas, value, is_delegate_call)"
                     )(*trip)
                 table_section("Control flow")(*quad)
@@ -929,28 +1084,28 @@ def render() -> str:
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Return value")
-                    code(lambda: "return x + y;")(*trip)
-                    code(lambda: "return x + y")(*trip)
+                    code_s(lambda: "return x + y;")(*trip)
+                    code_v(lambda: "return x + y")(*trip)
                 with tag("tr"):
                     line("th", "Break")
-                    code(lambda: "break;")(*trip)
-                    code(lambda: "break")(*trip)
+                    code_s(lambda: "break;")(*trip)
+                    code_v(lambda: "break")(*trip)
                 with tag("tr"):
                     line("th", "Continue")
-                    code(lambda: "continue;")(*trip)
-                    code(lambda: "continue")(*trip)
+                    code_s(lambda: "continue;")(*trip)
+                    code_v(lambda: "continue")(*trip)
                 with tag("tr"):
                     line("th", "Assert")
-                    code(lambda: "assert(x > y);")(*trip)
-                    code(lambda: "assert x > y")(*trip)
+                    code_s(lambda: "assert(x > y);")(*trip)
+                    code_v(lambda: "assert x > y")(*trip)
                 with tag("tr"):
                     line("th", "Require")
-                    code(lambda: "require(x > y);")(*trip)
+                    code_s(lambda: "require(x > y);")(*trip)
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Revert")
-                    code(lambda: 'require(false, "revert reason")')(*trip)
-                    code(lambda: 'raise "revert reason"')(*trip)
+                    code_s(lambda: 'require(false, "revert reason")')(*trip)
+                    code_v(lambda: 'raise "revert reason"')(*trip)
                 with tag("tr"):
                     line("th", "Exception handling")
                     exceptions_s(*trip)
@@ -958,7 +1113,7 @@ def render() -> str:
                 table_section("Misc")(*quad)
                 with tag("tr"):
                     line("th", "Comments")
-                    code(
+                    code_s(
                         lambda: """NatSpec conventions for functions:
 
 /// @author Mary A. Botanist
@@ -976,7 +1131,7 @@ Special inheritance syntax for contracts:
 
 /// @inheritdoc OtherContract"""
                     )(*trip)
-                    code(
+                    code_v(
                         lambda: """def foo():
     \"\"\"
     @author Mary A. Botanist
@@ -989,21 +1144,21 @@ Special inheritance syntax for contracts:
                     )(*trip)
                 with tag("tr"):
                     line("th", "Payment with error on failure (Avoid for Solidity)")
-                    code(lambda: "address.transfer()")(*trip)
-                    code(lambda: "send(address, value)")(*trip)
+                    code_s(lambda: "address.transfer()")(*trip)
+                    code_v(lambda: "send(address, value)")(*trip)
                 with tag("tr"):
                     line("th", "Payment with false on failure (Avoid for Solidity)")
-                    code(lambda: "address.send()")(*trip)
+                    code_s(lambda: "address.send()")(*trip)
                     empty(*trip)
                 with tag("tr"):
                     line("th", "Payment with gas forwarding (WARNING)")
                     empty(*trip)
-                    code(
+                    code_v(
                         lambda: "raw_call(address, data, outsize, gas, value, is_delegate_call)"
                     )(*trip)
                 with tag("tr"):
                     line("th", "Event logging")
-                    code(
+                    code_s(
                         lambda: """event Deposit(
     address indexed _from,
     bytes32 indexed _id,
@@ -1012,7 +1167,7 @@ Special inheritance syntax for contracts:
 
 emit Deposit(msg.sender, _id, msg.value);"""
                     )(*trip)
-                    code(
+                    code_v(
                         lambda: """event Deposit:
     _from: indexed(address)
     _id: indexed(bytes32)
@@ -1022,7 +1177,7 @@ log Deposit(msg.sender, _id, msg.value)"""
                     )(*trip)
                 with tag("tr"):
                     line("th", "Units, global constants and type ranges")
-                    code(
+                    code_s(
                         lambda: """1 ether
 1 wei
 1 gwei
@@ -1038,7 +1193,7 @@ type(int8).min
 type(int8).max
 ..."""
                     )(*trip)
-                    code(
+                    code_v(
                         lambda: """ZERO_ADDRESS
 as_wei_value(1, "finney")
 as_wei_value(1, "szabo")
@@ -1055,7 +1210,7 @@ ZERO_WEI"""
                     )(*trip)
                 with tag("tr"):
                     line("th", "Block and transaction properties")
-                    code(
+                    code_s(
                         lambda: """blockhash(blockNumber)
 block.coinbase
 block.difficulty
@@ -1073,7 +1228,7 @@ msg.value
 tx.gasprice
 tx.origin"""
                     )(*trip)
-                    code(
+                    code_v(
                         lambda: """blockhash(blockNumber)
 block.coinbase
 block.difficulty
@@ -1092,10 +1247,90 @@ msg.value
 tx.origin"""
                     )(*trip)
 
+            if reference.search_url:
+                with tag("script"):
+                    doc.asis(SEARCH_SCRIPT)
+
     # Prettify the HTML
     unindented = doc.getvalue()
-    return indent(unindented)
+    return prettify(unindented)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the reference page.")
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="write a pstats dump and collapsed stacks of render() to DIR",
+    )
+    parser.add_argument(
+        "--search-index",
+        metavar="PATH",
+        help="write the search index to PATH and add a search box loading it",
+    )
+    parser.add_argument(
+        "--fragments",
+        metavar="DIR",
+        help="also write per-section fragments and a shell page loading them to DIR",
+    )
+    parser.add_argument(
+        "--compat",
+        metavar="PATH",
+        help="show the compiler compatibility grid from src.matrix in PATH",
+    )
+    parser.add_argument(
+        "--forks",
+        metavar="PATH",
+        help="show the deploy gas per fork from src.forks in PATH",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="PATH",
+        help="write the page to PATH instead of stdout, rewriting changed rows only",
+    )
+    parser.add_argument(
+        "--storage",
+        metavar="PATH",
+        help="show storage footprints from a pytest --storage report in PATH",
+    )
+    parser.add_argument(
+        "--sweep",
+        metavar="PATH",
+        help="show the optimizer deploy gas and size curves from src.sweep in PATH",
+    )
+    args = parser.parse_args()
+
+    search_url = os.path.basename(args.search_index) if args.search_index else None
+    reference = ReferenceDoc(search_url)
+    if args.compat:
+        with open(args.compat) as compat_file:
+            reference.add_notes(compat_notes(json.load(compat_file)))
+    if args.forks:
+        with open(args.forks) as forks_file:
+            reference.add_notes(fork_notes(json.load(forks_file)))
+    if args.storage:
+        with open(args.storage) as storage_file:
+            reference.add_notes(storage_notes(json.load(storage_file)))
+    if args.sweep:
+        with open(args.sweep) as sweep_file:
+            reference.add_notes(sweep_notes(json.load(sweep_file)))
+    if args.profile:
+        profiler = PhaseProfiler(args.profile)
+        with profiler.track("render"):
+            page = render(reference)
+        profiler.dump()
+    else:
+        page = render(reference)
+    if args.search_index:
+        with open(args.search_index, "w") as index_file:
+            index_file.write(reference.index.serialize())
+    if args.fragments:
+        write_fragments(page, args.fragments)
+    if args.output:
+        write_incremental((page + "\n").encode(), args.output)
+    else:
+        print(page)
 
 
 if __name__ == "__main__":
-    print(render())
+    main()
@@ -0,0 +1,237 @@
+"""Run the doctests against every locally available compiler version.
+
+Run with `python -m src.matrix --output matrix.json`. Solidity doctests run
+against each solc version and Vyper doctests against each vyper version,
+in parallel processes sharing one artifact cache, so a snippet is compiled
+once per version. Compilers are taken from the registry of src/compilers.py,
+found on the PATH as `solc`, `vyper`, `solc-<version>` or `vyper-<version>`,
+plus the installed vyper package.
+
+The resulting grid can be rendered into the page with
+`python -m src.main --compat matrix.json`.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import chain, verify
+from .cache import ArtifactStore
+from .compilers import EXECUTABLE, probe_version, registry, version_key
+from .concurrency import (
+    Controller,
+    Limiter,
+    ResourceLimits,
+    add_limit_arguments,
+    limit_phases,
+    limits_from_arguments,
+)
+from .conftest import PHASE_HOOKS, package_vyper_version, use_compilers
+
+CACHE_DIR = ".cache/artifacts"
+
+# Compiler a doctest is run against, by function name suffix
+KINDS = {"_s": "solc", "_v": "vyper"}
+
+
+def find_compilers() -> Dict[str, Dict[str, Optional[str]]]:
+    """Available compiler executables by kind and version.
+
+    The installed vyper package is listed with None as its executable."""
+    found: Dict[str, Dict[str, Optional[str]]] = {"solc": {}, "vyper": {}}
+    package_version = package_vyper_version()
+    if package_version:
+        found["vyper"][package_version] = None
+    compilers = registry()
+    for kind in found:
+        for version in compilers.versions(kind):
+            found[kind].setdefault(version, compilers.path(kind, version))
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        try:
+            entries = sorted(os.listdir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            match = EXECUTABLE.match(entry)
+            path = os.path.join(directory, entry)
+            if not match or not os.access(path, os.X_OK):
+                continue
+            kind, named = match.groups()
+            executable_version: Optional[str] = named or probe_version(path)
+            if executable_version:
+                found[kind].setdefault(executable_version, path)
+    return found
+
+
+_TESTS: dict = {}
+
+# Store of a worker process by directory, its mapping is reused across jobs
+_STORES: Dict[str, ArtifactStore] = {}
+
+
+def _init_worker(limiters: Dict[str, Limiter], hooks: Tuple[Callable, ...]):
+    """Share the compile and deploy limits of the controller, add hooks."""
+    PHASE_HOOKS.extend([limit_phases(limiters), *hooks])
+
+
+def worker_pool(controller: Controller, *hooks: Callable) -> ProcessPoolExecutor:
+    """Worker processes for run_job, sized by the controller and sharing its
+    limits. The phase hooks are added in every worker."""
+    return ProcessPoolExecutor(
+        max_workers=controller.workers,
+        initializer=_init_worker,
+        initargs=(controller.limiters, hooks),
+    )
+
+
+def run_job(name: str, cache_dir: str, **compilers) -> Tuple[bool, str]:
+    """Run one doctest in a worker on a fresh chain, return (passed, report).
+
+    The compilers are selected by the keyword arguments of use_compilers,
+    artifacts are shared through the store in cache_dir."""
+    if not _TESTS:
+        _TESTS.update(verify.find_doctests(importlib.import_module("src.main")))
+    if cache_dir not in _STORES:
+        _STORES[cache_dir] = ArtifactStore(cache_dir)
+    image = chain.load_image()
+    web3 = chain.load_web3(image)
+    fixtures = chain.fixture_contracts(web3, image)
+    with use_compilers(cache=_STORES[cache_dir], **compilers):
+        return verify.run_doctest(_TESTS[name], web3, fixtures)
+
+
+def _run_job(
+    name: str,
+    kind: str,
+    executable: Optional[str],
+    cache_dir: str,
+    limits: Optional[ResourceLimits] = None,
+) -> Tuple[bool, str]:
+    """Run one doctest with one compiler in a worker."""
+    return run_job(
+        name,
+        cache_dir,
+        solc=executable if kind == "solc" else None,
+        vyper=executable if kind == "vyper" else None,
+        limits=limits,
+    )
+
+
+def run_matrix(
+    compilers: Dict[str, Dict[str, Optional[str]]],
+    jobs: Optional[int] = None,
+    cache_dir: str = CACHE_DIR,
+    limits: Optional[ResourceLimits] = None,
+) -> dict:
+    """Run all doctests against all compilers and return the grid.
+
+    Without a number of jobs, the workers are sized to the cores and memory
+    and the compile and deploy limits adapt while running."""
+    names = sorted(verify.find_doctests(importlib.import_module("src.main")))
+    # Build the chain image once, before the workers all try to
+    chain.load_image()
+    rows: Dict[str, Dict[str, bool]] = {}
+    errors: Dict[str, Dict[str, str]] = {}
+    controller = Controller(jobs)
+    with worker_pool(controller) as executor:
+        controller.start()
+        futures = {}
+        for name in names:
+            kind = KINDS.get(name[-2:])
+            if kind is None:
+                continue
+            for version, executable in compilers[kind].items():
+                future = executor.submit(
+                    _run_job, name, kind, executable, cache_dir, limits
+                )
+                futures[future] = (name, f"{kind} {version}")
+        for future in as_completed(futures):
+            name, column = futures[future]
+            try:
+                passed, report = future.result()
+            except Exception as error:  # pylint: disable=broad-except
+                passed, report = False, f"{type(error).__name__}: {error}"
+            rows.setdefault(name, {})[column] = passed
+            if not passed:
+                errors.setdefault(name, {})[column] = report
+            print("." if passed else "F", end="", flush=True)
+    controller.stop()
+    print()
+    print(f"Limits: {controller.summary()}")
+    return {
+        "compilers": {
+            kind: sorted(versions, key=version_key)
+            for kind, versions in compilers.items()
+        },
+        # Columns are "kind version", a row only has columns of one kind
+        "rows": {
+            name: {
+                column: rows[name][column]
+                for column in sorted(
+                    rows[name], key=lambda column: version_key(column.split()[1])
+                )
+            }
+            for name in sorted(rows)
+        },
+        # Doctest report or exception of every failed cell
+        "errors": {name: errors[name] for name in sorted(errors)},
+    }
+
+
+def notes(grid: dict) -> Dict[str, List[str]]:
+    """Compatibility notes for the code cells of every row.
+
+    >>> notes({"rows": {"if_s": {"solc 0.5.14": False, "solc 0.7.0": True}}})
+    {'if_s': ['solc 0.5.14 ✗ · 0.7.0 ✓']}
+    """
+    result = {}
+    for name, columns in grid["rows"].items():
+        kind = None
+        parts = []
+        for column, passed in columns.items():
+            column_kind, version = column.split(" ", 1)
+            prefix = f"{column_kind} " if column_kind != kind else ""
+            kind = column_kind
+            parts.append(f"{prefix}{version} {'✓' if passed else '✗'}")
+        result[name] = [" · ".join(parts)]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--solc", nargs="*", help="solc versions, default all")
+    parser.add_argument("--vyper", nargs="*", help="vyper versions, default all")
+    parser.add_argument(
+        "--jobs", type=int, help="worker processes, default adapts to the machine"
+    )
+    add_limit_arguments(parser)
+    parser.add_argument("--output", default="matrix.json", help="grid JSON file")
+    args = parser.parse_args()
+
+    compilers = find_compilers()
+    for kind in ["solc", "vyper"]:
+        wanted = getattr(args, kind)
+        if wanted is None:
+            continue
+        missing = set(wanted) - set(compilers[kind])
+        if missing:
+            sys.exit(f"{kind} {', '.join(sorted(missing))} not found on the PATH")
+        compilers[kind] = {version: compilers[kind][version] for version in wanted}
+    print(
+        "Compilers: "
+        + ", ".join(f"{kind} {' '.join(sorted(v))}" for kind, v in compilers.items())
+    )
+
+    grid = run_matrix(compilers, args.jobs, limits=limits_from_arguments(args))
+    with open(args.output, "w") as output_file:
+        json.dump(grid, output_file, indent=2)
+    failed = sum(not passed for row in grid["rows"].values() for passed in row.values())
+    print(f"{failed} incompatibilities, grid written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Memory instrumentation for long verification sessions.
+
+Enabled with `pytest --doctest-modules src --memprof=memprof.json`. Every
+doctest gets a tracemalloc snapshot whose growth over the previous doctest
+is attributed to allocation sites, and every phase (pytest's setup, call and
+teardown as well as the compile and deploy phases of the conftest helpers)
+gets its peak RSS sampled in the background.
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import pytest
+
+# Number of allocation sites kept per doctest and for the session
+TOP_SITES = 10
+
+# Seconds between two RSS samples while a phase is running
+SAMPLE_INTERVAL = 0.005
+
+_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No procfs, fall back to the peak which is all getrusage knows
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def top_sites(current, previous, limit: int = TOP_SITES) -> List[dict]:
+    """Allocation sites that grew the most between two snapshots."""
+    stats = current.compare_to(previous, "lineno")
+    stats = [stat for stat in stats if stat.size_diff > 0][:limit]
+    return [
+        {
+            "site": str(stat.traceback),
+            "size_diff": stat.size_diff,
+            "count_diff": stat.count_diff,
+            "size": stat.size,
+        }
+        for stat in stats
+    ]
+
+
+class MemoryProfiler:
+    """pytest plugin recording memory use per doctest and per phase."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.doctests: List[dict] = []
+        self.phases: Dict[str, dict] = {}
+        self.first = None
+        self.previous = None
+        self.started_rss = 0
+        self.started_at = 0.0
+        self.report: dict = {}
+
+        # Peaks of the phases currently running, updated by the sampler
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            rss = current_rss()
+            with self._lock:
+                for name, peak in self._active.items():
+                    self._active[name] = max(peak, rss)
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+    @contextmanager
+    def track(self, name: str, **details):
+        """Record the peak and growth of RSS over one run of a phase."""
+        before = current_rss()
+        with self._lock:
+            self._active[name] = before
+        try:
+            yield
+        finally:
+            after = current_rss()
+            with self._lock:
+                peak = max(self._active.pop(name), after)
+            stats = self.phases.setdefault(
+                name, {"runs": 0, "peak_rss": 0, "rss_growth": 0}
+            )
+            stats["runs"] += 1
+            stats["peak_rss"] = max(stats["peak_rss"], peak)
+            stats["rss_growth"] += after - before
+
+    def pytest_sessionstart(self, session):
+        self.started_at = time.perf_counter()
+        self.started_rss = current_rss()
+        tracemalloc.start()
+        self.first = self.previous = self._snapshot()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_setup(self, item):
+        with self.track("setup"):
+            yield
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        with self.track("call"):
+            yield
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_teardown(self, item):
+        with self.track("teardown"):
+            yield
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        yield
+        snapshot = self._snapshot()
+        traced, _ = tracemalloc.get_traced_memory()
+        self.doctests.append(
+            {
+                "doctest": item.name,
+                "rss": current_rss(),
+                "traced": traced,
+                "top_growth": top_sites(snapshot, self.previous),
+            }
+        )
+        self.previous = snapshot
+
+    def summary(self) -> dict:
+        """Session totals and what stayed allocated since the start."""
+        _, traced_peak = tracemalloc.get_traced_memory()
+        return {
+            "doctests": len(self.doctests),
+            "duration": time.perf_counter() - self.started_at,
+            "start_rss": self.started_rss,
+            "end_rss": current_rss(),
+            "peak_rss": peak_rss(),
+            "traced_peak": traced_peak,
+            "top_retained": top_sites(self._snapshot(), self.first),
+        }
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        report = {
+            "summary": self.summary(),
+            "phases": self.phases,
+            "doctests": self.doctests,
+        }
+        tracemalloc.stop()
+        with open(self.path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        self.report = report
+
+    def pytest_terminal_summary(self, terminalreporter):
+        summary = self.report["summary"]
+        mib = 1024 * 1024
+        terminalreporter.section("memory")
+        terminalreporter.write_line(
+            f"RSS {summary['start_rss'] / mib:.1f} MiB -> "
+            f"{summary['end_rss'] / mib:.1f} MiB "
+            f"(peak {summary['peak_rss'] / mib:.1f} MiB) "
+            f"over {summary['doctests']} doctests"
+        )
+        for name, stats in sorted(self.phases.items()):
+            terminalreporter.write_line(
+                f"{name:>8}: peak {stats['peak_rss'] / mib:.1f} MiB, "
+                f"growth {stats['rss_growth'] / mib:+.1f} MiB "
+                f"over {stats['runs']} runs"
+            )
+        for site in summary["top_retained"][:3]:
+            terminalreporter.write_line(
+                f"retained {site['size_diff'] / 1024:.0f} KiB at {site['site']}"
+            )
+        terminalreporter.write_line(f"Full report written to {self.path}")
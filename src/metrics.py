@@ -0,0 +1,207 @@
+"""Columnar store of per doctest verification metrics across runs.
+
+Every `pytest --doctest-modules src` run appends a row per doctest to
+`.cache/metrics` (`--metrics=DIR` to change, `--metrics=` to turn it off).
+Each column is a file of fixed width little endian values, strings are
+stored as codes into a label list, and `schema.json` holds the labels and
+the number of complete rows, so a column of any number of runs loads as one
+array on any host:
+
+    store = ColumnStore(".cache/metrics")
+    gas = store.column("deploy_gas")[store.equals("doctest", "src.main.if_v")]
+
+Loading columns needs NumPy, recording doesn't.
+"""
+
+import fcntl
+import json
+import os
+import struct
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import pytest
+
+from . import chain
+from .cache import write_atomic
+
+# Columns and their struct formats, strings are "I" codes into labels
+COLUMNS = {
+    "run": "I",
+    "doctest": "I",
+    "language": "I",
+    "compiler": "I",
+    "passed": "B",
+    "compile_seconds": "d",
+    "deploy_seconds": "d",
+    "deploy_gas": "Q",
+    "bytecode_size": "I",
+}
+LABELED = ["run", "doctest", "language", "compiler"]
+
+# NumPy dtypes of the formats, packed with standard sizes in little endian
+DTYPES = {"I": "<u4", "B": "u1", "d": "<f8", "Q": "<u8"}
+
+# Compiler a language is compiled with
+COMPILERS = {"solidity": "solc", "vyper": "vyper"}
+
+
+class ColumnStore:
+    """Rows of metrics stored column by column in a directory.
+
+    >>> import tempfile
+    >>> store = ColumnStore(tempfile.mkdtemp())
+    >>> store.append([{"run": "r1", "doctest": "if_v", "passed": 1}])
+    >>> store.append([{"run": "r2", "doctest": "if_v", "deploy_gas": 53000}])
+    >>> store.rows, store.labels["run"], store.labels["doctest"]
+    (2, ['r1', 'r2'], ['if_v'])
+    >>> open(store._path("deploy_gas"), "rb").read()[8:]
+    b'\\x08\\xcf\\x00\\x00\\x00\\x00\\x00\\x00'
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._schema_path = os.path.join(directory, "schema.json")
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self._schema_path) as schema_file:
+                schema = json.load(schema_file)
+        except FileNotFoundError:
+            schema = {"rows": 0, "labels": {}}
+        self.rows: int = schema["rows"]
+        self.labels: Dict[str, List[str]] = {
+            name: schema["labels"].get(name, []) for name in LABELED
+        }
+
+    @contextmanager
+    def _locked(self):
+        """Hold the lock on appending, runs of other processes wait."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "append.lock"), "a") as lock_file:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(lock_file, fcntl.LOCK_UN)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.{COLUMNS[name]}")
+
+    def code(self, name: str, label: str) -> int:
+        """Code of a label in a string column, added if it is new."""
+        labels = self.labels[name]
+        try:
+            return labels.index(label)
+        except ValueError:
+            labels.append(label)
+            return len(labels) - 1
+
+    def append(self, rows: List[dict]):
+        """Append rows, missing values are empty strings and zeros."""
+        with self._locked():
+            # Other processes may have appended since the schema was read
+            self._load()
+            for name, code in COLUMNS.items():
+                values = []
+                for row in rows:
+                    value = row.get(name)
+                    if name in LABELED:
+                        value = self.code(name, str(value or ""))
+                    values.append(value or 0)
+                with open(self._path(name), "ab") as column_file:
+                    # Drop what an interrupted append left after the last row
+                    column_file.truncate(self.rows * struct.calcsize(f"<{code}"))
+                    column_file.write(struct.pack(f"<{len(values)}{code}", *values))
+            self.rows += len(rows)
+            # The rows only count once the schema says so
+            schema = {"rows": self.rows, "labels": self.labels}
+            write_atomic(self._schema_path, json.dumps(schema).encode())
+
+    def column(self, name: str):
+        """All values of a column as a NumPy array, codes for string columns."""
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        if not self.rows:
+            return numpy.zeros(0, DTYPES[COLUMNS[name]])
+        return numpy.fromfile(self._path(name), DTYPES[COLUMNS[name]], self.rows)
+
+    def decoded(self, name: str):
+        """A string column as a NumPy array of its labels."""
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        return numpy.array(self.labels[name], dtype=object)[self.column(name)]
+
+    def equals(self, name: str, label: str):
+        """Mask of the rows where a string column has a label."""
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        if label not in self.labels[name]:
+            return numpy.zeros(self.rows, bool)
+        return self.column(name) == self.labels[name].index(label)
+
+
+class MetricsRecorder:
+    """pytest plugin appending metrics of every doctest to a column store."""
+
+    def __init__(self, directory: str, compiler_version: Callable[[str], str]):
+        self.store = ColumnStore(directory)
+        self.compiler_version = compiler_version
+        self.run = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.rows: List[dict] = []
+        self._row: Optional[dict] = None
+
+    @contextmanager
+    def track(self, name: str, **details):
+        """Time the phases, take the gas and code size of deploys."""
+        row = self._row
+        if row is None:
+            yield
+            return
+        if name == "compile":
+            row["language"] = details["language"]
+            if details.get("version"):
+                # A version given by the doctest, not the session's compiler
+                compiler = COMPILERS[details["language"]]
+                row["compiler"] = f"{compiler} {details['version']}"
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            row[f"{name}_seconds"] = row.get(f"{name}_seconds", 0.0) + seconds
+        if name == "deploy":
+            receipt = chain.deploy_receipt(details["web3"])
+            row["deploy_gas"] = row.get("deploy_gas", 0) + receipt["gasUsed"]
+            code = details["compiled"].get("bin-runtime", "")
+            row["bytecode_size"] = row.get("bytecode_size", 0) + len(code) // 2
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self._row = {"run": self.run, "doctest": item.name}
+        yield
+        row, self._row = self._row, None
+        language = row.get("language")
+        if language and "compiler" not in row:
+            row["compiler"] = (
+                f"{COMPILERS[language]} {self.compiler_version(COMPILERS[language])}"
+            )
+        self.rows.append(row)
+
+    def pytest_runtest_logreport(self, report):
+        if self._row is not None and report.when == "call":
+            self._row["passed"] = report.passed
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        if self.rows:
+            self.store.append(self.rows)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        terminalreporter.section("metrics")
+        terminalreporter.write_line(
+            f"{len(self.rows)} doctests of run {self.run} appended to "
+            f"{self.store.directory}, {self.store.rows} rows from "
+            f"{len(self.store.labels['run'])} runs"
+        )
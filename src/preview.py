@@ -0,0 +1,230 @@
+"""Serve the page and patch changed rows into it on every save.
+
+Run with `python -m src.preview` and open http://localhost:8000/. The page
+carries a small script that opens a websocket back to the server. When
+`src/main.py` or `src/html.py` are saved the page is re-rendered in the
+warm interpreter of `src/watch.py`, and only the `<tr>` rows that changed
+are sent and swapped in place. A change outside of the rows, or to the
+number of rows, reloads the page instead. Doctests of edited rows run
+after the patch went out with `--verify`.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import re
+import socket
+import struct
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Set
+
+from . import verify
+from .html import rows
+from .watch import SRC_DIR, Watcher, watch_changes
+
+WATCHED = {"main.py", "html.py"}
+
+# RFC 6455 key suffix of the handshake
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Patches rows by their position among the page's <tr> elements
+CLIENT = """<script>
+(function () {
+  var socket = new WebSocket("ws://" + location.host + "/patches");
+  socket.onmessage = function (event) {
+    var message = JSON.parse(event.data);
+    if (message.reload) {
+      location.reload();
+      return;
+    }
+    var rows = document.getElementsByTagName("tr");
+    Object.keys(message.rows).forEach(function (index) {
+      rows[index].outerHTML = message.rows[index];
+    });
+  };
+  socket.onclose = function () {
+    setTimeout(function () { location.reload(); }, 1000);
+  };
+})();
+</script>
+"""
+
+
+def accept_key(key: str) -> str:
+    """Sec-WebSocket-Accept of a Sec-WebSocket-Key.
+
+    >>> accept_key("dGhlIHNhbXBsZSBub25jZQ==")
+    's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+    """
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+
+def text_frame(text: str) -> bytes:
+    """Unmasked websocket frame of a text message, as servers send them.
+
+    >>> text_frame("hi")
+    b'\\x81\\x02hi'
+    """
+    payload = text.encode()
+    if len(payload) < 126:
+        header = struct.pack("!BB", 0x81, len(payload))
+    elif len(payload) < 2**16:
+        header = struct.pack("!BBH", 0x81, 126, len(payload))
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, len(payload))
+    return header + payload
+
+
+def patch(old_page: str, new_page: str) -> dict:
+    """Message turning the old page into the new one.
+
+    >>> old = "<table>\\n<tr>one</tr>\\n<tr>two</tr>\\n</table>"
+    >>> patch(old, old.replace("two", "2"))
+    {'rows': {1: '<tr>2</tr>'}}
+    >>> patch(old, old.replace("table", "div"))
+    {'reload': True}
+    """
+    old_rows, new_rows = rows(old_page), rows(new_page)
+    if len(old_rows) != len(new_rows) or _frame(old_page) != _frame(new_page):
+        return {"reload": True}
+    return {
+        "rows": {
+            index: new.strip()
+            for index, (old, new) in enumerate(zip(old_rows, new_rows))
+            if old != new
+        }
+    }
+
+
+def _frame(page: str) -> str:
+    """The page without the contents of its rows."""
+    return re.sub(r"^ *<tr>.*?</tr>$", "<tr/>", page, flags=re.M | re.S)
+
+
+class Preview:
+    """The latest page and the browsers to send its changes to."""
+
+    def __init__(self):
+        self.page = ""
+        self.clients: Set[socket.socket] = set()
+        self._lock = threading.Lock()
+
+    def publish(self, page: str) -> dict:
+        """Make a page current and send its changes to all browsers."""
+        with self._lock:
+            message = patch(self.page, page)
+            self.page = page
+            if message.get("rows") == {}:
+                return message
+            frame = text_frame(json.dumps(message))
+            for client in list(self.clients):
+                try:
+                    client.sendall(frame)
+                except OSError:
+                    self.clients.discard(client)
+        return message
+
+    def served_page(self) -> bytes:
+        return self.page.replace("</body>", CLIENT + "</body>", 1).encode()
+
+
+def handler(preview: Preview):
+    """Request handler serving the page and the websocket of a preview."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path == "/patches":
+                self.stream_patches()
+                return
+            body = preview.served_page()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def stream_patches(self):
+            key = self.headers.get("Sec-WebSocket-Key")
+            if key is None:
+                self.send_error(400, "Expected a websocket handshake")
+                return
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", accept_key(key))
+            self.end_headers()
+            self.wfile.flush()
+            connection = self.connection
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            preview.clients.add(connection)
+            try:
+                # Browsers only send pings and the close frame, wait for it
+                while connection.recv(4096):
+                    pass
+            except OSError:
+                pass
+            finally:
+                preview.clients.discard(connection)
+            self.close_connection = True
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--verify", action="store_true", help="run edited doctests after patching"
+    )
+    parser.add_argument(
+        "--poll", action="store_true", help="poll for changes instead of inotify"
+    )
+    args = parser.parse_args()
+
+    watcher = Watcher()
+    if args.verify:
+        watcher.warm_up()
+    preview = Preview()
+    preview.publish(watcher.main.render())
+    server = ThreadingHTTPServer(("localhost", args.port), handler(preview))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving http://localhost:{args.port}/, watching {', '.join(WATCHED)}")
+    for changed in watch_changes(SRC_DIR, WATCHED, poll=args.poll):
+        started = time.perf_counter()
+        try:
+            watcher.reload(changed)
+            message = preview.publish(watcher.main.render())
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            continue
+        elapsed = (time.perf_counter() - started) * 1000
+        if message.get("reload"):
+            sent = "page reloaded"
+        else:
+            sent = f"{len(message['rows'])} rows patched"
+        print(f"{', '.join(sorted(changed))}: {sent} in {elapsed:.0f} ms")
+        if args.verify:
+            stale = watcher.stale_doctests(changed)
+            for test, (_, passed, report) in zip(
+                stale, verify.run_doctests(stale, watcher.web3, watcher.fixtures)
+            ):
+                if passed:
+                    watcher.verified[test.name.rsplit(".", 1)[-1]] = verify.fingerprint(
+                        test
+                    )
+                else:
+                    print(report, end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""cProfile and flamegraph hooks for rendering and verification.
+
+`python -m src.main --profile DIR` profiles `render()`, and
+`pytest --doctest-modules src --profile=DIR` profiles the setup, compile and
+deploy phases of the doctests. Every phase gets a `DIR/<phase>.pstats` dump
+and a `DIR/<phase>.folded` file of collapsed stacks for flamegraph tools,
+e.g. `flamegraph.pl DIR/compile.folded > compile.svg`.
+"""
+
+import cProfile
+import json
+import os
+import signal
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional, Set
+
+import pytest
+
+# Seconds of CPU time between two stack samples
+SAMPLE_INTERVAL = 0.001
+
+DURATIONS_FILE = "durations.json"
+
+
+def _collapse(frame) -> str:
+    """Render a stack in the collapsed format, outermost frame first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class PhaseProfiler:
+    """Profile named phases into pstats dumps and collapsed stacks."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.enabled = True
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.stacks: Dict[str, Counter] = {}
+        self._active: Optional[str] = None
+
+    def _sample(self, signum, frame):
+        self.stacks[self._active][_collapse(frame)] += 1
+
+    @contextmanager
+    def track(self, name: str, **details):
+        """Profile one run of a phase, results add up across runs."""
+        # Only one cProfile profiler can be active at a time
+        if not self.enabled or self._active is not None:
+            yield
+            return
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        self.stacks.setdefault(name, Counter())
+        self._active = name
+        previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous_handler)
+            self._active = None
+
+    def dump(self):
+        """Write a pstats dump and collapsed stacks for every phase."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.directory, f"{name}.pstats"))
+            with open(os.path.join(self.directory, f"{name}.folded"), "w") as folded:
+                for stack, count in sorted(self.stacks[name].items()):
+                    folded.write(f"{stack} {count}\n")
+
+
+def slowest(durations: Dict[str, float], count: int) -> Set[str]:
+    """Names of the slowest doctests.
+
+    >>> sorted(slowest({"a": 0.1, "b": 2.0, "c": 1.5}, 2))
+    ['b', 'c']
+    """
+    return set(sorted(durations, key=durations.__getitem__, reverse=True)[:count])
+
+
+class ProfilePlugin:
+    """pytest plugin profiling the verification phases of doctests.
+
+    With `top` set only the slowest doctests of the previous profiled run
+    are profiled, so the overhead doesn't distort the whole run. Durations
+    are kept in `DIR/durations.json`, without them everything is profiled."""
+
+    def __init__(self, profiler: PhaseProfiler, top: Optional[int] = None):
+        self.profiler = profiler
+        self.path = os.path.join(profiler.directory, DURATIONS_FILE)
+        self.durations: Dict[str, float] = {}
+        self.selected: Optional[Set[str]] = None
+        if top is not None and os.path.exists(self.path):
+            with open(self.path) as durations_file:
+                self.selected = slowest(json.load(durations_file), top)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self.profiler.enabled = self.selected is None or item.name in self.selected
+        yield
+        self.profiler.enabled = True
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_setup(self, item):
+        with self.profiler.track("setup"):
+            yield
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        started = time.perf_counter()
+        yield
+        self.durations[item.name] = time.perf_counter() - started
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        self.profiler.dump()
+        with open(self.path, "w") as durations_file:
+            json.dump(self.durations, durations_file, indent=2, sort_keys=True)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        profiled = "all" if self.selected is None else len(self.selected)
+        terminalreporter.section("profile")
+        terminalreporter.write_line(
+            f"Profiled {profiled} doctests, "
+            f"phases {', '.join(sorted(self.profiler.profiles))} "
+            f"written to {self.profiler.directory}"
+        )
@@ -0,0 +1,137 @@
+"""Publish the rendered reference without touching unchanged output.
+
+Run with `python -m src.publish TARGET`. The page is rendered and hashed,
+and only if the hash differs from the last published one
+
+- TARGET is replaced atomically,
+- `ASSETS/main.<hash>.html` is written with `.gz` and `.br` variants
+  next to it for CDNs serving precompressed files,
+- `ASSETS/manifest.json` is updated to point at them.
+
+ASSETS defaults to an `assets` directory next to TARGET. Nothing at all is
+written when the page didn't change.
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+from typing import Dict, Optional
+
+from .cache import write_atomic
+from .html import ReferenceDoc
+from .main import render
+
+MANIFEST = "manifest.json"
+
+# Hex digits of the content hash used in file names
+HASH_LENGTH = 12
+
+
+def compressed_variants(data: bytes) -> Dict[str, bytes]:
+    """Precompressed variants of the data by file extension."""
+    # mtime=0 keeps the output identical for identical input, gzip.compress
+    # only takes an mtime from Python 3.8 on
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=9, mtime=0) as gz:
+        gz.write(data)
+    variants = {".gz": buffer.getvalue()}
+    try:
+        import brotli  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        print("brotli is not installed, skipping .br files", file=sys.stderr)
+    else:
+        variants[".br"] = brotli.compress(data, quality=11)
+    return variants
+
+
+def read_manifest(assets: str) -> dict:
+    """Read the manifest of the last publish, if any."""
+    try:
+        with open(os.path.join(assets, MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+
+
+def publish(page: str, target: str, assets: Optional[str] = None) -> bool:
+    """Publish a page, returning whether anything had to be written.
+
+    >>> import tempfile
+    >>> target = os.path.join(tempfile.mkdtemp(), "index.html")
+    >>> assets = os.path.join(os.path.dirname(target), "assets")
+    >>> publish("<p>page</p>", target)
+    True
+    >>> sorted(os.listdir(assets))  # doctest: +ELLIPSIS
+    ['main....html', 'main....html.br', 'main....html.gz', 'manifest.json']
+    >>> def stamps():
+    ...     paths = [target] + [os.path.join(assets, name) for name in os.listdir(assets)]
+    ...     return {path: os.stat(path).st_mtime_ns for path in paths}
+    >>> before = stamps()
+
+    Publishing the same page again writes nothing:
+
+    >>> publish("<p>page</p>", target), stamps() == before
+    (False, True)
+
+    A changed page gets new hashed files next to the old ones:
+
+    >>> publish("<p>changed</p>", target), len(os.listdir(assets))
+    (True, 7)
+    >>> open(target).read()
+    '<p>changed</p>'
+    """
+    if assets is None:
+        assets = os.path.join(os.path.dirname(os.path.abspath(target)), "assets")
+    data = page.encode()
+    digest = hashlib.sha256(data).hexdigest()
+    manifest = read_manifest(assets)
+    if manifest.get("sha256") == digest and os.path.exists(target):
+        return False
+
+    os.makedirs(assets, exist_ok=True)
+    name = f"main.{digest[:HASH_LENGTH]}.html"
+    variants = compressed_variants(data)
+    files = {name: data}
+    for extension, variant in variants.items():
+        files[name + extension] = variant
+    for file_name, content in files.items():
+        # Content hashed names never change content, no need to rewrite
+        path = os.path.join(assets, file_name)
+        if not os.path.exists(path):
+            write_atomic(path, content)
+
+    write_atomic(target, data)
+    manifest = {
+        "sha256": digest,
+        "file": name,
+        "bytes": len(data),
+        "variants": {
+            extension: {"file": name + extension, "bytes": len(variant)}
+            for extension, variant in variants.items()
+        },
+        "cache_control": "public, max-age=31536000, immutable",
+    }
+    write_atomic(
+        os.path.join(assets, MANIFEST), json.dumps(manifest, indent=2).encode()
+    )
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("target", help="file the page is published to")
+    parser.add_argument("--assets", help="directory for hashed, compressed files")
+    args = parser.parse_args()
+
+    if publish(render(ReferenceDoc()), args.target, args.assets):
+        print(f"Published {args.target}")
+    else:
+        print(f"{args.target} is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Run the reference doctests without pytest.
+
+    python -m src.runner [-k NAME] [-x] [src/main.py ...]
+
+Source files are not imported: their docstrings are parsed into doctest
+examples once and cached by the hash of the file, and the examples run
+against the helpers of `src/conftest.py` on the chain image. Exit codes and
+the summary line are the ones of pytest, so the runner can stand in for
+`pytest --doctest-modules src/main.py` at a fraction of its startup time.
+"""
+
+import argparse
+import ast
+import doctest
+import hashlib
+import os
+import pickle
+import sys
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from . import chain, verify
+from .cache import write_atomic
+
+CACHE_DIR = ".cache/doctests"
+
+# Part of the cache key, bump it whenever parse_doctests changes its output
+PARSER_VERSION = f"2-py{sys.version_info[0]}{sys.version_info[1]}"
+
+# pytest's exit codes
+OK, TESTS_FAILED, INTERRUPTED, USAGE_ERROR, NO_TESTS_COLLECTED = 0, 1, 2, 4, 5
+
+# Parsed doctest: name, line of the docstring, docstring and examples
+Parsed = Tuple[str, int, str, List[doctest.Example]]
+
+
+def _docstring_line(
+    node: Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef],
+) -> int:
+    """0-based line the docstring of a def or class starts on, where
+    DocTestFinder puts the doctest."""
+    expression = node.body[0]
+    if hasattr(expression, "end_lineno"):
+        return expression.lineno - 1
+    # Before Python 3.8 a string's line is the one it ends on
+    docstring = ast.get_docstring(node, clean=False) or ""
+    return expression.lineno - 1 - docstring.count("\n")
+
+
+def parse_doctests(source: str, module: str) -> List[Parsed]:
+    """Doctests of module source code, found like DocTestFinder does.
+
+    >>> source = "@code\\ndef f():\\n    '''>>> 1\\n    1'''"
+    >>> [(name, line, len(examples)) for name, line, _, examples
+    ...  in parse_doctests(source, "m")]
+    [('m.f', 2, 1)]
+    """
+    parser = doctest.DocTestParser()
+    tree = ast.parse(source)
+    found = []
+
+    def add(name: str, node: ast.AST):
+        if not isinstance(
+            node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+        ):
+            return
+        docstring = ast.get_docstring(node, clean=False)
+        if docstring:
+            examples = parser.get_examples(docstring, name)
+            if examples:
+                lineno = 0 if isinstance(node, ast.Module) else _docstring_line(node)
+                found.append((name, lineno, docstring, examples))
+
+    add(module, tree)
+    pending: List[Tuple[str, Union[ast.Module, ast.ClassDef]]] = [(module, tree)]
+    while pending:
+        prefix, parent = pending.pop(0)
+        for node in parent.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                add(f"{prefix}.{node.name}", node)
+            elif isinstance(node, ast.ClassDef):
+                name = f"{prefix}.{node.name}"
+                add(name, node)
+                pending.append((name, node))
+    return sorted(found)
+
+
+def load_doctests(path: str, cache_dir: str = CACHE_DIR) -> List[Parsed]:
+    """Parsed doctests of a file, from the cache unless the file changed."""
+    with open(path, "rb") as source_file:
+        content = source_file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    cached = os.path.join(cache_dir, f"{PARSER_VERSION}-{digest}.pickle")
+    try:
+        with open(cached, "rb") as cache_file:
+            return pickle.load(cache_file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    module = os.path.splitext(os.path.relpath(path))[0].replace(os.sep, ".")
+    parsed = parse_doctests(content.decode(), module)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_atomic(cached, pickle.dumps(parsed))
+    return parsed
+
+
+def namespace(path: str = "src/main.py") -> Dict:
+    """Names the doctests of a source file use, the ones it imports from
+    `.conftest`.
+
+    >>> sorted(namespace())[:2]
+    ['check_compiles_s', 'check_compiles_v']
+    """
+    from . import conftest  # pylint: disable=import-outside-toplevel
+
+    with open(path) as source_file:
+        tree = ast.parse(source_file.read())
+    names = {}
+    for node in tree.body:
+        if not isinstance(node, ast.ImportFrom) or node.level != 1:
+            continue
+        if node.module == "conftest":
+            for alias in node.names:
+                names[alias.asname or alias.name] = getattr(conftest, alias.name)
+    return names
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="*", default=["src/main.py"])
+    parser.add_argument("-k", dest="keyword", help="only run doctests with NAME")
+    parser.add_argument("-x", "--exitfirst", action="store_true")
+    parser.add_argument("--chain-profile", choices=chain.PROFILES, default="lean")
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as error:
+        return OK if error.code == 0 else USAGE_ERROR
+
+    tests = []
+    for path in args.paths:
+        globs = namespace(path)
+        for name, lineno, docstring, examples in load_doctests(path):
+            if args.keyword and args.keyword not in name:
+                continue
+            tests.append(
+                doctest.DocTest(examples, dict(globs), name, path, lineno, docstring)
+            )
+    if not tests:
+        print(f"no tests ran in {time.perf_counter() - started:.2f}s")
+        return NO_TESTS_COLLECTED
+
+    image = chain.load_image(args.chain_profile)
+    web3 = chain.load_web3(image)
+    fixtures = chain.fixture_contracts(web3, image)
+    passed_count = 0
+    failures = []
+    try:
+        for name, passed, report in verify.run_doctests(tests, web3, fixtures):
+            print("." if passed else "F", end="", flush=True)
+            passed_count += passed
+            if not passed:
+                failures.append((name, report))
+                if args.exitfirst:
+                    break
+    except KeyboardInterrupt:
+        print("\n!!! KeyboardInterrupt !!!")
+        return INTERRUPTED
+    print()
+
+    if failures:
+        print(" FAILURES ".center(80, "="))
+        for name, report in failures:
+            print(f" [doctest] {name} ".center(80, "_"))
+            print(report.rstrip())
+    summary = []
+    if passed_count:
+        summary.append(f"{passed_count} passed")
+    if failures:
+        summary.append(f"{len(failures)} failed")
+    elapsed = time.perf_counter() - started
+    print(f" {', '.join(summary)} in {elapsed:.2f}s ".center(80, "="))
+    return TESTS_FAILED if failures else OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Client-side search index built while rendering the page.
+
+The index maps terms from feature labels, section names and code cells to
+the rows they appear in. It is serialized as compact JSON:
+
+    {"sections": [name, ...],
+     "rows": [[anchor, label, section number], ...],
+     "terms": [term, ...],            # sorted, for prefix lookups
+     "postings": [[row deltas], ...]} # one list per term
+
+Row numbers in a posting list are delta encoded to keep the file small.
+"""
+
+import json
+import re
+from typing import Dict, List, Set
+
+# Search box script, loads the index on first use and queries by prefix
+SCRIPT = """
+(function () {
+  var input = document.getElementById("search");
+  var results = document.getElementById("search-results");
+  var index = null;
+  function load() {
+    if (!index) {
+      index = fetch(input.dataset.index).then(function (r) { return r.json(); });
+    }
+    return index;
+  }
+  function lookup(data, prefix) {
+    var rows = {}, lo = 0, hi = data.terms.length;
+    while (lo < hi) {
+      var mid = (lo + hi) >> 1;
+      if (data.terms[mid] < prefix) { lo = mid + 1; } else { hi = mid; }
+    }
+    for (var i = lo; i < data.terms.length && data.terms[i].startsWith(prefix); i++) {
+      var row = 0;
+      data.postings[i].forEach(function (delta) { row += delta; rows[row] = true; });
+    }
+    return rows;
+  }
+  function search(data) {
+    var words = input.value.toLowerCase().match(/[a-z0-9_]+/g) || [];
+    var found = null;
+    words.forEach(function (word) {
+      var rows = lookup(data, word);
+      if (found === null) { found = rows; return; }
+      Object.keys(found).forEach(function (row) { if (!rows[row]) { delete found[row]; } });
+    });
+    results.innerHTML = "";
+    Object.keys(found || {}).slice(0, 20).forEach(function (row) {
+      var entry = data.rows[row], item = document.createElement("li");
+      var link = document.createElement("a");
+      link.href = "#" + entry[0];
+      var section = data.sections[entry[2]];
+      link.textContent = (section ? section + " / " : "") + entry[1];
+      item.appendChild(link);
+      results.appendChild(item);
+    });
+  }
+  input.addEventListener("focus", load);
+  input.addEventListener("input", function () { load().then(search); });
+})();
+"""
+
+
+def tokenize(content: str) -> Set[str]:
+    """Split text or code into lower case search terms.
+
+    Identifiers are indexed whole as well as split into their words.
+
+    >>> sorted(tokenize("create_forwarder_to(target)"))
+    ['create', 'create_forwarder_to', 'forwarder', 'target', 'to']
+    >>> sorted(tokenize("abi.encodePacked"))
+    ['abi', 'encode', 'encodepacked', 'packed']
+    """
+    terms = set()
+    for word in re.findall(r"[A-Za-z0-9_]+", content):
+        terms.add(word.lower())
+        for part in re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", word):
+            terms.add(part.lower())
+    return {term for term in terms if len(term) > 1}
+
+
+class SearchIndex:
+    """Inverted index from search terms to rows of the reference."""
+
+    def __init__(self):
+        self.sections: List[str] = []
+        self.rows: List[list] = []
+        self.postings: Dict[str, Set[int]] = {}
+
+    def add_section(self, name: str):
+        """Start a new section, later rows belong to it."""
+        self.sections.append(name)
+
+    def add_row(self, anchor: str, label: str):
+        """Start a new row, later content belongs to it."""
+        if not self.sections:
+            self.sections.append("")
+        self.rows.append([anchor, label, len(self.sections) - 1])
+        self.add_content(label)
+        self.add_content(self.sections[-1])
+
+    def add_content(self, content: str):
+        """Index text or code of the current row."""
+        if not self.rows:
+            return
+        row = len(self.rows) - 1
+        for term in tokenize(content):
+            self.postings.setdefault(term, set()).add(row)
+
+    def serialize(self) -> str:
+        """Compact JSON representation for the browser."""
+        terms = sorted(self.postings)
+        postings = []
+        for term in terms:
+            rows = sorted(self.postings[term])
+            postings.append([rows[0]] + [b - a for a, b in zip(rows, rows[1:])])
+        index = {
+            "sections": self.sections,
+            "rows": self.rows,
+            "terms": terms,
+            "postings": postings,
+        }
+        return json.dumps(index, separators=(",", ":"))
@@ -0,0 +1,265 @@
+"""Storage layout and storage cost of the verified snippets.
+
+Enabled with `pytest --doctest-modules src --storage=storage.json`. The
+storage layout of every contract a doctest deploys is taken from the
+compiler: solc's `storageLayout` output and the variable positions of the
+vyper package, recorded to and replayed from the session's cassette like
+the other compiler requests. Storage costs are measured on the tester chain once per
+session, by deploying probes that do and don't SSTORE or SLOAD.
+
+`python -m src.main --storage storage.json` renders a storage footprint
+under the code cells of the rows declaring state.
+"""
+
+import json
+import re
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+
+import pytest
+from eth_typing import HexStr
+from web3 import Web3
+
+from . import chain
+from .cassette import Cassette, RecordedError, recorded
+
+# Creation code measuring an opcode, creation code of the same length and
+# zero bytes without it, and the gas the second one spends instead of it
+PROBES = {
+    # PUSH1 1 PUSH1 0 SSTORE JUMPDEST STOP / PUSH1 1 PUSH1 0 POP POP STOP
+    "sstore": ("0x60016000555b00", "0x60016000505000", 2 + 2 - 1),
+    # PUSH1 0 SLOAD POP STOP / PUSH1 0 PC POP STOP
+    "sload": ("0x6000545000", "0x6000585000", 2),
+}
+
+# State declared like this lives in the code rather than in storage
+CODE_ONLY = re.compile(r"\b(?:immutable|constant)\b")
+
+
+def measure_costs(web3: Web3) -> Dict[str, int]:
+    """Gas of writing a new storage slot and reading one on this chain."""
+    costs = {}
+    for name, (probe, baseline, baseline_gas) in PROBES.items():
+        gas = []
+        for code in [probe, baseline]:
+            tx_hash = web3.eth.sendTransaction({"data": HexStr(code)})
+            gas.append(web3.eth.waitForTransactionReceipt(tx_hash)["gasUsed"])
+        costs[name] = gas[0] - gas[1] + baseline_gas
+    return costs
+
+
+def vyper_layout(source: str, cassette: Optional[Cassette] = None) -> List[dict]:
+    """Storage variables of Vyper code, each in slots of its own."""
+    return recorded(
+        cassette, ["storage", "vyper", source], lambda: _vyper_layout(source)
+    )
+
+
+def _vyper_layout(source: str) -> List[dict]:
+    # pylint: disable=import-outside-toplevel
+    from vyper.compiler.phases import CompilerData
+    from vyper.types.types import MappingType
+
+    variables = []
+    for name, record in CompilerData(source).global_ctx._globals.items():
+        mapping = isinstance(record.typ, MappingType)
+        variables.append(
+            {
+                "name": name,
+                "type": str(record.typ),
+                "slot": record.pos,
+                "offset": 0,
+                "slots": 1 if mapping else record.size,
+                "mapping": mapping,
+            }
+        )
+    return variables
+
+
+def solidity_layout(
+    source: str, cassette: Optional[Cassette] = None, version: Optional[str] = None
+) -> Optional[List[dict]]:
+    """Storage variables of the last contract in Solidity code.
+
+    Compiled by the solc the snippet itself is compiled with, `version` from
+    the registry or the selected one. None if that solc is too old to report
+    layouts (< 0.5.13)."""
+    # pylint: disable=import-outside-toplevel
+    from .conftest import _COMPILERS
+
+    request = ["storage", "solidity", str(_COMPILERS["solc"]), str(version), source]
+    try:
+        return recorded(cassette, request, lambda: _solidity_layout(source, version))
+    except (OSError, RecordedError):
+        return None
+
+
+def _solidity_layout(source: str, version: Optional[str]) -> Optional[List[dict]]:
+    # pylint: disable=import-outside-toplevel
+    import solc
+    from solc.exceptions import SolcError
+
+    from .conftest import _select_solc
+
+    compiler_kwargs: dict = {"version": version}
+    _select_solc(compiler_kwargs)
+    try:
+        output = solc.compile_standard(
+            {
+                "language": "Solidity",
+                "sources": {"snippet.sol": {"content": source}},
+                "settings": {"outputSelection": {"*": {"*": ["storageLayout"]}}},
+            },
+            **compiler_kwargs,
+        )
+    except SolcError:
+        return None
+    contracts = output["contracts"]["snippet.sol"]
+    layout = contracts[list(contracts)[-1]].get("storageLayout")
+    if layout is None:
+        return None
+    variables = []
+    for entry in layout["storage"]:
+        kind = layout["types"][entry["type"]]
+        size = int(kind["numberOfBytes"])
+        variables.append(
+            {
+                "name": entry["label"],
+                "type": kind["label"],
+                "slot": int(entry["slot"]),
+                "offset": entry["offset"],
+                "slots": max(1, (size + 31) // 32),
+                "mapping": kind["encoding"] == "mapping",
+            }
+        )
+    return variables
+
+
+def slot_count(variables: List[dict]) -> int:
+    """Slots taken by the variables, counting packed ones once.
+
+    >>> slot_count([{"slot": 0, "slots": 1}, {"slot": 0, "slots": 1}])
+    1
+    >>> slot_count([{"slot": 0, "slots": 2}, {"slot": 2, "slots": 1}])
+    3
+    """
+    slots: Set[int] = set()
+    for variable in variables:
+        slots.update(range(variable["slot"], variable["slot"] + variable["slots"]))
+    return len(slots)
+
+
+def footprint(entry: dict, costs: Dict[str, int]) -> Optional[str]:
+    """One line summary of the storage a snippet uses.
+
+    >>> costs = {"sstore": 20000, "sload": 800}
+    >>> footprint({"variables": [
+    ...     {"name": "x", "slot": 0, "offset": 0, "slots": 1, "mapping": False},
+    ...     {"name": "y", "slot": 0, "offset": 16, "slots": 1, "mapping": False},
+    ... ]}, costs)
+    'storage: x, y packed in 1 slot · 20,000 gas to set, 800 to read'
+    >>> footprint({"variables": [
+    ...     {"name": "m", "slot": 0, "offset": 0, "slots": 1, "mapping": True},
+    ... ]}, costs)
+    'storage: m one slot per key · 20,000 gas per new key, 800 per read'
+    >>> footprint({"variables": [], "code_only": True}, costs)
+    'storage: none, the value is part of the code'
+    """
+    variables = entry["variables"]
+    if not variables and entry.get("code_only"):
+        return "storage: none, the value is part of the code"
+    if not variables:
+        return None
+    mappings = [variable for variable in variables if variable["mapping"]]
+    if mappings:
+        names = ", ".join(variable["name"] for variable in mappings)
+        return (
+            f"storage: {names} one slot per key · {costs['sstore']:,} gas per new "
+            f"key, {costs['sload']:,} per read"
+        )
+    slots = slot_count(variables)
+    names = ", ".join(variable["name"] for variable in variables)
+    unpacked = sum(variable["slots"] for variable in variables)
+    packed = " packed" if slots < unpacked else ""
+    plural = "s" if slots > 1 else ""
+    return (
+        f"storage: {names}{packed} in {slots} slot{plural} · "
+        f"{slots * costs['sstore']:,} gas to set, {slots * costs['sload']:,} to read"
+    )
+
+
+class StorageReport:
+    """pytest plugin recording the storage of the contracts doctests deploy."""
+
+    def __init__(self, path: str, cassette: Optional[Cassette] = None):
+        self.path = path
+        self.cassette = cassette
+        self.costs: Dict[str, int] = {}
+        self.rows: Dict[str, dict] = {}
+        self._doctest: Optional[str] = None
+        self._variables: Optional[List[dict]] = None
+        self._code_only = False
+
+    @contextmanager
+    def track(self, name: str, **details):
+        """Take the layout when compiling, the gas when deploying."""
+        if name == "compile":
+            source = details["source"]
+            if details["language"] == "vyper":
+                try:
+                    self._variables = vyper_layout(source, self.cassette)
+                except Exception:  # pylint: disable=broad-except
+                    # Invalid code, the compile phase reports it
+                    self._variables = None
+            else:
+                self._variables = solidity_layout(
+                    source, self.cassette, details.get("version")
+                )
+            self._code_only = bool(CODE_ONLY.search(source))
+        yield
+        if name == "deploy" and self._doctest and self._variables is not None:
+            receipt = chain.deploy_receipt(details["web3"])
+            entry: dict = {
+                "variables": self._variables,
+                "slots": slot_count(self._variables),
+                "code_only": self._code_only,
+                "deploy_gas": receipt["gasUsed"],
+            }
+            # A doctest deploying several snippets is reported by the one
+            # declaring the most storage
+            previous = self.rows.get(self._doctest, {"variables": []})
+            if len(entry["variables"]) >= len(previous["variables"]):
+                self.rows[self._doctest] = entry
+
+    def pytest_sessionstart(self, session):
+        profile = session.config.getoption("chain_profile")
+        self.costs = measure_costs(chain.load_web3(chain.load_image(profile)))
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self._doctest = item.name.rsplit(".", 1)[-1]
+        yield
+        self._doctest = None
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        with open(self.path, "w") as report_file:
+            json.dump({"costs": self.costs, "rows": self.rows}, report_file, indent=2)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        terminalreporter.section("storage")
+        terminalreporter.write_line(
+            f"SSTORE of a new slot {self.costs['sstore']:,} gas, "
+            f"SLOAD {self.costs['sload']:,} gas, "
+            f"{sum(bool(row['variables']) for row in self.rows.values())} "
+            f"doctests declare storage, report written to {self.path}"
+        )
+
+
+def notes(report: dict) -> Dict[str, List[str]]:
+    """Storage footprint notes for the code cells of every row."""
+    result = {}
+    for name, entry in report["rows"].items():
+        line = footprint(entry, report["costs"])
+        if line:
+            result[name] = [line]
+    return result
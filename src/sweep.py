@@ -0,0 +1,174 @@
+"""Sweep the Solidity doctests over solc optimizer settings.
+
+Run with `python -m src.sweep --runs 1 200 10000 --output sweep.json`. Every
+Solidity doctest is compiled and deployed without the optimizer and with
+the optimizer at each number of runs, in parallel processes sharing the
+artifact store of src/matrix.py, where artifacts are keyed by setting. The
+deploy gas and runtime bytecode size of each row at each setting make up
+its gas and size curves. The gas is that of the deploys only, the calls a
+doctest makes afterwards are not measured, and the optimizer tunes code
+for those calls, so more runs can show more deploy gas.
+
+Vyper 0.2 has no optimizer options, its doctests are not swept.
+
+The curves can be rendered into the page with
+`python -m src.main --sweep sweep.json`.
+"""
+
+import argparse
+import importlib
+import json
+from concurrent.futures import as_completed
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from . import chain, verify
+from .concurrency import (
+    Controller,
+    ResourceLimits,
+    add_limit_arguments,
+    limits_from_arguments,
+)
+from .matrix import CACHE_DIR, run_job, worker_pool
+
+DEFAULT_RUNS = [1, 200, 10000]
+
+# Deploy gas and runtime bytecode size of the current job
+_MEASURED: dict = {}
+
+
+def optimizer(setting: str) -> dict:
+    """solc keyword arguments of a setting, "off" or a number of runs.
+
+    >>> optimizer("off"), optimizer("200")
+    ({}, {'optimize': True, 'optimize_runs': 200})
+    """
+    if setting == "off":
+        return {}
+    return {"optimize": True, "optimize_runs": int(setting)}
+
+
+@contextmanager
+def measure(name: str, **details):
+    """Add up the gas and code size of the deploys of a job."""
+    yield
+    if name == "deploy":
+        _MEASURED["gas"] += chain.deploy_receipt(details["web3"])["gasUsed"]
+        _MEASURED["size"] += len(details["compiled"].get("bin-runtime", "")) // 2
+
+
+def _run_job(
+    name: str,
+    setting: str,
+    cache_dir: str,
+    limits: Optional[ResourceLimits] = None,
+) -> dict:
+    """Compile and deploy one doctest at one setting, in a worker process."""
+    _MEASURED.update(gas=0, size=0)
+    passed, report = run_job(
+        name, cache_dir, limits=limits, optimizer=optimizer(setting)
+    )
+    if not passed:
+        return {"passed": False, "gas": 0, "size": 0, "error": report}
+    return {"passed": passed, **_MEASURED}
+
+
+def run_sweep(
+    settings: List[str],
+    jobs: Optional[int] = None,
+    cache_dir: str = CACHE_DIR,
+    limits: Optional[ResourceLimits] = None,
+) -> dict:
+    """Run the Solidity doctests at all settings and return their curves.
+
+    Failed points have the doctest report or the exception as their error."""
+    tests = verify.find_doctests(importlib.import_module("src.main"))
+    names = sorted(name for name in tests if name.endswith("_s"))
+    chain.load_image()
+    rows: Dict[str, Dict[str, dict]] = {}
+    controller = Controller(jobs)
+    with worker_pool(controller, measure) as executor:
+        controller.start()
+        futures = {}
+        for name in names:
+            for setting in settings:
+                future = executor.submit(_run_job, name, setting, cache_dir, limits)
+                futures[future] = (name, setting)
+        for future in as_completed(futures):
+            name, setting = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:  # pylint: disable=broad-except
+                result = {
+                    "passed": False,
+                    "gas": 0,
+                    "size": 0,
+                    "error": f"{type(error).__name__}: {error}",
+                }
+            rows.setdefault(name, {})[setting] = result
+            print("." if result["passed"] else "F", end="", flush=True)
+    controller.stop()
+    print()
+    return {
+        "settings": settings,
+        # Points of the curves are in the order of the settings
+        "rows": {
+            name: {setting: rows[name][setting] for setting in settings}
+            for name in sorted(rows)
+        },
+    }
+
+
+def notes(sweep: dict) -> Dict[str, List[str]]:
+    """Deploy gas and runtime size notes for the code cells of every swept row.
+
+    >>> notes({"rows": {"for_s": {
+    ...     "off": {"passed": True, "gas": 81234, "size": 412},
+    ...     "200": {"passed": True, "gas": 70112, "size": 301},
+    ...     "10000": {"passed": False, "gas": 0, "size": 0},
+    ... }}})
+    {'for_s': ['deploy gas, runtime size: optimizer off 81,234 412 B · 200 runs 70,112 301 B · 10000 runs ✗']}
+    """
+    result = {}
+    for name, points in sweep["rows"].items():
+        parts = []
+        for setting, point in points.items():
+            label = "optimizer off" if setting == "off" else f"{setting} runs"
+            if point["passed"]:
+                parts.append(f"{label} {point['gas']:,} {point['size']} B")
+            else:
+                parts.append(f"{label} ✗")
+        result[name] = ["deploy gas, runtime size: " + " · ".join(parts)]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--runs",
+        type=int,
+        nargs="*",
+        default=DEFAULT_RUNS,
+        help="optimizer runs to sweep besides the optimizer being off",
+    )
+    parser.add_argument(
+        "--jobs", type=int, help="worker processes, default adapts to the machine"
+    )
+    add_limit_arguments(parser)
+    parser.add_argument("--output", default="sweep.json", help="curves JSON file")
+    args = parser.parse_args()
+
+    settings = ["off"] + [str(runs) for runs in args.runs]
+    sweep = run_sweep(settings, args.jobs, limits=limits_from_arguments(args))
+    with open(args.output, "w") as output_file:
+        json.dump(sweep, output_file, indent=2)
+    failed = sum(
+        not point["passed"] for row in sweep["rows"].values() for point in row.values()
+    )
+    print(
+        f"{len(sweep['rows'])} rows, {failed} failed points, written to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Run the reference doctests outside of pytest."""
+
+import doctest
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from web3 import Web3
+
+# Same default as pytest's doctest_optionflags
+OPTIONFLAGS = doctest.ELLIPSIS
+
+
+def find_doctests(module) -> Dict[str, doctest.DocTest]:
+    """Collect the doctests of a module, keyed by function name."""
+    finder = doctest.DocTestFinder(exclude_empty=True)
+    tests = {}
+    for test in finder.find(module):
+        tests[test.name.rsplit(".", 1)[-1]] = test
+    return tests
+
+
+def fingerprint(test: doctest.DocTest) -> str:
+    """Hash the examples of a doctest so edits can be detected."""
+    digest = hashlib.sha1()
+    for example in test.examples:
+        digest.update(example.source.encode())
+        digest.update(example.want.encode())
+    return digest.hexdigest()
+
+
+def run_doctest(
+    test: doctest.DocTest, web3: Web3, fixtures: Optional[dict] = None
+) -> Tuple[bool, str]:
+    """Run a single doctest against a chain and return (passed, report)."""
+    test.globs["web3"] = web3
+    test.globs["fixtures"] = fixtures or {}
+    output: List[str] = []
+    runner = doctest.DocTestRunner(optionflags=OPTIONFLAGS)
+    results = runner.run(test, out=output.append, clear_globs=False)
+    return results.failed == 0, "".join(output)
+
+
+def run_doctests(
+    tests: Iterable[doctest.DocTest], web3: Web3, fixtures: Optional[dict] = None
+):
+    """Run doctests one after another, reverting the chain in between.
+
+    Yields (name, passed, report) for every test."""
+    tester = web3.provider.ethereum_tester  # type: ignore
+    for test in tests:
+        snapshot = tester.take_snapshot()
+        try:
+            passed, report = run_doctest(test, web3, fixtures)
+        finally:
+            tester.revert_to_snapshot(snapshot)
+        yield test.name, passed, report
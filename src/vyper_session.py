@@ -0,0 +1,179 @@
+"""One in-process Vyper compiler, reused for every snippet.
+
+The vyper package builds its namespace of types, environment variables and
+builtin functions on first use and keeps it in a module global, and sets
+the active EVM version around every `compile_codes` call. A session does
+both once, compiles sources straight through `CompilerData`, and makes
+sure every compile starts from the builtin namespace: a compile that left
+names or scopes behind gets the namespace rebuilt.
+
+The vyper package is imported on first use, so modules depending on this
+one import without it, as a session replaying a cassette does.
+
+`python -m src.vyper_session` measures the per snippet compile latency of
+the Vyper doctests with `compile_codes` and with a session.
+"""
+
+import argparse
+import doctest
+import logging
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+FORMATS = ["bytecode", "bytecode_runtime", "abi"]
+
+# Compiled once when the session starts, to load everything lazily loaded
+WARMUP = "@external\ndef f() -> uint256:\n    return 1\n"
+
+
+class VyperSession:
+    """Compiles Vyper sources with the global state of the package set up once."""
+
+    def __init__(self, evm_version: Optional[str] = None):
+        # pylint: disable=import-outside-toplevel
+        from vyper import opcodes
+        from vyper.context.namespace import get_namespace
+
+        self.evm_version = evm_version or opcodes.DEFAULT_EVM_VERSION
+        self.compiled = 0
+        self.resets = 0
+        self._lock = threading.Lock()
+        self._builtins = frozenset(get_namespace())
+        self.compile({"warmup": WARMUP}, "warmup")
+
+    def reset(self):
+        """Rebuild the namespace if a compile left anything in it."""
+        # pylint: disable=import-outside-toplevel
+        from vyper.context.namespace import get_namespace
+
+        namespace = get_namespace()
+        if namespace._scopes or len(namespace) != len(self._builtins):
+            namespace.clear()
+            self.resets += 1
+
+    @contextmanager
+    def _evm_version(self):
+        from vyper import opcodes  # pylint: disable=import-outside-toplevel
+
+        opcodes.active_evm_version = opcodes.EVM_VERSIONS[self.evm_version]
+        try:
+            yield
+        finally:
+            default = opcodes.EVM_VERSIONS[opcodes.DEFAULT_EVM_VERSION]
+            opcodes.active_evm_version = default
+
+    def compile(self, codes: Dict[str, str], name: str) -> dict:
+        """Bytecode, runtime bytecode and ABI of the named contract, like
+        `compile_codes` which compiles all of them."""
+        # pylint: disable=import-outside-toplevel
+        from vyper.compiler import OUTPUT_FORMATS
+        from vyper.compiler.phases import CompilerData
+
+        output = {}
+        with self._lock, self._evm_version():
+            for source_id, contract_name in enumerate(sorted(codes)):
+                # Same trailing newline as compile_codes, see bpo-35107
+                source = f"{codes[contract_name]}\n"
+                data = CompilerData(source, contract_name, None, source_id)
+                try:
+                    output[contract_name] = {
+                        output_format: OUTPUT_FORMATS[output_format](data)
+                        for output_format in FORMATS
+                    }
+                except Exception:
+                    logging.error("Error compiling: %s", contract_name)
+                    raise
+                finally:
+                    self.reset()
+                self.compiled += 1
+        return output[name]
+
+
+_SESSION: Optional[VyperSession] = None
+
+
+def session() -> VyperSession:
+    """The session of this process, started on first use."""
+    global _SESSION  # pylint: disable=global-statement
+    if _SESSION is None:
+        _SESSION = VyperSession()
+    return _SESSION
+
+
+def doctest_sources(keyword: str = "_v") -> List[str]:
+    """Vyper sources compiled by the doctests of src/main.py."""
+    # pylint: disable=import-outside-toplevel
+    from . import chain, runner, verify
+    from .conftest import PHASE_HOOKS
+
+    sources = []
+
+    @contextmanager
+    def record(name: str, **details):
+        if name == "compile" and details["language"] == "vyper":
+            sources.append(details["source"])
+        yield
+
+    globs = runner.namespace()
+    tests = [
+        doctest.DocTest(examples, dict(globs), name, "src/main.py", lineno, docstring)
+        for name, lineno, docstring, examples in runner.load_doctests("src/main.py")
+        if keyword in name
+    ]
+    image = chain.load_image()
+    web3 = chain.load_web3(image)
+    PHASE_HOOKS.append(record)
+    try:
+        for _ in verify.run_doctests(tests, web3, chain.fixture_contracts(web3, image)):
+            pass
+    finally:
+        PHASE_HOOKS.remove(record)
+    return sources
+
+
+def benchmark(sources: List[str], repeat: int) -> Dict[str, List[float]]:
+    """Best of `repeat` compile times per source, fresh and in a session."""
+    import vyper  # pylint: disable=import-outside-toplevel
+
+    compilers = {
+        "compile_codes": lambda codes: vyper.compiler.compile_codes(
+            codes, output_formats=FORMATS
+        ),
+        "session": lambda codes: session().compile(codes, "main"),
+    }
+    latencies: Dict[str, List[float]] = {name: [] for name in compilers}
+    for source in sources:
+        codes = OrderedDict(main=source)
+        for name, compile_codes in compilers.items():
+            times = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                compile_codes(codes)
+                times.append(time.perf_counter() - started)
+            latencies[name].append(min(times))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    session()
+    print(f"session start {(time.perf_counter() - started) * 1000:.1f} ms")
+    sources = doctest_sources()
+    for name, latencies in benchmark(sources, args.repeat).items():
+        print(
+            f"{name:>14}: {len(latencies)} snippets, "
+            f"mean {statistics.mean(latencies) * 1000:.2f} ms, "
+            f"median {statistics.median(latencies) * 1000:.2f} ms"
+        )
+    print(f"namespace resets {session().resets}")
+
+
+if __name__ == "__main__":
+    main()
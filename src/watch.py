@@ -0,0 +1,227 @@
+"""Keep the reference warm and re-verify it on every save.
+
+Run with `python -m src.watch`. The interpreter, web3, vyper and a tester
+chain stay loaded between saves, so a change to `src/main.py` only costs
+reloading the module, re-rendering and running the doctests that changed.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import glob
+import importlib
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+from typing import Dict, Iterator, List, Optional, Set
+
+from . import chain, verify
+from .html import rows
+from .incremental import write_incremental
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Watched files, every module of the package
+SOURCES = sorted(
+    os.path.basename(path) for path in glob.glob(os.path.join(SRC_DIR, "[!_]*.py"))
+)
+
+# Editors emit several events per save, wait for them to settle
+DEBOUNCE = 0.05
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+_EVENT = struct.Struct("iIII")
+
+
+def _parse_events(buffer: bytes) -> Set[str]:
+    """Extract file names from a buffer of inotify events."""
+    names = set()
+    offset = 0
+    while offset < len(buffer):
+        _, _, _, length = _EVENT.unpack_from(buffer, offset)
+        offset += _EVENT.size
+        names.add(buffer[offset : offset + length].rstrip(b"\0").decode())
+        offset += length
+    return names
+
+
+def inotify_changes(directory: str, names: Set[str]) -> Iterator[Set[str]]:
+    """Yield sets of changed files using Linux inotify."""
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    fd = libc.inotify_init()
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init failed")
+    try:
+        # Watch the directory so that saves by renaming are seen too
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(fd, directory.encode(), mask) < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        while True:
+            changed = _parse_events(os.read(fd, 4096))
+            while select.select([fd], [], [], DEBOUNCE)[0]:
+                changed |= _parse_events(os.read(fd, 4096))
+            changed &= names
+            if changed:
+                yield changed
+    finally:
+        os.close(fd)
+
+
+def polling_changes(
+    directory: str, names: Set[str], interval: float = 0.2
+) -> Iterator[Set[str]]:
+    """Yield sets of changed files by polling modification times."""
+
+    def stamps():
+        result = {}
+        for name in names:
+            try:
+                result[name] = os.stat(os.path.join(directory, name)).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        return result
+
+    last = stamps()
+    while True:
+        time.sleep(interval)
+        current = stamps()
+        changed = {name for name in names if current.get(name) != last.get(name)}
+        last = current
+        if changed:
+            yield changed
+
+
+def watch_changes(
+    directory: str, names: Set[str], poll: bool = False
+) -> Iterator[Set[str]]:
+    """Yield sets of changed files, using inotify when available."""
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            yield from inotify_changes(directory, names)
+            return
+        except OSError as error:
+            print(f"inotify unavailable ({error}), polling instead", file=sys.stderr)
+    yield from polling_changes(directory, names)
+
+
+class Watcher:
+    """Interpreter state kept warm between saves."""
+
+    def __init__(self, output: Optional[str] = None):
+        self.output = output
+        self.main = importlib.import_module("src.main")
+        image = chain.load_image()
+        self.web3 = chain.load_web3(image)
+        self.fixtures = chain.fixture_contracts(self.web3, image)
+        self.rows: List[str] = []
+        # Fingerprints of the doctests that passed in their current form
+        self.verified: Dict[str, str] = {}
+
+    def warm_up(self):
+        """Pay the one-off compiler and chain setup costs ahead of time.
+
+        The doctests as they are now count as verified, `make test` covers
+        them, so only the ones edited from here on run on save."""
+        self.main.check_global_v(self.web3, "x: uint256")
+        self.render()
+        for name, test in verify.find_doctests(self.main).items():
+            self.verified[name] = verify.fingerprint(test)
+
+    def reload(self, changed: Set[str]):
+        """Reload the changed modules in import order, then `main`."""
+        names = {f"src.{source[:-3]}" for source in changed} - {"src.main"}
+        # Modules are in sys.modules in the order they were first imported
+        for name in [name for name in sys.modules if name in names]:
+            importlib.reload(sys.modules[name])
+        importlib.reload(sys.modules["src.main"])
+        self.main = sys.modules["src.main"]
+
+    def render(self) -> int:
+        """Render the page and return the number of rows that changed."""
+        page = self.main.render()
+        new_rows = rows(page)
+        changed = sum(old != new for old, new in zip(self.rows, new_rows))
+        changed += abs(len(self.rows) - len(new_rows))
+        self.rows = new_rows
+        if changed and self.output:
+            write_incremental(page.encode(), self.output)
+        return changed
+
+    def stale_doctests(self, changed: Set[str]):
+        """Find the doctests that have to run again after a change.
+
+        >>> watcher = Watcher()
+        >>> tests = verify.find_doctests(watcher.main)
+        >>> watcher.verified = {name: verify.fingerprint(test)
+        ...                     for name, test in tests.items()}
+        >>> watcher.stale_doctests({"main.py"})
+        []
+
+        A doctest edited since it passed runs again, and a change to any
+        other module, like the helpers, runs all of them again:
+
+        >>> watcher.verified["if_v"] = "fingerprint before the edit"
+        >>> [test.name for test in watcher.stale_doctests({"main.py"})]
+        ['src.main.if_v']
+        >>> len(watcher.stale_doctests({"conftest.py"})) == len(tests)
+        True
+        """
+        tests = verify.find_doctests(self.main)
+        if changed - {"main.py"}:
+            # The helpers or the chain may have changed, run everything again
+            self.verified.clear()
+        return [
+            test
+            for name, test in tests.items()
+            if self.verified.get(name) != verify.fingerprint(test)
+        ]
+
+    def rebuild(self, changed: Set[str]):
+        """React to a set of changed files."""
+        started = time.perf_counter()
+        self.reload(changed)
+        changed_rows = self.render()
+        stale = self.stale_doctests(changed)
+        failed = 0
+        for test, (name, passed, report) in zip(
+            stale, verify.run_doctests(stale, self.web3, self.fixtures)
+        ):
+            short_name = name.rsplit(".", 1)[-1]
+            if passed:
+                self.verified[short_name] = verify.fingerprint(test)
+            else:
+                self.verified.pop(short_name, None)
+                failed += 1
+                print(report, end="")
+        elapsed = time.perf_counter() - started
+        print(
+            f"{', '.join(sorted(changed))}: {changed_rows} rows re-rendered, "
+            f"{len(stale) - failed}/{len(stale)} doctests passed in {elapsed:.2f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", help="write the rendered page to this file")
+    parser.add_argument(
+        "--poll", action="store_true", help="poll for changes instead of inotify"
+    )
+    args = parser.parse_args()
+
+    watcher = Watcher(args.output)
+    watcher.warm_up()
+    print(f"Watching {len(SOURCES)} modules in {SRC_DIR}")
+    for changed in watch_changes(SRC_DIR, set(SOURCES), poll=args.poll):
+        try:
+            watcher.rebuild(changed)
+        except Exception:  # pylint: disable=broad-except
+            # Keep watching, the next save will probably fix it
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()